@@ -0,0 +1,282 @@
+"""Admission control for the inference endpoints
+
+A gate bounds how many requests run at once (max_in_flight) and how many may
+wait for a slot (max_queued). Anything beyond that is refused immediately
+with 503 and a Retry-After estimated from recent service times, before its
+upload is read. Queued requests give up after ADMISSION_QUEUE_TIMEOUT_MS.
+An optional per-client token bucket answers 429 instead.
+
+Each request also carries a deadline: the client's X-Request-Deadline-Ms
+budget, capped by REQUEST_DEADLINE_MS. Work checks it between stages (and
+while waiting on a micro-batch), so a request whose client has already given
+up is dropped instead of finishing a forward pass nobody will read. Limits
+are per process; with gunicorn each worker has its own gate.
+"""
+import contextvars
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from metrics import ADMISSION_IN_FLIGHT, ADMISSION_QUEUED, ADMISSION_WAIT_SECONDS, ADMISSION_REJECTED
+
+# Longest a request may wait for a slot; 0 waits until its deadline
+ADMISSION_QUEUE_TIMEOUT_MS = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT_MS', 5000))
+# Server-side cap on the time a request may take; 0 means only the client's header applies
+REQUEST_DEADLINE_MS = float(os.environ.get('REQUEST_DEADLINE_MS', 30000))
+DEADLINE_HEADER = 'X-Request-Deadline-Ms'
+
+# Per-client token bucket; 0 disables rate limiting
+RATE_LIMIT_PER_MINUTE = float(os.environ.get('RATE_LIMIT_PER_MINUTE', 0))
+RATE_LIMIT_BURST = int(os.environ.get('RATE_LIMIT_BURST', 10))
+# Header naming the client (e.g. X-Forwarded-For behind a proxy); unset uses the peer address
+RATE_LIMIT_CLIENT_HEADER = os.environ.get('RATE_LIMIT_CLIENT_HEADER', '')
+RATE_LIMIT_MAX_CLIENTS = 10000
+
+_deadline = contextvars.ContextVar('admission_deadline', default=None)
+
+
+class Rejected(Exception):
+    """A request shed by admission control; status is 429 or 503, retry_after in whole seconds"""
+
+    def __init__(self, reason, status, retry_after, message):
+        super().__init__(message)
+        self.reason = reason
+        self.status = status
+        self.retry_after = retry_after
+        self.message = message
+
+
+class DeadlineExceeded(Rejected):
+    def __init__(self, retry_after=1):
+        super().__init__('deadline', 503, retry_after, 'Request deadline exceeded')
+
+
+def request_deadline(header_value):
+    """Absolute time.monotonic() deadline from a X-Request-Deadline-Ms value and REQUEST_DEADLINE_MS, or None"""
+    budgets = [REQUEST_DEADLINE_MS] if REQUEST_DEADLINE_MS > 0 else []
+    try:
+        if header_value and float(header_value) > 0:
+            budgets.append(float(header_value))
+    except ValueError:
+        pass
+    return time.monotonic() + min(budgets) / 1000.0 if budgets else None
+
+
+def remaining():
+    """Seconds left before the current request's deadline, or None when it has none"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
+def check_deadline():
+    """Raise DeadlineExceeded when the current request's deadline has passed"""
+    if remaining() == 0.0:
+        raise DeadlineExceeded()
+
+
+def result(future):
+    """future.result() bounded by the current request's deadline; an expired wait cancels the future"""
+    try:
+        return future.result(timeout=remaining())
+    except FutureTimeoutError:
+        # A cancelled item still queued in a BatchScheduler is dropped before the forward pass
+        future.cancel()
+        raise DeadlineExceeded()
+
+
+def results(futures):
+    """result() of each future; when the deadline passes, the ones not yet started are cancelled"""
+    try:
+        return [result(future) for future in futures]
+    except DeadlineExceeded:
+        for future in futures:
+            future.cancel()
+        raise
+
+
+def coalesce(flight, key, fn):
+    """flight.do(key, fn) with a follower's wait bounded by the current request's deadline"""
+    try:
+        return flight.do(key, fn, timeout=remaining())
+    except FutureTimeoutError:
+        raise DeadlineExceeded()
+
+
+def client_key(headers, remote_addr):
+    """Rate-limit key: the RATE_LIMIT_CLIENT_HEADER value (first hop) or the peer address"""
+    if RATE_LIMIT_CLIENT_HEADER:
+        value = headers.get(RATE_LIMIT_CLIENT_HEADER)
+        if value:
+            return value.split(',')[0].strip()
+    return remote_addr or 'unknown'
+
+
+class RateLimiter:
+    """Token bucket per client: per_minute refill, up to burst requests at once"""
+
+    def __init__(self, per_minute, burst, max_clients=RATE_LIMIT_MAX_CLIENTS):
+        self.rate = per_minute / 60.0
+        self.burst = max(1, burst)
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()  # client -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def take(self, client):
+        """Spend a token for client; returns 0 when allowed, else seconds until the next token"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+            allowed = tokens >= 1
+            self._buckets[client] = (tokens - 1 if allowed else tokens, now)
+            if len(self._buckets) > self.max_clients:
+                # Least recently seen clients are forgotten, i.e. start again with a full bucket
+                self._buckets.popitem(last=False)
+        return 0 if allowed else (1 - tokens) / self.rate
+
+
+class AdmissionGate:
+    """Bounded in-flight and queued request counts in front of an inference path"""
+
+    def __init__(self, name, max_in_flight, max_queued, queue_timeout_ms=ADMISSION_QUEUE_TIMEOUT_MS,
+                 rate_limit_per_minute=RATE_LIMIT_PER_MINUTE, rate_limit_burst=RATE_LIMIT_BURST):
+        self.name = name
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.max_queued = max(0, int(max_queued))
+        self.queue_timeout = max(0.0, float(queue_timeout_ms)) / 1000.0
+        self.rate_limiter = RateLimiter(rate_limit_per_minute, rate_limit_burst) if rate_limit_per_minute > 0 else None
+        self.in_flight = 0
+        self.queued = 0
+        self.rejected = {}
+        self._service_seconds = None  # moving average, for Retry-After
+        self._condition = threading.Condition()
+
+    def _publish(self):
+        ADMISSION_IN_FLIGHT.labels(self.name).set(self.in_flight)
+        ADMISSION_QUEUED.labels(self.name).set(self.queued)
+
+    def _retry_after(self):
+        """Seconds until a slot is likely free: the queue ahead drained at the recent service rate"""
+        if not self._service_seconds:
+            return 1
+        return max(1, math.ceil(self._service_seconds * (self.queued + 1) / self.max_in_flight))
+
+    def _reject(self, error):
+        with self._condition:
+            self.rejected[error.reason] = self.rejected.get(error.reason, 0) + 1
+        ADMISSION_REJECTED.labels(self.name, error.reason).inc()
+        return error
+
+    def reserve(self, client=None):
+        """Take a queue place without blocking or raise Rejected; returns the time it was taken"""
+        if self.rate_limiter is not None and client is not None:
+            wait = self.rate_limiter.take(client)
+            if wait:
+                raise self._reject(Rejected('rate_limited', 429, max(1, math.ceil(wait)), 'Rate limit exceeded'))
+        with self._condition:
+            if self.in_flight + self.queued >= self.max_in_flight + self.max_queued:
+                error = Rejected('queue_full', 503, self._retry_after(), 'Server is busy, retry later')
+            else:
+                self.queued += 1
+                self._publish()
+                return time.monotonic()
+        raise self._reject(error)
+
+    def unreserve(self):
+        """Give back a reserve() place that will not be start()ed"""
+        with self._condition:
+            self.queued -= 1
+            self._publish()
+            self._condition.notify()
+
+    def start(self, reserved_at, deadline=None):
+        """Wait for a slot for a reserved place, giving up at the queue timeout or the deadline"""
+        limit = deadline
+        if self.queue_timeout > 0:
+            limit = reserved_at + self.queue_timeout if limit is None else min(limit, reserved_at + self.queue_timeout)
+        with self._condition:
+            while self.in_flight >= self.max_in_flight:
+                wait = None if limit is None else limit - time.monotonic()
+                if wait is not None and wait <= 0:
+                    break
+                self._condition.wait(wait)
+            self.queued -= 1
+            now = time.monotonic()
+            if self.in_flight < self.max_in_flight and (deadline is None or now < deadline):
+                self.in_flight += 1
+                self._publish()
+                ADMISSION_WAIT_SECONDS.labels(self.name).observe(now - reserved_at)
+                return now
+            self._publish()
+            if deadline is not None and now >= deadline:
+                error = DeadlineExceeded(self._retry_after())
+            else:
+                error = Rejected('queue_timeout', 503, self._retry_after(), 'Server is busy, retry later')
+        raise self._reject(error)
+
+    def finish(self, started_at):
+        """Free the slot taken by start()"""
+        elapsed = time.monotonic() - started_at
+        with self._condition:
+            self.in_flight -= 1
+            self._service_seconds = elapsed if self._service_seconds is None else 0.8 * self._service_seconds + 0.2 * elapsed
+            self._publish()
+            self._condition.notify()
+
+    @contextmanager
+    def running(self, reserved_at, deadline=None):
+        """start() ... finish() around a block, with the deadline visible to remaining()/check_deadline()"""
+        started_at = self.start(reserved_at, deadline)
+        token = _deadline.set(deadline)
+        try:
+            yield
+        except DeadlineExceeded as e:
+            raise self._reject(e)
+        finally:
+            _deadline.reset(token)
+            self.finish(started_at)
+
+    def admit(self, client=None, deadline=None):
+        """reserve() and running() for callers that can block while queued (WSGI worker threads)"""
+        return self.running(self.reserve(client), deadline)
+
+    def stats(self):
+        with self._condition:
+            return {
+                'inFlight': self.in_flight,
+                'queued': self.queued,
+                'maxInFlight': self.max_in_flight,
+                'maxQueued': self.max_queued,
+                'rejected': dict(self.rejected)
+            }
+
+
+def flask_admit(gate):
+    """gate.admit() for the current Flask request: client from its headers, deadline from X-Request-Deadline-Ms"""
+    from flask import request
+    return gate.admit(client_key(request.headers, request.remote_addr), request_deadline(request.headers.get(DEADLINE_HEADER)))
+
+
+def flask_admit_stream(gate):
+    """Admission for a streamed Flask response; returns a release() to call once the stream is closed
+
+    Waits for a slot like flask_admit (raising Rejected), but the slot stays
+    taken after the handler returns, because a streamed body keeps running
+    inference. The deadline bounds the wait for a slot; once streaming, the
+    work stops when the client disconnects.
+    """
+    from flask import request
+    reserved_at = gate.reserve(client_key(request.headers, request.remote_addr))
+    started_at = gate.start(reserved_at, request_deadline(request.headers.get(DEADLINE_HEADER)))
+    return lambda: gate.finish(started_at)
+
+
+def flask_rejection(error):
+    """Flask response for a Rejected request"""
+    from flask import jsonify
+    return jsonify({'error': error.message, 'reason': error.reason}), error.status, {'Retry-After': str(error.retry_after)}
@@ -1,8 +1,9 @@
 #.\.venv\Scripts\activate
 
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
 import os
 import base64
 import io
@@ -10,20 +11,120 @@ from PIL import Image
 import numpy as np
 import torch
 import torch.nn as nn
-from torchvision import transforms
-from efficientnet_pytorch import EfficientNet
 import cv2
 from datetime import datetime
 import json
 import requests
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections import deque
+from queue import Queue, Empty, Full
+import threading
+from batching import BatchScheduler
+from admission import AdmissionGate
+from singleflight import SingleFlight
+import tuning
+from image_io import read_image_upload, decode_rgb_array, decode_base64_image, UploadTooLarge, InvalidUpload, upload_limit_message
+from video_io import save_video_upload, open_video, sample_frames, DuplicateFilter, remove_quietly
+from tensor_pool import TensorPool
+from feature_cache import FeatureCache
+from inference_backends import create_backend, load_efficientnet
+from startup import ModelLoader
+from model_registry import tensor_bytes
+from history_store import HistoryStore, UnknownPlant
+from perenual import build_plant_info
+from plant_index import PlantIndex, PLANT_INDEX_PATH
+from vector_index import VectorIndex
+import perenual
+import admission
+import metrics
+from metrics import stage_timer
 
 app = Flask(__name__)
 CORS(app)
+metrics.instrument_flask(app, 'plant')
 
 # Global variables for model
 model = None
 device = None
-transform = None
+normalize_mean = None
+normalize_std = None
+batcher = None
+inference_backend = None
+
+# Inference backend: eager PyTorch, or a TorchScript/ONNX graph written by export_model.py
+INFERENCE_BACKEND = os.environ.get('INFERENCE_BACKEND', 'eager')
+MODEL_EXPORT_DIR = os.environ.get('MODEL_EXPORT_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models'))
+MODEL_WEIGHTS_DIR = os.environ.get('MODEL_WEIGHTS_DIR') or None
+
+# Micro-batching for concurrent /analyze requests (default from benchmarks/tune.py when it has run)
+BATCH_MAX_SIZE = int(os.environ.get('BATCH_MAX_SIZE', tuning.setting('plant', 'batchMaxSize', 8)))
+BATCH_MAX_WAIT_MS = float(os.environ.get('BATCH_MAX_WAIT_MS', 5))
+
+# Warm-up forward passes run at each serving batch size before /ready turns true
+WARMUP_ITERATIONS = int(os.environ.get('WARMUP_ITERATIONS', 2))
+WARMUP_BATCH_SIZES = [int(size) for size in os.environ.get('WARMUP_BATCH_SIZES', f'1,{BATCH_MAX_SIZE}').split(',') if size.strip()]
+
+# /analyze-batch: decode pool size and maximum items per request
+BATCH_DECODE_WORKERS = int(os.environ.get('BATCH_DECODE_WORKERS', BATCH_MAX_SIZE))
+BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', 200))
+BATCH_MAX_MB = float(os.environ.get('BATCH_MAX_MB', 200))
+decode_executor = ThreadPoolExecutor(max_workers=BATCH_DECODE_WORKERS, thread_name_prefix='decode')
+
+# /analyze-video: upload cap, sampling interval and frame cap, near-duplicate thresholds, decoder read-ahead
+VIDEO_MAX_MB = float(os.environ.get('VIDEO_MAX_MB', 200))
+VIDEO_SAMPLE_SECONDS = float(os.environ.get('VIDEO_SAMPLE_SECONDS', 1.0))
+VIDEO_MAX_FRAMES = int(os.environ.get('VIDEO_MAX_FRAMES', 600))
+VIDEO_DHASH_DISTANCE = int(os.environ.get('VIDEO_DHASH_DISTANCE', 6))
+VIDEO_HISTOGRAM_DISTANCE = float(os.environ.get('VIDEO_HISTOGRAM_DISTANCE', 0.1))
+VIDEO_READ_AHEAD = int(os.environ.get('VIDEO_READ_AHEAD', BATCH_MAX_SIZE * 2))
+VIDEO_TMP_DIR = os.environ.get('VIDEO_TMP_DIR') or None
+
+# Admission control for /analyze and /similar: requests running at once, and waiting beyond that, per process
+ANALYZE_MAX_IN_FLIGHT = int(os.environ.get('ANALYZE_MAX_IN_FLIGHT', BATCH_MAX_SIZE))
+ANALYZE_MAX_QUEUED = int(os.environ.get('ANALYZE_MAX_QUEUED', BATCH_MAX_SIZE * 4))
+inference_gate = AdmissionGate('analyze', ANALYZE_MAX_IN_FLIGHT, ANALYZE_MAX_QUEUED)
+
+# Identical /analyze requests in flight at once (double-submits) share one analysis;
+# a leader shed by its own deadline or queue limit hands the work to a follower
+analysis_flight = SingleFlight('analyze', private_errors=(admission.Rejected,))
+
+# Cache of pooled features keyed on image digest + model identity
+MODEL_ID = 'efficientnet-b0'
+MODEL_INPUT_SIZE = (224, 224)
+feature_cache = FeatureCache(
+    max_bytes=int(float(os.environ.get('FEATURE_CACHE_MAX_MB', 64)) * 1024 * 1024),
+    disk_dir=os.environ.get('FEATURE_CACHE_DIR') or None
+)
+metrics.register_cache('features', feature_cache.stats)
+
+# Reused model inputs: per-image tensors (one batch being filled while the previous one runs) and batch buffers
+INPUT_POOL_SIZE = int(os.environ.get('INPUT_POOL_SIZE', BATCH_MAX_SIZE * 2))
+input_pool = TensorPool((1, 3, *MODEL_INPUT_SIZE), INPUT_POOL_SIZE)
+batch_pool = TensorPool((BATCH_MAX_SIZE, 3, *MODEL_INPUT_SIZE), 1 if INPUT_POOL_SIZE else 0)
+metrics.register_cache('input_tensors', input_pool.stats)
+
+# Per-plant analysis history (append-only, memory-mapped); set HISTORY_DIR to an empty string to disable
+HISTORY_DIR = os.environ.get('HISTORY_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'history'))
+history_store = HistoryStore(HISTORY_DIR) if HISTORY_DIR else None
+HISTORY_MAX_LIMIT = 500
+
+# Labelled feature vectors of past analyses for /similar; set VECTOR_INDEX_DIR to an empty string to disable
+VECTOR_INDEX_DIR = os.environ.get('VECTOR_INDEX_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'vector_index'))
+vector_index = VectorIndex(
+    VECTOR_INDEX_DIR,
+    nprobe=int(os.environ.get('VECTOR_INDEX_NPROBE', 16)),
+    rerank=int(os.environ.get('VECTOR_INDEX_RERANK', 200)),
+    ivf_min_vectors=int(os.environ.get('VECTOR_INDEX_IVF_MIN', 20000)),
+    flat_cache_bytes=int(float(os.environ.get('VECTOR_INDEX_FLAT_CACHE_MB', 256)) * 1024 * 1024)
+) if VECTOR_INDEX_DIR else None
+SIMILAR_MAX_K = 50
+# Label fields /similar returns; the index is shared by every caller, so nothing identifying a user or plant
+SIMILAR_LABEL_FIELDS = ('plantType', 'stage', 'health', 'overallHealth', 'issues', 'daysSincePlanting', 'analysisDate')
+
+# Local plant dictionary built by `plant_index.py import`; 'auto' answers from it and asks Perenual only on a miss
+PLANT_SEARCH_SOURCE = os.environ.get('PLANT_SEARCH_SOURCE', 'auto')
+plant_index = PlantIndex(PLANT_INDEX_PATH)
+metrics.register_cache('plant_index', plant_index.stats)
 
 # Plant growth stages
 PLANT_STAGES = {
@@ -69,64 +170,125 @@ DISEASE_PATTERNS = {
 
 def load_model():
     """Load EfficientNet model"""
-    global model, device, transform
+    global model, device, normalize_mean, normalize_std, batcher, inference_backend, MODEL_ID
     
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
     print(f"Using device: {device}")
     
-    # Load pre-trained EfficientNet
-    model = EfficientNet.from_pretrained('efficientnet-b0')
-    model.eval()
-    model.to(device)
+    if INFERENCE_BACKEND == 'eager':
+        # Load pre-trained EfficientNet (from the local weight store when configured)
+        model = load_efficientnet(MODEL_WEIGHTS_DIR)
+        model.eval()
+        model.to(device)
+    
+    # Exported backends run the graph written by export_model.py and need no eager model
+    inference_backend = create_backend(INFERENCE_BACKEND, device, MODEL_EXPORT_DIR, model=model)
+    MODEL_ID = f"efficientnet-b0/{inference_backend.name}"
+    print(f"Inference backend: {inference_backend.name}")
     
-    # Define image transformations
-    transform = transforms.Compose([
-        transforms.Resize((224, 224)),
-        transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-    ])
+    # ImageNet normalization, applied in place to pooled input tensors
+    normalize_mean = torch.tensor([0.485, 0.456, 0.406], device=device).view(1, 3, 1, 1)
+    normalize_std = torch.tensor([0.229, 0.224, 0.225], device=device).view(1, 3, 1, 1)
+    input_pool.fill(device)
+    batch_pool.fill(device)
+    
+    # Requests arriving within a few milliseconds share one forward pass
+    batcher = BatchScheduler(extract_features_batch, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS, name='efficientnet-batcher')
     
     print("EfficientNet model loaded successfully!")
 
+def warm_up_model():
+    """Run forward passes at the serving batch sizes so the first request skips lazy initialization"""
+    for batch_size in WARMUP_BATCH_SIZES:
+        dummy = torch.zeros(batch_size, 3, *MODEL_INPUT_SIZE)
+        for _ in range(WARMUP_ITERATIONS):
+            inference_backend(dummy)
+
+def unload_model():
+    """Drop the model and its batcher so the memory can be reclaimed (combined mode eviction)"""
+    global model, batcher, inference_backend
+    if batcher is not None:
+        batcher.close()
+    model = None
+    batcher = None
+    inference_backend = None
+    input_pool.clear()
+    batch_pool.clear()
+    print("EfficientNet model unloaded")
+
+def model_footprint():
+    """Bytes of eager model weights, or None for exported backends"""
+    return tensor_bytes(model) if model is not None else None
+
+model_loader = ModelLoader('EfficientNet', load_model, warm_up_model)
+
+def to_input_tensor(rgb):
+    """Normalized 1x3xHxW model input from an RGB uint8 array at MODEL_INPUT_SIZE, in a tensor from input_pool"""
+    tensor = input_pool.acquire()
+    # Same arithmetic as ToTensor + Normalize, without allocating intermediates
+    tensor.copy_(torch.from_numpy(rgb).permute(2, 0, 1).unsqueeze(0))
+    return tensor.div_(255).sub_(normalize_mean).div_(normalize_std)
+
 def preprocess_image(image_data):
-    """Preprocess image for EfficientNet"""
+    """Preprocess image for EfficientNet; returns a pooled input tensor or None"""
     try:
-        # Check if model and transform are loaded
-        if transform is None or device is None:
-            print("Model or transform not loaded")
-            return None, None
-            
-        # Decode base64 image
-        if ',' in image_data:
-            image_data = image_data.split(',')[1]
-        
-        image_bytes = base64.b64decode(image_data)
-        image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
+        # Check if model is loaded
+        if normalize_mean is None or device is None:
+            print("Model not loaded")
+            return None
         
-        # Apply transformations
-        tensor = transform(image)  # This returns a torch.Tensor
-        image_tensor = tensor.unsqueeze(0).to(device)
+        # Decode raw image bytes (or a legacy base64 data URL) at reduced JPEG scale, straight to 224x224;
+        # pixel-count limits are checked on the header before anything is decoded
+        with stage_timer('decode'):
+            rgb = decode_rgb_array(image_data, MODEL_INPUT_SIZE)
         
-        return image_tensor, image
+        with stage_timer('transform'):
+            return to_input_tensor(rgb)
+    except UploadTooLarge:
+        raise
     except Exception as e:
         print(f"Error preprocessing image: {e}")
-        return None, None
+        return None
+
+def preprocess_frame(rgb):
+    """Model input tensor for an RGB uint8 video frame already at MODEL_INPUT_SIZE"""
+    with stage_timer('transform'):
+        return to_input_tensor(rgb)
+
+def extract_features_batch(image_tensors):
+    """Extract pooled features for a list of preprocessed image tensors in one forward pass"""
+    # Stack into a reused batch buffer; larger batches (benchmarks) get a fresh one
+    buffer = batch_pool.acquire() if len(image_tensors) <= BATCH_MAX_SIZE else None
+    try:
+        if buffer is None:
+            batch = torch.cat(image_tensors, dim=0)
+        else:
+            batch = torch.cat(image_tensors, dim=0, out=buffer[:len(image_tensors)])
+        # Features from the last layer before classification, globally average pooled
+        features = inference_backend(batch)
+    finally:
+        batch_pool.release(buffer)
+    return list(features)
+
+def submit_features(image_tensor):
+    """Queue a pooled input tensor on the batcher; it goes back to input_pool once the batcher is done with it"""
+    future = batcher.submit(image_tensor)
+    # Runs after the forward pass, on failure, or when a cancelled item is dropped unread
+    future.add_done_callback(lambda _: input_pool.release(image_tensor))
+    return future
 
 def extract_features(image_tensor):
     """Extract features using EfficientNet"""
     try:
         # Check if model is loaded
-        if model is None:
+        if inference_backend is None or batcher is None:
             print("Model not loaded")
             return None
-            
-        with torch.no_grad():
-            # Get features from the last layer before classification
-            features = model.extract_features(image_tensor)
-            # Global average pooling
-            features = torch.nn.functional.adaptive_avg_pool2d(features, 1)
-            features = features.squeeze().cpu().numpy()
-            return features
+        
+        # Queue behind the batcher so concurrent requests share a forward pass; gives up at the request deadline
+        return admission.result(submit_features(image_tensor))
+    except admission.Rejected:
+        raise
     except Exception as e:
         print(f"Error extracting features: {e}")
         return None
@@ -376,200 +538,646 @@ def health_check():
     """Health check endpoint"""
     return jsonify({
         'status': 'healthy',
-        'model_loaded': model is not None,
-        'device': str(device) if device else None
+        'model_loaded': inference_backend is not None,
+        'model_state': model_loader.state,
+        'device': str(device) if device else None,
+        'backend': inference_backend.name if inference_backend else None,
+        'feature_cache': feature_cache.stats(),
+        'perenual_cache': perenual.cache_stats(),
+        'admission': inference_gate.stats(),
+        'coalescing': analysis_flight.stats(),
+        'input_pool': input_pool.stats()
     })
 
+def get_image_features(image_data):
+    """Return (features, error) for raw image bytes, using the feature cache when possible"""
+    # Re-submitted photos skip decode and the forward pass entirely
+    cache_key = FeatureCache.make_key(image_data, MODEL_ID)
+    features = feature_cache.get(cache_key)
+    if features is not None:
+        return features, None
+    
+    # Preprocess image (unless the client has given up while this request was queued)
+    admission.check_deadline()
+    image_tensor = preprocess_image(image_data)
+    if image_tensor is None:
+        return None, 'Failed to process image'
+    
+    # Extract features using EfficientNet (timing includes the micro-batch wait)
+    with stage_timer('extract_features'):
+        features = extract_features(image_tensor)
+    if features is None:
+        return None, 'Failed to extract features'
+    feature_cache.put(cache_key, features)
+    return features, None
+
+def build_analysis_result(features, plant_type, days_since_planting):
+    """Return (result, error) by running the rule-based analysis chain on extracted features"""
+    # Analyze plant health
+    health_analysis = analyze_plant_health(features, plant_type)
+    if health_analysis is None:
+        return None, 'Failed to analyze plant health'
+    
+    # Determine growth stage
+    growth_stage = determine_growth_stage(plant_type, days_since_planting, health_analysis)
+    if growth_stage is None:
+        return None, 'Failed to determine growth stage'
+    
+    # Detect anomalies
+    anomalies = detect_anomalies(health_analysis, plant_type)
+    
+    # Generate recommendations
+    recommendations = generate_recommendations(growth_stage, anomalies, plant_type)
+    
+    # Determine overall health
+    if anomalies['detected'] and any(issue['severity'] == 'high' for issue in anomalies['issues']):
+        overall_health = 'poor'
+    elif anomalies['detected']:
+        overall_health = 'fair'
+    elif growth_stage['health'] == 'excellent':
+        overall_health = 'excellent'
+    else:
+        overall_health = 'good'
+    
+    # Prepare response
+    result = {
+        'growthAssessment': {
+            'stage': growth_stage['stage'],
+            'health': growth_stage['health'],
+            'confidence': float(growth_stage['confidence']),
+            'description': generate_stage_description(plant_type, growth_stage, days_since_planting),
+            'nextStage': growth_stage['nextStage'],
+            'estimatedDays': growth_stage['estimatedDays'],
+            'currentStageIndex': growth_stage['currentStageIndex'],
+            'totalStages': growth_stage['totalStages'],
+            'progressPercentage': calculate_progress_percentage(growth_stage['currentStageIndex'], growth_stage['totalStages'])
+        },
+        'anomalies': anomalies,
+        'overallHealth': overall_health,
+        'recommendations': recommendations,
+        'analysisDate': datetime.now().isoformat(),
+        'modelUsed': 'EfficientNet-B0',
+        'confidence': float(growth_stage['confidence'])
+    }
+    return result, None
+
+def record_history(plant_id, features, result, plant_type, days_since_planting):
+    """Append an analysis to the plant's history; returns the history length or None"""
+    if history_store is None or not plant_id:
+        return None
+    try:
+        with stage_timer('history_append'):
+            return history_store.append(plant_id, features, result, plant_type, days_since_planting)
+    except UnknownPlant:
+        # Deleted while this analysis ran; the history stays deleted
+        print(f"Not recording history for deleted plant {plant_id}")
+        return None
+    except Exception as e:
+        # History is best effort - the analysis itself already succeeded
+        print(f"Error recording history for plant {plant_id}: {e}")
+        return None
+
+def index_case(features, result, plant_type, days_since_planting):
+    """Add an analysed photo's features and outcome to the similar-cases index (no plant id: it is shared)"""
+    if vector_index is None:
+        return
+    label = {
+        'plantType': plant_type,
+        'stage': result['growthAssessment']['stage'],
+        'health': result['growthAssessment']['health'],
+        'overallHealth': result['overallHealth'],
+        'issues': [issue['type'] for issue in result['anomalies'].get('issues', [])],
+        'daysSincePlanting': days_since_planting,
+        'analysisDate': result['analysisDate']
+    }
+    try:
+        with stage_timer('vector_index_add'):
+            vector_index.add([features], [label], keys=[VectorIndex.vector_key(features)])
+    except Exception as e:
+        print(f"Error adding features to the vector index: {e}")
+
+def record_analysis(plant_id, features, result, plant_type, days_since_planting):
+    """Keep a finished analysis: plant history (when plant_id is set) and the similar-cases index"""
+    index_case(features, result, plant_type, days_since_planting)
+    history_count = record_history(plant_id, features, result, plant_type, days_since_planting)
+    if history_count is not None:
+        result['historyCount'] = history_count
+    return result
+
+def analysis_key(image_data, plant_type, planted_date, plant_id):
+    """Coalescing key for /analyze: image digest plus the fields that change the result or where it is recorded"""
+    return (FeatureCache.make_key(image_data, MODEL_ID), plant_type, planted_date, plant_id or None)
+
+def analyze_image(image_data, plant_type, days_since_planting, plant_id=None):
+    """Return (result, error) for one photo: features, rule-based analysis, history and index"""
+    features, error = get_image_features(image_data)
+    if error:
+        return None, error
+    
+    with stage_timer('analysis'):
+        result, error = build_analysis_result(features, plant_type, days_since_planting)
+    if error:
+        return None, error
+    
+    # Similar-cases index, plus the plant's timeline and trends when a plantId was sent
+    return record_analysis(plant_id, features, result, plant_type, days_since_planting), None
+
+def invalid_plant_id(plant_id):
+    """True when an optional plantId was given but is not one issued by POST /plants"""
+    if plant_id is None or plant_id == '':
+        return False
+    if not HistoryStore.valid_plant_id(str(plant_id)):
+        return True
+    return history_store is not None and not history_store.exists(str(plant_id))
+
+def days_since(planted_date):
+    """Calculate days since planting from a YYYY-MM-DD date"""
+    planted_datetime = datetime.strptime(planted_date, '%Y-%m-%d')
+    return (datetime.now() - planted_datetime).days
+
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """Readiness endpoint - 200 only once the model is loaded and warmed up"""
+    return jsonify(model_loader.status()), 200 if model_loader.ready else 503
+
 @app.route('/analyze', methods=['POST'])
 def analyze_plant():
     """Analyze plant image using EfficientNet"""
     try:
-        data = request.get_json()
+        if inference_backend is None:
+            return jsonify({'error': 'Model is still loading'}), 503
         
-        if not data or 'image' not in data or 'plantType' not in data or 'plantedDate' not in data:
-            return jsonify({'error': 'Missing required fields'}), 400
+        # Shed load before the upload is read, so a rejected request never holds an image
+        with admission.flask_admit(inference_gate):
+            # Accepts multipart/form-data, a raw image/* body or the legacy base64 JSON body
+            with stage_timer('read_upload'):
+                image_data, data = read_image_upload(request)
+            
+            if image_data is None or 'plantType' not in data or 'plantedDate' not in data:
+                return jsonify({'error': 'Missing required fields'}), 400
+            
+            plant_type = data['plantType']
+            planted_date = data['plantedDate']
+            plant_id = data.get('plantId')
+            if invalid_plant_id(plant_id):
+                return jsonify({'error': 'Invalid plantId'}), 400
+            
+            # Calculate days since planting
+            days_since_planting = days_since(planted_date)
+            
+            # Identical requests already in flight wait for that one's result instead of a second model pass
+            result, error = admission.coalesce(
+                analysis_flight, analysis_key(image_data, plant_type, planted_date, plant_id),
+                lambda: analyze_image(image_data, plant_type, days_since_planting, plant_id)
+            )
+            if error:
+                return jsonify({'error': error}), 400
+            
+            return jsonify(result)
         
-        image_data = data['image']
-        plant_type = data['plantType']
-        planted_date = data['plantedDate']
+    except InvalidUpload as e:
+        return jsonify({'error': str(e)}), 400
+    except UploadTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+    except admission.Rejected as e:
+        return admission.flask_rejection(e)
+    except Exception as e:
+        print(f"Error in analyze endpoint: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+def analyze_batch_item(index, item):
+    """Run the /analyze pipeline for one /analyze-batch item (runs on the decode pool)"""
+    line = {'index': index}
+    if item.get('id') is not None:
+        line['id'] = item['id']
+    try:
+        if item.get('image') is None or not item.get('plantType') or not item.get('plantedDate'):
+            line['error'] = 'Missing required fields'
+            return line
+        if invalid_plant_id(item.get('plantId')):
+            line['error'] = 'Invalid plantId'
+            return line
         
-        # Calculate days since planting
-        planted_datetime = datetime.strptime(planted_date, '%Y-%m-%d')
-        days_since_planting = (datetime.now() - planted_datetime).days
+        # Base64 strings are only decoded here, one window of items at a time
+        image_data = item['image']
+        if not isinstance(image_data, bytes):
+            image_data = decode_base64_image(image_data)
         
-        # Preprocess image
-        image_tensor, original_image = preprocess_image(image_data)
-        if image_tensor is None:
-            return jsonify({'error': 'Failed to process image'}), 400
+        days_since_planting = days_since(item['plantedDate'])
         
-        # Extract features using EfficientNet
-        features = extract_features(image_tensor)
-        if features is None:
-            return jsonify({'error': 'Failed to extract features'}), 400
-        
-        # Analyze plant health
-        health_analysis = analyze_plant_health(features, plant_type)
-        if health_analysis is None:
-            return jsonify({'error': 'Failed to analyze plant health'}), 400
-        
-        # Determine growth stage
-        growth_stage = determine_growth_stage(plant_type, days_since_planting, health_analysis)
-        if growth_stage is None:
-            return jsonify({'error': 'Failed to determine growth stage'}), 400
-        
-        # Detect anomalies
-        anomalies = detect_anomalies(health_analysis, plant_type)
-        
-        # Generate recommendations
-        recommendations = generate_recommendations(growth_stage, anomalies, plant_type)
-        
-        # Determine overall health
-        if anomalies['detected'] and any(issue['severity'] == 'high' for issue in anomalies['issues']):
-            overall_health = 'poor'
-        elif anomalies['detected']:
-            overall_health = 'fair'
-        elif growth_stage['health'] == 'excellent':
-            overall_health = 'excellent'
+        # Concurrent items meet in the batcher, so inference runs in real batches
+        features, error = get_image_features(image_data)
+        del image_data
+        if error is None:
+            with stage_timer('analysis'):
+                result, error = build_analysis_result(features, item['plantType'], days_since_planting)
+        if error:
+            line['error'] = error
         else:
-            overall_health = 'good'
-        
-        # Prepare response
-        result = {
-            'growthAssessment': {
-                'stage': growth_stage['stage'],
-                'health': growth_stage['health'],
-                'confidence': float(growth_stage['confidence']),
-                'description': generate_stage_description(plant_type, growth_stage, days_since_planting),
-                'nextStage': growth_stage['nextStage'],
-                'estimatedDays': growth_stage['estimatedDays'],
-                'currentStageIndex': growth_stage['currentStageIndex'],
-                'totalStages': growth_stage['totalStages'],
-                'progressPercentage': calculate_progress_percentage(growth_stage['currentStageIndex'], growth_stage['totalStages'])
-            },
-            'anomalies': anomalies,
-            'overallHealth': overall_health,
-            'recommendations': recommendations,
-            'analysisDate': datetime.now().isoformat(),
-            'modelUsed': 'EfficientNet-B0',
-            'confidence': float(growth_stage['confidence'])
-        }
+            line['result'] = record_analysis(item.get('plantId'), features, result, item['plantType'], days_since_planting)
+    except (InvalidUpload, UploadTooLarge) as e:
+        line['error'] = str(e)
+    except Exception as e:
+        print(f"Error analyzing batch item {index}: {e}")
+        line['error'] = 'Internal server error'
+    return line
+
+def read_batch_items(req):
+    """Read /analyze-batch items from a JSON body or a multipart bundle"""
+    if req.mimetype == 'multipart/form-data':
+        # Repeated image parts with plantType/plantedDate (and optional id/plantId) fields in the same order.
+        # Parts are read into bytes now: Werkzeug closes the uploads before the streamed response runs,
+        # and the whole body is already capped at BATCH_MAX_MB.
+        images = [upload.read() or None for upload in req.files.getlist('image')]
+        plant_types = req.form.getlist('plantType')
+        planted_dates = req.form.getlist('plantedDate')
+        ids = req.form.getlist('id')
+        plant_ids = req.form.getlist('plantId')
+        return [
+            {
+                'image': image,
+                'plantType': plant_types[i] if i < len(plant_types) else None,
+                'plantedDate': planted_dates[i] if i < len(planted_dates) else None,
+                'id': ids[i] if i < len(ids) else None,
+                'plantId': plant_ids[i] if i < len(plant_ids) else None
+            }
+            for i, image in enumerate(images)
+        ]
+    
+    data = req.get_json(silent=True)
+    if not data or not isinstance(data.get('items'), list):
+        return None
+    return [item if isinstance(item, dict) else {} for item in data['items']]
+
+def stream_batch_results(items):
+    """Yield one NDJSON line per item as soon as it finishes, keeping a bounded window in flight"""
+    window = max(1, BATCH_DECODE_WORKERS * 2)
+    pending = set()
+    next_index = 0
+    while next_index < len(items) or pending:
+        while next_index < len(items) and len(pending) < window:
+            pending.add(decode_executor.submit(analyze_batch_item, next_index, items[next_index]))
+            next_index += 1
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield json.dumps(future.result()) + '\n'
+
+@app.route('/analyze-batch', methods=['POST'])
+def analyze_batch():
+    """Analyze many plant images, streaming newline-delimited JSON results as they finish"""
+    try:
+        if inference_backend is None:
+            return jsonify({'error': 'Model is still loading'}), 503
         
-        return jsonify(result)
+        # JSON bundles are held in memory whole, so the body is capped (chunked ones as they are read)
+        max_bytes = int(BATCH_MAX_MB * 1024 * 1024)
+        if request.content_length and request.content_length > max_bytes:
+            return jsonify({'error': upload_limit_message(max_bytes, 'Batch')}), 413
+        request.max_content_length = max_bytes
+        
+        # One admission slot per batch, held until the stream closes; shed before the upload is read
+        release = admission.flask_admit_stream(inference_gate)
+        try:
+            items = read_batch_items(request)
+            if not items:
+                return jsonify({'error': 'Missing items'}), 400
+            if len(items) > BATCH_MAX_ITEMS:
+                return jsonify({'error': f'Too many items (max {BATCH_MAX_ITEMS})'}), 400
+            
+            response = Response(stream_with_context(stream_batch_results(items)), mimetype='application/x-ndjson')
+            response.call_on_close(release)
+            release = None
+            return response
+        finally:
+            if release is not None:
+                release()
         
+    except admission.Rejected as e:
+        return admission.flask_rejection(e)
+    except RequestEntityTooLarge:
+        return jsonify({'error': upload_limit_message(int(BATCH_MAX_MB * 1024 * 1024), 'Batch')}), 413
     except Exception as e:
-        print(f"Error in analyze endpoint: {e}")
+        print(f"Error in analyze-batch endpoint: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+def decode_video_frames(capture, interval, max_frames, frames, stop, stats):
+    """Decoder thread for /analyze-video: queue (index, timestamp, tensor) for frames that are not near-duplicates"""
+    duplicates = DuplicateFilter(VIDEO_DHASH_DISTANCE, VIDEO_HISTOGRAM_DISTANCE)
+    stats['framesSkipped'] = 0
+    outcome = None
+    try:
+        for index, timestamp, rgb in sample_frames(capture, interval, max_frames, MODEL_INPUT_SIZE, stats):
+            if stop.is_set():
+                break
+            with stage_timer('video_dedupe'):
+                duplicate = duplicates.is_duplicate(rgb)
+            if duplicate:
+                stats['framesSkipped'] += 1
+                continue
+            item = (index, timestamp, preprocess_frame(rgb))
+            # Bounded read-ahead: the decoder waits here while inference catches up
+            while not stop.is_set():
+                try:
+                    frames.put(item, timeout=0.5)
+                    break
+                except Full:
+                    pass
+    except Exception as e:
+        print(f"Error decoding video: {e}")
+        outcome = e
+    finally:
+        capture.release()
+        frames.put(outcome)  # None when finished, or the decode error
+
+def stream_video_results(capture, path, plant_type, days_since_planting, interval, max_frames):
+    """Yield one NDJSON line per analysed frame, in order, then a summary line
+
+    Decoding runs one frame queue ahead in its own thread while up to a
+    micro-batch of frames waits in the batcher, so decode and inference
+    overlap and at most VIDEO_READ_AHEAD + BATCH_MAX_SIZE frames are held.
+    """
+    frames = Queue(maxsize=max(1, VIDEO_READ_AHEAD))
+    stop = threading.Event()
+    stats = {'framesRead': 0, 'framesSampled': 0}
+    decoder = threading.Thread(target=decode_video_frames, name='video-decode',
+                               args=(capture, interval, max_frames, frames, stop, stats), daemon=True)
+    decoder.start()
+    pending = deque()
+    finished = False
+    analyzed = 0
+    try:
+        while True:
+            while not finished and len(pending) < BATCH_MAX_SIZE:
+                try:
+                    item = frames.get(block=not pending)
+                except Empty:
+                    break
+                if item is None or isinstance(item, Exception):
+                    finished = True
+                    if item is not None:
+                        yield json.dumps({'error': 'Failed to decode video'}) + '\n'
+                    break
+                index, timestamp, tensor = item
+                pending.append((index, timestamp, submit_features(tensor)))
+            if not pending:
+                break
+            index, timestamp, future = pending.popleft()
+            line = {'frame': index, 'timestamp': round(timestamp, 3)}
+            try:
+                with stage_timer('extract_features'):
+                    features = future.result()
+                with stage_timer('analysis'):
+                    result, error = build_analysis_result(features, plant_type, days_since_planting)
+            except Exception as e:
+                print(f"Error analyzing video frame {index}: {e}")
+                result, error = None, 'Failed to extract features'
+            if error:
+                line['error'] = error
+            else:
+                line['result'] = result
+                analyzed += 1
+            yield json.dumps(line) + '\n'
+        yield json.dumps({'summary': dict(stats, framesAnalyzed=analyzed)}) + '\n'
+    finally:
+        # Also runs when the client disconnects mid-stream
+        stop.set()
+        for _, _, future in pending:
+            future.cancel()
+        # Drain so the decoder's final put never blocks, then wait for it to release the capture
+        while decoder.is_alive():
+            try:
+                frames.get(timeout=0.1)
+            except Empty:
+                pass
+        remove_quietly(path)
+
+@app.route('/analyze-video', methods=['POST'])
+def analyze_video():
+    """Analyze sampled frames of a plant video, streaming newline-delimited JSON results in frame order"""
+    path = None
+    release = None
+    try:
+        if inference_backend is None:
+            return jsonify({'error': 'Model is still loading'}), 503
+        if request.content_length and request.content_length > VIDEO_MAX_MB * 1024 * 1024:
+            return jsonify({'error': f'Video larger than {VIDEO_MAX_MB:g} MB'}), 413
+        
+        # One admission slot per video, held until the stream closes; shed before the upload is read
+        release = admission.flask_admit_stream(inference_gate)
+        
+        # A multipart `video` part or a raw video/* body (fields in the query string), spooled to disk for OpenCV
+        with stage_timer('read_upload'):
+            path, data = save_video_upload(request, max_bytes=int(VIDEO_MAX_MB * 1024 * 1024), directory=VIDEO_TMP_DIR)
+        if path is None or not data.get('plantType') or not data.get('plantedDate'):
+            return jsonify({'error': 'Missing required fields'}), 400
+        try:
+            interval = float(data.get('interval') or request.args.get('interval') or VIDEO_SAMPLE_SECONDS)
+            max_frames = min(int(data.get('maxFrames') or request.args.get('maxFrames') or VIDEO_MAX_FRAMES), VIDEO_MAX_FRAMES)
+        except ValueError:
+            return jsonify({'error': 'interval and maxFrames must be numbers'}), 400
+        if interval <= 0 or max_frames <= 0:
+            return jsonify({'error': 'interval and maxFrames must be positive'}), 400
+        days_since_planting = days_since(data['plantedDate'])
+        
+        capture = open_video(path)
+        if capture is None:
+            return jsonify({'error': 'Unsupported or corrupt video'}), 400
+        
+        # The stream owns the capture, the temp file and the admission slot from here on
+        stream = stream_video_results(capture, path, data['plantType'], days_since_planting, interval, max_frames)
+        path = None
+        response = Response(stream_with_context(stream), mimetype='application/x-ndjson')
+        response.call_on_close(release)
+        release = None
+        return response
+        
+    except UploadTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+    except admission.Rejected as e:
+        return admission.flask_rejection(e)
+    except Exception as e:
+        print(f"Error in analyze-video endpoint: {e}")
         return jsonify({'error': 'Internal server error'}), 500
+    finally:
+        if path is not None:
+            remove_quietly(path)
+        if release is not None:
+            release()
+
+def find_similar_cases(features, k, mode):
+    """Return (response, error) with the k stored analyses closest to the features"""
+    if mode not in ('auto', 'flat', 'ivfpq'):
+        return None, 'mode must be auto, flat or ivfpq'
+    mode = vector_index.effective_mode(mode)
+    try:
+        with stage_timer('vector_search'):
+            matches = vector_index.search(features, k, mode)
+    except ValueError as e:
+        # ivfpq requested before `python vector_index.py train` has been run
+        return None, str(e)
+    labels = vector_index.labels([case_id for case_id, _ in matches])
+    # Only whitelisted fields, so entries indexed before plant ids were dropped from labels stay private too
+    results = [
+        dict({field: label.get(field) for field in SIMILAR_LABEL_FIELDS}, id=case_id, similarity=round(score, 4))
+        for (case_id, score), label in zip(matches, labels)
+    ]
+    return {'results': results, 'mode': mode, 'indexed': vector_index.stats()['count']}, None
+
+@app.route('/similar', methods=['POST'])
+def similar_cases():
+    """Stored analyses whose photos look most like the uploaded one"""
+    try:
+        if vector_index is None:
+            return jsonify({'error': 'Similar-case search is disabled'}), 404
+        if inference_backend is None:
+            return jsonify({'error': 'Model is still loading'}), 503
+        
+        with admission.flask_admit(inference_gate):
+            # Same upload formats as /analyze; k and mode come from form fields, JSON or the query string
+            with stage_timer('read_upload'):
+                image_data, data = read_image_upload(request)
+            if image_data is None:
+                return jsonify({'error': 'Missing required fields'}), 400
+            try:
+                k = min(max(int(data.get('k') or request.args.get('k', 5)), 1), SIMILAR_MAX_K)
+            except ValueError:
+                return jsonify({'error': 'k must be an integer'}), 400
+            mode = data.get('mode') or request.args.get('mode', 'auto')
+            
+            features, error = get_image_features(image_data)
+            if error:
+                return jsonify({'error': error}), 400
+            
+            response, error = find_similar_cases(features, k, mode)
+            if error:
+                return jsonify({'error': error}), 400
+            return jsonify(response)
+        
+    except InvalidUpload as e:
+        return jsonify({'error': str(e)}), 400
+    except UploadTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+    except admission.Rejected as e:
+        return admission.flask_rejection(e)
+    except Exception as e:
+        print(f"Error in similar endpoint: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+def history_unavailable(plant_id):
+    """Error response for the history endpoints, or None when the request can be served"""
+    if history_store is None:
+        return jsonify({'error': 'Analysis history is disabled'}), 404
+    if not HistoryStore.valid_plant_id(plant_id):
+        return jsonify({'error': 'Invalid plantId'}), 400
+    if not history_store.exists(plant_id):
+        return jsonify({'error': 'No history for this plant'}), 404
+    return None
+
+@app.route('/plants', methods=['POST'])
+def create_plant():
+    """Issue a plantId for a new plant's history; only ids issued here are accepted elsewhere"""
+    try:
+        if history_store is None:
+            return jsonify({'error': 'Analysis history is disabled'}), 404
+        return jsonify({'plantId': history_store.create()}), 201
+    except Exception as e:
+        print(f"Error creating plant history: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@app.route('/plants/<plant_id>/history', methods=['GET'])
+def plant_history(plant_id):
+    """Newest-first slice of a plant's analysis timeline"""
+    try:
+        unavailable = history_unavailable(plant_id)
+        if unavailable:
+            return unavailable
+        limit = min(max(request.args.get('limit', 50, type=int), 1), HISTORY_MAX_LIMIT)
+        offset = max(request.args.get('offset', 0, type=int), 0)
+        total, entries = history_store.timeline(plant_id, limit, offset)
+        return jsonify({'plantId': plant_id, 'total': total, 'offset': offset, 'entries': entries})
+    except Exception as e:
+        print(f"Error reading history for plant {plant_id}: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@app.route('/plants/<plant_id>/trends', methods=['GET'])
+def plant_trends(plant_id):
+    """Growth and health trends from the running statistics kept on append"""
+    try:
+        unavailable = history_unavailable(plant_id)
+        if unavailable:
+            return unavailable
+        trends = history_store.trends(plant_id)
+        if trends is None:
+            return jsonify({'error': 'No history for this plant'}), 404
+        trends['plantId'] = plant_id
+        stages = PLANT_STAGES.get(trends['plantType'], PLANT_STAGES['Tomato'])
+        if trends['stage']['currentIndex'] is not None and trends['stage']['currentIndex'] < len(stages):
+            trends['stage']['current'] = stages[trends['stage']['currentIndex']]
+        return jsonify(trends)
+    except Exception as e:
+        print(f"Error reading trends for plant {plant_id}: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@app.route('/plants/<plant_id>/history', methods=['DELETE'])
+def delete_plant_history(plant_id):
+    """Drop a plant's history, e.g. when the plant is removed"""
+    try:
+        unavailable = history_unavailable(plant_id)
+        if unavailable:
+            return unavailable
+        return jsonify({'plantId': plant_id, 'deleted': history_store.delete(plant_id)})
+    except Exception as e:
+        print(f"Error deleting history for plant {plant_id}: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+def search_local_plants(query):
+    """PlantInfo list from the local plant dictionary, or None when it should not answer this search"""
+    if PLANT_SEARCH_SOURCE == 'remote' or not plant_index.available:
+        return None
+    try:
+        with stage_timer('plant_index_search'):
+            return plant_index.search(query, 5)
+    except Exception as e:
+        # A broken index must not take search down; Perenual still answers
+        print(f"Error searching the local plant index: {e}")
+        return None
 
 @app.route('/plant-search', methods=['GET'])
 def plant_search():
-    """Search for plant information using Perenual API"""
+    """Search for plant information, from the local plant dictionary first and the Perenual API on a miss"""
     try:
         query = request.args.get('q', '')
         if not query:
             return jsonify({'error': 'Query parameter "q" is required'}), 400
         
-        # Perenual API endpoint
-        # You'll need to get a free API key from https://perenual.com/docs/api
-        api_key = 'sk-pGWp686120dca940011216'  # Replace with your actual API key
-        url = f"https://perenual.com/api/species-list?key={api_key}&q={query}"
-        response = requests.get(url, timeout=10)
-        print("Perenual response:", response.status_code, response.text)
-        response.raise_for_status()
+        local = search_local_plants(query)
+        if local is None and PLANT_SEARCH_SOURCE == 'local':
+            # Local-only deployments never fall through to Perenual, even without a usable index
+            return jsonify({'error': 'Local plant index is unavailable'}), 503
+        if local or (local is not None and PLANT_SEARCH_SOURCE == 'local'):
+            return jsonify({'query': query, 'results': local, 'total': len(local), 'source': 'local'})
         
-        data = response.json()
+        # Species list and details are served from TTL caches (see perenual.py); the deadline covers both
+        deadline_at = perenual.search_deadline()
+        data = perenual.fetch_species_list(query, deadline_at)
         
         if not data.get('data'):
             return jsonify({'results': [], 'total': 0})
         
         # Extract relevant plant information from Perenual API
-        plants = []
-        for plant in data['data'][:5]:  # Limit to 5 results
-            # Get detailed plant information
-            plant_id = plant.get('id')
-            if plant_id:
-                detail_url = f"https://perenual.com/api/species/details/{plant_id}?key={api_key}"
-                try:
-                    detail_response = requests.get(detail_url, timeout=10)
-                    if detail_response.status_code == 200:
-                        detail_data = detail_response.json()
-                        plant_detail = detail_data.get('result', {})
-                    else:
-                        plant_detail = {}
-                except:
-                    plant_detail = {}
-            else:
-                plant_detail = {}
-            
-            # Extract care information
-            care_info = plant_detail.get('care', {})
-            watering = care_info.get('watering', 'medium')
-            sunlight = care_info.get('sunlight', ['full'])
-            if isinstance(sunlight, list) and sunlight:
-                sunlight = sunlight[0]
-            elif not sunlight:
-                sunlight = 'full'
-            
-            # Extract growth information
-            growth_info = plant_detail.get('growth', {})
-            growth_rate = growth_info.get('growth_rate', 'medium')
-            maintenance = growth_info.get('maintenance', 'medium')
-            
-            # Extract description
-            description = plant_detail.get('description', '')
-            if not description:
-                description = f"A {plant.get('family', 'plant')} species in the {plant.get('genus', 'genus')} genus."
-            
-            # Generate care tips based on available data
-            care_tips = []
-            if watering == 'frequent':
-                care_tips.append('Water frequently to keep soil moist')
-            elif watering == 'average':
-                care_tips.append('Water when top inch of soil is dry')
-            elif watering == 'minimum':
-                care_tips.append('Water sparingly, allow soil to dry between watering')
-            
-            if 'full' in str(sunlight).lower():
-                care_tips.append('Provide full sunlight (6+ hours per day)')
-            elif 'partial' in str(sunlight).lower():
-                care_tips.append('Provide partial sunlight (3-6 hours per day)')
-            elif 'shade' in str(sunlight).lower():
-                care_tips.append('Provide shade or indirect light')
-            
-            if maintenance == 'low':
-                care_tips.append('Low maintenance plant, suitable for beginners')
-            elif maintenance == 'high':
-                care_tips.append('High maintenance plant, requires regular attention')
-            
-            care_tips.extend([
-                'Monitor for pests and diseases',
-                'Use well-draining soil',
-                'Fertilize during growing season'
-            ])
-            
-            plant_info = {
-                'id': plant.get('id'),
-                'common_name': plant.get('common_name', 'Unknown'),
-                'scientific_name': plant.get('scientific_name', ['Unknown'])[0] if isinstance(plant.get('scientific_name'), list) else plant.get('scientific_name', 'Unknown'),
-                'family': plant.get('family', 'Unknown'),
-                'genus': plant.get('genus', 'Unknown'),
-                'year': plant.get('year'),
-                'image_url': plant.get('default_image', {}).get('original_url') if plant.get('default_image') else None,
-                'description': description,
-                'care_tips': care_tips[:5],  # Limit to 5 tips
-                'sunlight': sunlight,
-                'water_needs': watering,
-                'difficulty': maintenance,
-                'growth_rate': growth_rate,
-                'growing_season': growth_info.get('season', 'Varies by climate'),
-                'max_height': growth_info.get('max_height', {}).get('cm', 'Unknown'),
-                'min_temp': growth_info.get('minimum_temperature', {}).get('celsius', 'Unknown')
-            }
-            plants.append(plant_info)
+        results = data['data'][:5]  # Limit to 5 results
+        
+        # Get detailed plant information concurrently; slow lookups fall back to list data
+        plant_ids = [plant.get('id') for plant in results if plant.get('id')]
+        details = perenual.fetch_species_details_many(plant_ids, deadline_at)
+        
+        plants = [build_plant_info(plant, details.get(plant.get('id'), {})) for plant in results]
         
         return jsonify({
             'query': query,
             'results': plants,
-            'total': len(plants)
+            'total': len(plants),
+            'source': 'perenual'
         })
         
     except requests.RequestException as e:
@@ -580,7 +1188,9 @@ def plant_search():
         return jsonify({'error': 'Internal server error'}), 500
 
 if __name__ == '__main__':
-    print("Loading EfficientNet model...")
-    load_model()
+    tuning.apply('plant')
+    # Load and warm up in the background so /health answers immediately; /ready flips when done
+    print("Loading EfficientNet model in the background...")
+    model_loader.start()
     print("Starting Flask server...")
     app.run(debug=True, host='0.0.0.0', port=5000) 
\ No newline at end of file
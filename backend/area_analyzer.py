@@ -1,16 +1,54 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 import os
-import base64
-import io
-from PIL import Image
 import numpy as np
 import torch
 import torch.nn as nn
 import cv2
+from concurrent.futures import ThreadPoolExecutor
+from image_io import read_image_upload, decode_image_array, decode_image_bgr_bounded, UploadTooLarge, InvalidUpload
+from startup import ModelLoader
+from batching import BatchScheduler
+from admission import AdmissionGate
+import tuning
+from model_registry import tensor_bytes
+import admission
+import metrics
+from metrics import stage_timer
 
 app = Flask(__name__)
 CORS(app)
+metrics.instrument_flask(app, 'area')
+
+# Green hue band used for HSV vegetation masking
+LOWER_GREEN = np.array([35, 20, 20])
+UPPER_GREEN = np.array([85, 255, 255])
+
+# Area analysis modes selectable per request
+AREA_MODES = ('hsv', 'tiled', 'unet')
+
+# Tiled mode: full-resolution masking in fixed-size tiles (decode capped at AREA_TILED_MAX_PIXELS)
+AREA_TILE_SIZE = int(os.environ.get('AREA_TILE_SIZE', 512))
+AREA_TILE_OVERLAP = int(os.environ.get('AREA_TILE_OVERLAP', 8))
+AREA_TILED_MAX_PIXELS = int(os.environ.get('AREA_TILED_MAX_PIXELS', 4096 * 4096))
+AREA_TILE_WORKERS = int(os.environ.get('AREA_TILE_WORKERS', os.cpu_count() or 1))
+SPECKLE_KERNEL = np.ones((3, 3), np.uint8)
+tile_executor = ThreadPoolExecutor(max_workers=AREA_TILE_WORKERS, thread_name_prefix='area-tile')
+
+# U-Net mode: coarse pass on the whole image, full-resolution pass only on uncertain tiles
+UNET_WEIGHTS_PATH = os.environ.get('UNET_WEIGHTS_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'unet.pth'))
+UNET_TILE_SIZE = int(os.environ.get('UNET_TILE_SIZE', 128))
+UNET_MAX_PIXELS = int(os.environ.get('UNET_MAX_PIXELS', 1024 * 1024))
+UNET_UNCERTAIN_LOW = float(os.environ.get('UNET_UNCERTAIN_LOW', 0.3))
+UNET_UNCERTAIN_HIGH = float(os.environ.get('UNET_UNCERTAIN_HIGH', 0.7))
+UNET_REFINE_MIN_FRACTION = float(os.environ.get('UNET_REFINE_MIN_FRACTION', 0.02))
+UNET_BATCH_MAX_SIZE = int(os.environ.get('UNET_BATCH_MAX_SIZE', tuning.setting('area', 'batchMaxSize', 16)))
+UNET_BATCH_MAX_WAIT_MS = float(os.environ.get('UNET_BATCH_MAX_WAIT_MS', 5))
+
+# Admission control for /analyze-area: requests running at once, and waiting beyond that, per process
+AREA_MAX_IN_FLIGHT = int(os.environ.get('AREA_MAX_IN_FLIGHT', os.cpu_count() or 1))
+AREA_MAX_QUEUED = int(os.environ.get('AREA_MAX_QUEUED', AREA_MAX_IN_FLIGHT * 4))
+area_gate = AdmissionGate('analyze-area', AREA_MAX_IN_FLIGHT, AREA_MAX_QUEUED)
 
 # Simple U-Net-like model for area segmentation
 class SimpleUNet(nn.Module):
@@ -36,87 +74,247 @@ class SimpleUNet(nn.Module):
         return x
 
 model = None
+unet_batcher = None
+weights_loaded = False
 device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 
 def load_model():
-    global model
+    global model, unet_batcher, weights_loaded
     model = SimpleUNet()
+    if os.path.exists(UNET_WEIGHTS_PATH):
+        model.load_state_dict(torch.load(UNET_WEIGHTS_PATH, map_location='cpu'))
+        weights_loaded = True
+        print(f"Loaded U-Net weights from {UNET_WEIGHTS_PATH}")
+    else:
+        print(f"No U-Net weights at {UNET_WEIGHTS_PATH} - mode=unet requests will fall back to hsv")
     model.eval()
     model.to(device)
+    
+    # Coarse passes and refinement tiles from all requests share forward passes
+    unet_batcher = BatchScheduler(run_unet_batch, UNET_BATCH_MAX_SIZE, UNET_BATCH_MAX_WAIT_MS, name='unet-batcher')
     print("U-Net model loaded")
 
-def analyze_area(image_data):
+def run_unet_batch(tiles):
+    """Segment a list of 3xTxT tensors in one forward pass, returning TxT probability maps"""
+    with torch.no_grad():
+        batch = torch.stack(tiles).to(device)
+        return list(model(batch)[:, 0].cpu().numpy())
+
+def warm_up_model():
+    """Run a few forward passes so the first request skips lazy initialization"""
+    with torch.no_grad():
+        for batch_size in (1, UNET_BATCH_MAX_SIZE):
+            dummy = torch.zeros(batch_size, 3, UNET_TILE_SIZE, UNET_TILE_SIZE, device=device)
+            for _ in range(int(os.environ.get('WARMUP_ITERATIONS', 2))):
+                model(dummy)
+
+def unload_model():
+    """Drop the U-Net and its batcher so the memory can be reclaimed (combined mode eviction)"""
+    global model, unet_batcher, weights_loaded
+    if unet_batcher is not None:
+        unet_batcher.close()
+    model = None
+    unet_batcher = None
+    weights_loaded = False
+    print("U-Net model unloaded")
+
+def model_footprint():
+    return tensor_bytes(model) if model is not None else None
+
+model_loader = ModelLoader('U-Net', load_model, warm_up_model)
+
+def summarize_area(area_percentage):
+    """Build the /analyze-area response from the percentage of green (plantable) pixels"""
+    # Calculate usable area
+    usable_area = area_percentage * 0.8  # Assume 80% is usable
+    
+    # Simple recommendations based on area
+    if usable_area > 70:
+        recommendation = "Large area - Plant in rows with 2-3 feet spacing"
+    elif usable_area > 40:
+        recommendation = "Medium area - Use square foot gardening method"
+    else:
+        recommendation = "Small area - Focus on vertical gardening and containers"
+    
+    return {
+        'totalArea': round(area_percentage, 1),
+        'usableArea': round(usable_area, 1),
+        'recommendation': recommendation,
+        'plantingMethod': 'rows' if usable_area > 50 else 'square_foot',
+        'estimatedPlants': int(usable_area / 4)  # Rough estimate
+    }
+
+def hsv_area_percentage(image_data):
+    """Green area percentage from HSV thresholding of a 256x256 downscale"""
+    # Decode at reduced JPEG scale straight to a 256x256 uint8 (0-255) RGB array
+    with stage_timer('area_decode'):
+        image_array = decode_image_array(image_data, (256, 256))
+    
+    # Use uint8 image for OpenCV color conversion
+    with stage_timer('area_hsv'):
+        hsv = cv2.cvtColor(image_array, cv2.COLOR_RGB2HSV)
+        green_mask = cv2.inRange(hsv, LOWER_GREEN, UPPER_GREEN)
+        return np.sum(green_mask > 0) / (256 * 256) * 100
+
+def count_tile_green(image, x, y, width, height):
+    """Count green pixels in one tile, filtering over an overlap margin so seams match"""
+    image_height, image_width = image.shape[:2]
+    x0 = max(0, x - AREA_TILE_OVERLAP)
+    y0 = max(0, y - AREA_TILE_OVERLAP)
+    x1 = min(image_width, x + width + AREA_TILE_OVERLAP)
+    y1 = min(image_height, y + height + AREA_TILE_OVERLAP)
+    
+    hsv = cv2.cvtColor(image[y0:y1, x0:x1], cv2.COLOR_BGR2HSV)
+    green_mask = cv2.inRange(hsv, LOWER_GREEN, UPPER_GREEN)
+    # Remove single-pixel speckle that only shows up at full resolution
+    green_mask = cv2.morphologyEx(green_mask, cv2.MORPH_OPEN, SPECKLE_KERNEL)
+    
+    # Only the tile core counts, so overlapping margins are never counted twice
+    core = green_mask[y - y0:y - y0 + height, x - x0:x - x0 + width]
+    return int(np.count_nonzero(core))
+
+def tiled_area_percentage(image_data):
+    """Green area percentage at (bounded) full resolution, processed as parallel tiles"""
+    with stage_timer('area_decode'):
+        image = decode_image_bgr_bounded(image_data, AREA_TILED_MAX_PIXELS)
+    image_height, image_width = image.shape[:2]
+    
+    # OpenCV releases the GIL, so tiles run in parallel across cores
+    with stage_timer('area_tiles'):
+        futures = [
+            tile_executor.submit(
+                count_tile_green, image, x, y,
+                min(AREA_TILE_SIZE, image_width - x), min(AREA_TILE_SIZE, image_height - y)
+            )
+            for y in range(0, image_height, AREA_TILE_SIZE)
+            for x in range(0, image_width, AREA_TILE_SIZE)
+        ]
+        green_pixels = sum(admission.results(futures))
+    return green_pixels / (image_width * image_height) * 100
+
+def to_unet_input(image):
+    """RGB uint8 HxWx3 array -> 3xHxW float tensor in 0-1"""
+    return torch.from_numpy(np.ascontiguousarray(image)).permute(2, 0, 1).float() / 255.0
+
+def unet_area_percentage(image_data):
+    """Green area percentage from U-Net segmentation with coarse-to-fine refinement"""
+    with stage_timer('area_decode'):
+        image = cv2.cvtColor(decode_image_bgr_bounded(image_data, UNET_MAX_PIXELS), cv2.COLOR_BGR2RGB)
+    image_height, image_width = image.shape[:2]
+    tile = UNET_TILE_SIZE
+    
+    # Coarse pass: the whole image squeezed into one tile
+    with stage_timer('area_unet_coarse'):
+        coarse = cv2.resize(image, (tile, tile), interpolation=cv2.INTER_AREA)
+        coarse_probability = admission.result(unet_batcher.submit(to_unet_input(coarse)))
+        probability = cv2.resize(coarse_probability, (image_width, image_height), interpolation=cv2.INTER_LINEAR)
+        uncertain = (probability > UNET_UNCERTAIN_LOW) & (probability < UNET_UNCERTAIN_HIGH)
+    
+    # Fine pass: full-resolution tiles only where the coarse pass was unsure
+    with stage_timer('area_unet_refine'):
+        refinements = []
+        total_tiles = 0
+        for y in range(0, image_height, tile):
+            for x in range(0, image_width, tile):
+                total_tiles += 1
+                if uncertain[y:y + tile, x:x + tile].mean() < UNET_REFINE_MIN_FRACTION:
+                    continue
+                patch = image[y:y + tile, x:x + tile]
+                height, width = patch.shape[:2]
+                if (height, width) != (tile, tile):
+                    # Edge tiles are padded so every tile stacks into the same batch
+                    patch = cv2.copyMakeBorder(patch, 0, tile - height, 0, tile - width, cv2.BORDER_REPLICATE)
+                refinements.append((x, y, width, height, unet_batcher.submit(to_unet_input(patch))))
+        
+        # Tiles still queued in the batcher are dropped if the request deadline passes
+        refined = admission.results([future for *_, future in refinements])
+        for (x, y, width, height, _), tile_probability in zip(refinements, refined):
+            probability[y:y + height, x:x + width] = tile_probability[:height, :width]
+    
+    area_percentage = float(np.mean(probability > 0.5) * 100)
+    return area_percentage, {'refinedTiles': len(refinements), 'totalTiles': total_tiles}
+
+def analyze_area(image_data, mode='hsv'):
     """Analyze planting area from image"""
     try:
-        # Decode base64 image
-        if ',' in image_data:
-            image_data = image_data.split(',')[1]
-        
-        image_bytes = base64.b64decode(image_data)
-        image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
+        admission.check_deadline()
+        segmentation = None
+        if mode == 'tiled':
+            area_percentage = tiled_area_percentage(image_data)
+        elif mode == 'unet':
+            area_percentage, segmentation = unet_area_percentage(image_data)
+        else:
+            area_percentage = hsv_area_percentage(image_data)
         
-        # Resize for processing
-        image = image.resize((256, 256))
-        image_array = np.array(image)  # Keep as uint8 (0-255)
-        
-        # Convert to tensor for model (normalize to 0-1)
-        image_tensor = torch.FloatTensor(image_array).permute(2, 0, 1).unsqueeze(0).to(device) / 255.0
-        
-        # Simple area calculation (placeholder for U-Net)
-        with torch.no_grad():
-            # Use uint8 image for OpenCV color conversion
-            hsv = cv2.cvtColor(image_array, cv2.COLOR_RGB2HSV)
-            lower_green = np.array([35, 20, 20])
-            upper_green = np.array([85, 255, 255])
-            green_mask = cv2.inRange(hsv, lower_green, upper_green)
-            area_percentage = np.sum(green_mask > 0) / (256 * 256) * 100
-            
-            # Calculate usable area
-            usable_area = area_percentage * 0.8  # Assume 80% is usable
-            
-            # Simple recommendations based on area
-            if usable_area > 70:
-                recommendation = "Large area - Plant in rows with 2-3 feet spacing"
-            elif usable_area > 40:
-                recommendation = "Medium area - Use square foot gardening method"
-            else:
-                recommendation = "Small area - Focus on vertical gardening and containers"
-        
-        return {
-            'totalArea': round(area_percentage, 1),
-            'usableArea': round(usable_area, 1),
-            'recommendation': recommendation,
-            'plantingMethod': 'rows' if usable_area > 50 else 'square_foot',
-            'estimatedPlants': int(usable_area / 4)  # Rough estimate
-        }
+        result = summarize_area(area_percentage)
+        result['mode'] = mode
+        if segmentation:
+            result['segmentation'] = segmentation
+        return result
         
+    except (admission.Rejected, UploadTooLarge):
+        raise
     except Exception as e:
         print(f"Error analyzing area: {e}")
         return None
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({'status': 'healthy', 'model_loaded': model is not None})
+    return jsonify({
+        'status': 'healthy',
+        'model_loaded': model is not None,
+        'model_state': model_loader.state,
+        'unet_weights_loaded': weights_loaded,
+        'admission': area_gate.stats()
+    })
+
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    return jsonify(model_loader.status()), 200 if model_loader.ready else 503
 
 @app.route('/analyze-area', methods=['POST'])
 def analyze_planting_area():
     try:
-        data = request.get_json()
-        if not data or 'image' not in data:
-            return jsonify({'error': 'Missing image data'}), 400
-        
-        result = analyze_area(data['image'])
-        if result is None:
-            return jsonify({'error': 'Failed to analyze area'}), 400
-        
-        return jsonify(result)
+        # Shed load before the upload is read, so a rejected request never holds an image
+        with admission.flask_admit(area_gate):
+            # Accepts multipart/form-data, a raw image/* body or the legacy base64 JSON body
+            with stage_timer('area_read_upload'):
+                image_data, data = read_image_upload(request)
+            if image_data is None:
+                return jsonify({'error': 'Missing image data'}), 400
+            
+            # Optional analysis mode: 'hsv' (default, 256x256), 'tiled' (full resolution) or 'unet'
+            mode = data.get('mode') or request.args.get('mode') or 'hsv'
+            if mode not in AREA_MODES:
+                return jsonify({'error': f"Unknown mode '{mode}' (expected one of {', '.join(AREA_MODES)})"}), 400
+            if mode == 'unet' and unet_batcher is None:
+                return jsonify({'error': 'Model is still loading'}), 503
+            requested_mode = mode
+            if mode == 'unet' and not weights_loaded:
+                # An untrained U-Net reports ~0% and refines every tile; HSV masking still gives a real answer
+                mode = 'hsv'
+            
+            result = analyze_area(image_data, mode)
+            if result is None:
+                return jsonify({'error': 'Failed to analyze area'}), 400
+            if mode != requested_mode:
+                result['requestedMode'] = requested_mode
+            
+            return jsonify(result)
         
+    except InvalidUpload as e:
+        return jsonify({'error': str(e)}), 400
+    except UploadTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+    except admission.Rejected as e:
+        return admission.flask_rejection(e)
     except Exception as e:
         print(f"Error in analyze-area endpoint: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
 if __name__ == '__main__':
-    print("Loading U-Net model...")
-    load_model()
+    tuning.apply('area')
+    print("Loading U-Net model in the background...")
+    model_loader.start()
     print("Starting area analyzer server...")
     app.run(debug=True, host='0.0.0.0', port=5001) 
\ No newline at end of file
@@ -0,0 +1,356 @@
+"""Async (ASGI) serving mode for the plant service
+
+    pip install -r requirements.txt                  # starlette, uvicorn, httpx, python-multipart
+    python asgi.py                                   # port 5000
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+Serves /analyze, /similar, /plant-search, /plants, /plants/<id>/history and /trends,
+/health, /ready and /metrics with the same requests and responses as app.py.
+/analyze-batch and /analyze-video are only served by app.py.
+
+/plant-search awaits Perenual through an async HTTP client, so a slow upstream
+holds a coroutine instead of a worker thread. /analyze runs decode, inference
+and the rule-based analysis on a bounded thread pool, which caps CPU-bound
+concurrency no matter how many searches are in flight. Models, caches and
+the analysis code are shared with app.py.
+"""
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+from image_io import decode_base64_image, UploadTooLarge, InvalidUpload, upload_limit_message, IMAGE_MAX_UPLOAD_BYTES
+from singleflight import AsyncSingleFlight
+import app as plant_service
+import admission
+import perenual
+import tuning
+import metrics
+from metrics import stage_timer
+
+# Threads running /analyze work; also the most images that can meet in one micro-batch
+ASYNC_INFERENCE_WORKERS = int(os.environ.get('ASYNC_INFERENCE_WORKERS', plant_service.BATCH_MAX_SIZE))
+inference_executor = ThreadPoolExecutor(max_workers=ASYNC_INFERENCE_WORKERS, thread_name_prefix='async-inference')
+
+# Identical /analyze requests in flight share one executor job; followers wait on the event loop, not on a thread
+analysis_flight = AsyncSingleFlight('analyze-async', private_errors=(admission.Rejected,))
+
+
+async def read_body(request, max_bytes):
+    """Request body, raising UploadTooLarge as soon as more than max_bytes has arrived"""
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if max_bytes and len(body) > max_bytes:
+            raise UploadTooLarge(upload_limit_message(max_bytes))
+    return bytes(body)
+
+
+async def read_image_upload(request, field='image', max_bytes=IMAGE_MAX_UPLOAD_BYTES):
+    """Async image_io.read_image_upload for Starlette requests, with the same size limit"""
+    content_type = request.headers.get('content-type', '').split(';')[0].strip().lower()
+    content_length = request.headers.get('content-length')
+    if max_bytes and content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        raise UploadTooLarge(upload_limit_message(max_bytes))
+
+    if content_type == 'multipart/form-data':
+        # Starlette spools file parts to disk past 1 MB; only the image part is read into memory
+        form = await request.form()
+        fields = {key: value for key, value in form.items() if isinstance(value, str)}
+        upload = form.get(field)
+        if upload is None or isinstance(upload, str):
+            return None, fields
+        if max_bytes and upload.size is not None and upload.size > max_bytes:
+            raise UploadTooLarge(upload_limit_message(max_bytes))
+        return await upload.read(), fields
+
+    if content_type.startswith('image/') or content_type == 'application/octet-stream':
+        return await read_body(request, max_bytes), dict(request.query_params)
+
+    try:
+        data = json.loads(await read_body(request, max_bytes))
+    except ValueError:
+        return None, {}
+    if not isinstance(data, dict) or field not in data:
+        return None, data if isinstance(data, dict) else {}
+    return decode_base64_image(data[field]), data
+
+
+def analyze_image(image_data, plant_type, planted_date, plant_id=None):
+    """Blocking /analyze pipeline for the inference executor; returns (result, error)"""
+    return plant_service.analyze_image(image_data, plant_type, plant_service.days_since(planted_date), plant_id)
+
+
+def admit(request):
+    """Reserve an admission slot before the upload is read; returns (reserved_at, deadline) or raises Rejected"""
+    client = admission.client_key(request.headers, request.client.host if request.client else None)
+    deadline = admission.request_deadline(request.headers.get(admission.DEADLINE_HEADER))
+    return plant_service.inference_gate.reserve(client), deadline
+
+
+def run_admitted(reservation, fn, *args):
+    """fn(*args) on an inference thread, holding the reserved slot and the request's deadline"""
+    with plant_service.inference_gate.running(*reservation):
+        return fn(*args)
+
+
+async def coalesce(flight, key, start, deadline):
+    """flight.do(key, start) with the caller's wait bounded by its request deadline"""
+    timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+    try:
+        return await asyncio.wait_for(flight.do(key, start), timeout)
+    except asyncio.TimeoutError:
+        raise admission.DeadlineExceeded()
+
+
+def rejection_response(error):
+    return JSONResponse({'error': error.message, 'reason': error.reason}, status_code=error.status,
+                        headers={'Retry-After': str(error.retry_after)})
+
+
+def find_similar(image_data, k, mode):
+    """Blocking /similar pipeline for the inference executor; returns (response, error)"""
+    features, error = plant_service.get_image_features(image_data)
+    if error:
+        return None, error
+    return plant_service.find_similar_cases(features, k, mode)
+
+
+async def health_check(request):
+    return JSONResponse({
+        'status': 'healthy',
+        'model_loaded': plant_service.inference_backend is not None,
+        'model_state': plant_service.model_loader.state,
+        'backend': plant_service.inference_backend.name if plant_service.inference_backend else None,
+        'feature_cache': plant_service.feature_cache.stats(),
+        'perenual_cache': perenual.cache_stats(),
+        'admission': plant_service.inference_gate.stats(),
+        'coalescing': analysis_flight.stats()
+    })
+
+
+async def readiness_check(request):
+    loader = plant_service.model_loader
+    return JSONResponse(loader.status(), status_code=200 if loader.ready else 503)
+
+
+async def metrics_endpoint(request):
+    return Response(metrics.render(), headers={'Content-Type': metrics.CONTENT_TYPE})
+
+
+async def analyze_plant(request):
+    try:
+        if plant_service.inference_backend is None:
+            return JSONResponse({'error': 'Model is still loading'}, status_code=503)
+
+        # Shed load before the upload is read, so a rejected request never holds an image
+        reservation = admit(request)
+        try:
+            with stage_timer('read_upload'):
+                image_data, data = await read_image_upload(request)
+            if image_data is None or 'plantType' not in data or 'plantedDate' not in data:
+                return JSONResponse({'error': 'Missing required fields'}, status_code=400)
+            if plant_service.invalid_plant_id(data.get('plantId')):
+                return JSONResponse({'error': 'Invalid plantId'}, status_code=400)
+
+            deadline = reservation[1]
+
+            def dispatch():
+                # The queued executor job owns the reservation from here on. It is shielded from
+                # cancellation because it gives the reservation back when it runs.
+                nonlocal reservation
+                job = asyncio.get_running_loop().run_in_executor(
+                    inference_executor, run_admitted, reservation,
+                    analyze_image, image_data, data['plantType'], data['plantedDate'], data.get('plantId')
+                )
+                reservation = None
+                # Read the outcome even when every caller has given up, so a failure is not logged as unretrieved
+                job.add_done_callback(lambda job: job.cancelled() or job.exception())
+                return asyncio.shield(job)
+
+            # Followers of an identical request keep their queue place until it answers, in case they must run it
+            key = plant_service.analysis_key(image_data, data['plantType'], data['plantedDate'], data.get('plantId'))
+            result, error = await coalesce(analysis_flight, key, dispatch, deadline)
+        finally:
+            if reservation is not None:
+                plant_service.inference_gate.unreserve()
+
+        if error:
+            return JSONResponse({'error': error}, status_code=400)
+        return JSONResponse(result)
+
+    except InvalidUpload as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    except UploadTooLarge as e:
+        return JSONResponse({'error': str(e)}, status_code=413)
+    except admission.Rejected as e:
+        return rejection_response(e)
+    except Exception as e:
+        print(f"Error in analyze endpoint: {e}")
+        return JSONResponse({'error': 'Internal server error'}, status_code=500)
+
+
+async def similar_cases(request):
+    try:
+        if plant_service.vector_index is None:
+            return JSONResponse({'error': 'Similar-case search is disabled'}, status_code=404)
+        if plant_service.inference_backend is None:
+            return JSONResponse({'error': 'Model is still loading'}, status_code=503)
+
+        reservation = admit(request)
+        try:
+            with stage_timer('read_upload'):
+                image_data, data = await read_image_upload(request)
+            if image_data is None:
+                return JSONResponse({'error': 'Missing required fields'}, status_code=400)
+            try:
+                k = min(max(int(data.get('k') or request.query_params.get('k', 5)), 1), plant_service.SIMILAR_MAX_K)
+            except ValueError:
+                return JSONResponse({'error': 'k must be an integer'}, status_code=400)
+            mode = data.get('mode') or request.query_params.get('mode', 'auto')
+
+            dispatched = asyncio.get_running_loop().run_in_executor(
+                inference_executor, run_admitted, reservation, find_similar, image_data, k, mode
+            )
+            reservation = None
+        finally:
+            if reservation is not None:
+                plant_service.inference_gate.unreserve()
+
+        response, error = await dispatched
+        if error:
+            return JSONResponse({'error': error}, status_code=400)
+        return JSONResponse(response)
+
+    except InvalidUpload as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    except UploadTooLarge as e:
+        return JSONResponse({'error': str(e)}, status_code=413)
+    except admission.Rejected as e:
+        return rejection_response(e)
+    except Exception as e:
+        print(f"Error in similar endpoint: {e}")
+        return JSONResponse({'error': 'Internal server error'}, status_code=500)
+
+
+async def plant_search(request):
+    try:
+        query = request.query_params.get('q', '')
+        if not query:
+            return JSONResponse({'error': 'Query parameter "q" is required'}, status_code=400)
+
+        # Local dictionary lookups take well under a millisecond, so they run on the event loop
+        local = plant_service.search_local_plants(query)
+        if local is None and plant_service.PLANT_SEARCH_SOURCE == 'local':
+            return JSONResponse({'error': 'Local plant index is unavailable'}, status_code=503)
+        if local or (local is not None and plant_service.PLANT_SEARCH_SOURCE == 'local'):
+            return JSONResponse({'query': query, 'results': local, 'total': len(local), 'source': 'local'})
+
+        deadline_at = perenual.search_deadline()
+        data = await perenual.afetch_species_list(query, deadline_at)
+        if not data.get('data'):
+            return JSONResponse({'results': [], 'total': 0})
+
+        results = data['data'][:5]
+        plant_ids = [plant.get('id') for plant in results if plant.get('id')]
+        details = await perenual.afetch_species_details_many(plant_ids, deadline_at)
+
+        plants = [plant_service.build_plant_info(plant, details.get(plant.get('id'), {})) for plant in results]
+        return JSONResponse({'query': query, 'results': plants, 'total': len(plants), 'source': 'perenual'})
+
+    except Exception as e:
+        # httpx errors (timeouts, bad status) end up here as well
+        print(f"Error in plant search: {e}")
+        return JSONResponse({'error': 'Failed to fetch plant data'}, status_code=500)
+
+
+def history_unavailable(plant_id):
+    if plant_service.history_store is None:
+        return JSONResponse({'error': 'Analysis history is disabled'}, status_code=404)
+    if not plant_service.HistoryStore.valid_plant_id(plant_id):
+        return JSONResponse({'error': 'Invalid plantId'}, status_code=400)
+    if not plant_service.history_store.exists(plant_id):
+        return JSONResponse({'error': 'No history for this plant'}, status_code=404)
+    return None
+
+
+async def create_plant(request):
+    if plant_service.history_store is None:
+        return JSONResponse({'error': 'Analysis history is disabled'}, status_code=404)
+    return JSONResponse({'plantId': plant_service.history_store.create()}, status_code=201)
+
+
+async def plant_history(request):
+    plant_id = request.path_params['plant_id']
+    unavailable = history_unavailable(plant_id)
+    if unavailable:
+        return unavailable
+    store = plant_service.history_store
+    try:
+        if request.method == 'DELETE':
+            return JSONResponse({'plantId': plant_id, 'deleted': store.delete(plant_id)})
+        limit = min(max(int(request.query_params.get('limit', 50)), 1), plant_service.HISTORY_MAX_LIMIT)
+        offset = max(int(request.query_params.get('offset', 0)), 0)
+    except ValueError:
+        return JSONResponse({'error': 'limit and offset must be integers'}, status_code=400)
+    total, entries = store.timeline(plant_id, limit, offset)
+    return JSONResponse({'plantId': plant_id, 'total': total, 'offset': offset, 'entries': entries})
+
+
+async def plant_trends(request):
+    plant_id = request.path_params['plant_id']
+    unavailable = history_unavailable(plant_id)
+    if unavailable:
+        return unavailable
+    # Reads one small stats file, so it is fine on the event loop
+    trends = plant_service.history_store.trends(plant_id)
+    if trends is None:
+        return JSONResponse({'error': 'No history for this plant'}, status_code=404)
+    trends['plantId'] = plant_id
+    stages = plant_service.PLANT_STAGES.get(trends['plantType'], plant_service.PLANT_STAGES['Tomato'])
+    if trends['stage']['currentIndex'] is not None and trends['stage']['currentIndex'] < len(stages):
+        trends['stage']['current'] = stages[trends['stage']['currentIndex']]
+    return JSONResponse(trends)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Same thread settings, background load and warm-up as app.py; /ready flips when done
+    tuning.apply('plant')
+    plant_service.model_loader.start()
+    yield
+    await perenual.close_async_client()
+
+
+routes = [
+    Route('/health', health_check, methods=['GET']),
+    Route('/ready', readiness_check, methods=['GET']),
+    Route('/metrics', metrics_endpoint, methods=['GET']),
+    Route('/analyze', analyze_plant, methods=['POST']),
+    Route('/similar', similar_cases, methods=['POST']),
+    Route('/plant-search', plant_search, methods=['GET']),
+    Route('/plants', create_plant, methods=['POST']),
+    Route('/plants/{plant_id}/history', plant_history, methods=['GET', 'DELETE']),
+    Route('/plants/{plant_id}/trends', plant_trends, methods=['GET'])
+]
+
+app = Starlette(
+    routes=routes,
+    middleware=[
+        Middleware(metrics.ASGIMetricsMiddleware, service='plant-async', known_paths=[route.path for route in routes]),
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])
+    ],
+    lifespan=lifespan
+)
+
+
+if __name__ == '__main__':
+    import uvicorn
+    print("Starting async server...")
+    uvicorn.run(app, host='0.0.0.0', port=int(os.environ.get('ASYNC_PORT', 5000)))
@@ -0,0 +1,93 @@
+import os
+import threading
+import time
+from concurrent.futures import Future
+from queue import Queue, Empty
+from metrics import BATCH_SIZE, BATCH_SECONDS
+
+# Queued by close() to stop the worker thread
+_STOP = object()
+
+
+class BatchScheduler:
+    """Collect concurrent single-item requests into micro-batches for one model call"""
+
+    def __init__(self, run_batch, max_batch_size=8, max_wait_ms=5.0, name='batcher'):
+        # run_batch takes a list of items and returns a list of results in the same order
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.name = name
+        self._queue = Queue()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_worker(self):
+        """Start the worker thread, restarting it in a forked child process"""
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                # Threads do not survive fork, and neither should requests queued by the parent
+                self._queue = Queue()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._worker, name=self.name, daemon=True)
+            self._thread.start()
+
+    def submit(self, item):
+        """Queue a single item and return a Future for its result"""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def run(self, item, timeout=None):
+        """Queue a single item and block until its result is ready"""
+        return self.submit(item).result(timeout=timeout)
+
+    def close(self):
+        """Stop the worker thread after it finishes the requests already queued"""
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            self._queue.put((_STOP, None))
+
+    def _collect(self):
+        """Wait for the first request, then gather more until the batch is full or max_wait passes"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size and batch[-1][0] is not _STOP:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except Empty:
+                break
+        stopping = batch[-1][0] is _STOP
+        if stopping:
+            batch.pop()
+        # Drop requests whose callers cancelled while waiting
+        return [(item, future) for item, future in batch if future.set_running_or_notify_cancel()], stopping
+
+    def _worker(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = self._collect()
+            if not batch:
+                continue
+            BATCH_SIZE.labels(self.name).observe(len(batch))
+            try:
+                with BATCH_SECONDS.labels(self.name).time():
+                    results = self.run_batch([item for item, _ in batch])
+                if results is None or len(results) != len(batch):
+                    raise RuntimeError(f"{self.name}: batch function returned no usable results")
+            except Exception as e:
+                print(f"Error running batch of {len(batch)}: {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
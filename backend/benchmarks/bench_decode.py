@@ -0,0 +1,172 @@
+"""Micro-benchmark: full-size decode vs reduced-resolution decode
+
+Compares the original decode paths of app.py (PIL decode + resize to 224)
+and area_analyzer.py (PIL decode + resize to 256) against the image_io
+reduced-resolution paths. plant-preprocess and plant-ingest go one step
+further, to the model input tensor: the earlier preprocess_image (open_image,
+torchvision transform, the decoded image kept until the request ends)
+against decode_rgb_array into a pooled tensor. Each measurement runs in a
+fresh child process so peak RSS is not polluted by earlier runs; requests
+run one at a time, so the peak RSS growth is what a single request costs.
+
+    python benchmarks/bench_decode.py                 # synthetic 12 MP JPEG
+    python benchmarks/bench_decode.py --format png    # synthetic 12 MP PNG (no reduced JPEG decode)
+    python benchmarks/bench_decode.py photo.jpg -n 20
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+PATHS = ['plant-full', 'plant-reduced', 'plant-preprocess', 'plant-ingest', 'area-full', 'area-reduced']
+MEAN = [0.485, 0.456, 0.406]
+STD = [0.229, 0.224, 0.225]
+
+
+def make_synthetic_jpeg(width=4000, height=3000, quality=90, image_format='JPEG'):
+    """Build a phone-sized JPEG (or PNG) with enough texture that it does not compress to nothing"""
+    import numpy as np
+    from PIL import Image
+    rng = np.random.default_rng(0)
+    x = (np.arange(width, dtype=np.uint16) * 200 // width)[None, :]
+    y = (np.arange(height, dtype=np.uint16) * 200 // height)[:, None]
+    pixels = rng.integers(0, 40, size=(height, width, 3), dtype=np.uint16)
+    pixels[..., 0] += x
+    pixels[..., 1] += y
+    pixels[..., 2] += (x + y) // 2
+    pixels = pixels.astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format=image_format, quality=quality)
+    return buffer.getvalue()
+
+
+def make_pool():
+    """The plant service's input tensor pool and normalization constants, built as load_model does"""
+    import torch
+    from tensor_pool import TensorPool
+    pool = TensorPool((1, 3, 224, 224), 2)
+    pool.fill('cpu')
+    return pool, torch.tensor(MEAN).view(1, 3, 1, 1), torch.tensor(STD).view(1, 3, 1, 1)
+
+
+def decode_once(path, image_bytes, pool=None):
+    import numpy as np
+    from PIL import Image
+    import image_io
+
+    if path == 'plant-full':
+        image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
+        return image.resize((224, 224), Image.BILINEAR)
+    if path == 'plant-reduced':
+        return image_io.open_image(image_bytes, target_size=(224, 224)).resize((224, 224), Image.BILINEAR)
+    if path == 'plant-preprocess':
+        from torchvision import transforms
+        transform = transforms.Compose([transforms.Resize((224, 224)), transforms.ToTensor(),
+                                        transforms.Normalize(mean=MEAN, std=STD)])
+        image = image_io.open_image(image_bytes, target_size=(224, 224))
+        return transform(image).unsqueeze(0), image
+    if path == 'plant-ingest':
+        import torch
+        tensor_pool, mean, std = pool
+        tensor = tensor_pool.acquire()
+        tensor.copy_(torch.from_numpy(image_io.decode_rgb_array(image_bytes, (224, 224))).permute(2, 0, 1).unsqueeze(0))
+        tensor.div_(255).sub_(mean).div_(std)
+        tensor_pool.release(tensor)
+        return tensor
+    if path == 'area-full':
+        image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
+        return np.array(image.resize((256, 256)))
+    if path == 'area-reduced':
+        return image_io.decode_image_array(image_bytes, (256, 256))
+    raise ValueError(f"Unknown path {path}")
+
+
+def peak_rss_kb():
+    """Peak resident set size of this process in KB"""
+    # VmHWM resets on exec; ru_maxrss can carry over the parent's peak on Linux
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_child(path, image_file, iterations):
+    """Time one decode path and report peak RSS growth over the post-import baseline"""
+    import numpy, PIL.Image, cv2, image_io  # noqa: F401 - imports are not part of the measurement
+    pool = None
+    if path in ('plant-preprocess', 'plant-ingest'):
+        import torch, torchvision  # noqa: F401
+        pool = make_pool()
+    with open(image_file, 'rb') as f:
+        image_bytes = f.read()
+    baseline_kb = peak_rss_kb()
+
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        decode_once(path, image_bytes, pool)
+        timings.append((time.perf_counter() - started) * 1000)
+    peak_kb = peak_rss_kb()
+
+    timings.sort()
+    print(json.dumps({
+        'path': path,
+        'iterations': iterations,
+        'meanMs': round(sum(timings) / len(timings), 2),
+        'p50Ms': round(timings[len(timings) // 2], 2),
+        'peakRssMb': round(peak_kb / 1024, 1),
+        'peakRssGrowthMb': round((peak_kb - baseline_kb) / 1024, 1)
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('image', nargs='?', help='Image to decode (default: synthetic 4000x3000)')
+    parser.add_argument('--format', default='jpeg', choices=['jpeg', 'png'], help='Format of the synthetic image')
+    parser.add_argument('-n', '--iterations', type=int, default=10)
+    parser.add_argument('--child', choices=PATHS, help=argparse.SUPPRESS)
+    parser.add_argument('--json', action='store_true', help='Print results as one JSON document')
+    args = parser.parse_args()
+
+    if args.child:
+        return run_child(args.child, args.image, args.iterations)
+
+    image_file = args.image
+    if image_file is None:
+        extension = 'jpg' if args.format == 'jpeg' else 'png'
+        image_file = os.path.join(tempfile.gettempdir(), f'groweasy_synthetic_12mp.{extension}')
+        if not os.path.exists(image_file):
+            with open(image_file, 'wb') as f:
+                f.write(make_synthetic_jpeg(image_format=args.format.upper()))
+
+    results = []
+    for path in PATHS:
+        output = subprocess.run(
+            [sys.executable, __file__, image_file, '-n', str(args.iterations), '--child', path],
+            check=True, capture_output=True, text=True
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    if args.json:
+        print(json.dumps({'image': image_file, 'results': results}, indent=2))
+        return
+    print(f"Image: {image_file}")
+    print(f"{'path':<18}{'mean ms':>10}{'p50 ms':>10}{'peak RSS MB':>14}{'RSS growth MB':>16}")
+    for r in results:
+        print(f"{r['path']:<18}{r['meanMs']:>10}{r['p50Ms']:>10}{r['peakRssMb']:>14}{r['peakRssGrowthMb']:>16}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""Micro-benchmarks of the /analyze and /analyze-area building blocks
+
+    MODEL_WEIGHTS_DIR=/srv/groweasy/weights python benchmarks/bench_micro.py
+    python benchmarks/bench_micro.py --only extract_features --batch-sizes 1,8,32 --out micro.json
+    python benchmarks/bench_micro.py --images samples/ --threads 4
+
+Benchmarks: preprocess_image (decode + transform), extract_features at
+several batch sizes (the forward pass the micro-batcher runs), the
+rule-based post-processing chain, and analyze_area in each mode. Runs on
+CPU and offline; without --images it uses deterministic synthetic photos.
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import emit, load_images, parse_size, summarize_ms, time_calls  # noqa: E402
+
+BENCHMARKS = ('preprocess_image', 'extract_features', 'post_processing', 'analyze_area')
+
+
+def bench_preprocess(plant_service, images, iterations):
+    index = [0]
+
+    def run():
+        # Served requests hand their tensor back after the forward pass
+        plant_service.input_pool.release(plant_service.preprocess_image(images[index[0] % len(images)]))
+        index[0] += 1
+
+    return [dict(name='preprocess_image', **summarize_ms(time_calls(run, iterations)))]
+
+
+def bench_extract_features(plant_service, images, iterations, batch_sizes):
+    tensor = plant_service.preprocess_image(images[0])
+    results = []
+    for batch_size in batch_sizes:
+        batch = [tensor] * batch_size
+        summary = summarize_ms(time_calls(lambda: plant_service.extract_features_batch(batch), iterations))
+        summary['imagesPerSecond'] = round(batch_size * 1000 / summary['meanMs'], 1)
+        results.append(dict(name=f'extract_features[batch={batch_size}]', batchSize=batch_size, **summary))
+    return results
+
+
+def bench_post_processing(plant_service, images, iterations):
+    features = plant_service.extract_features_batch([plant_service.preprocess_image(images[0])])[0]
+    results = []
+    for plant_type, days in (('Tomato', 45), ('Lettuce', 20), ('Basil', 70)):
+        timings = time_calls(lambda: plant_service.build_analysis_result(features, plant_type, days), iterations)
+        results.append(dict(name=f'post_processing[{plant_type}]', **summarize_ms(timings)))
+    return results
+
+
+def bench_analyze_area(area_service, images, iterations, modes):
+    results = []
+    for mode in modes:
+        index = [0]
+
+        def run():
+            if area_service.analyze_area(images[index[0] % len(images)], mode) is None:
+                raise RuntimeError(f"analyze_area failed in mode {mode}")
+            index[0] += 1
+
+        results.append(dict(name=f'analyze_area[{mode}]', **summarize_ms(time_calls(run, iterations))))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--only', help=f"Comma-separated subset of {', '.join(BENCHMARKS)}")
+    parser.add_argument('-n', '--iterations', type=int, default=20)
+    parser.add_argument('--batch-sizes', default='1,2,4,8,16')
+    parser.add_argument('--area-modes', default='hsv,tiled,unet')
+    parser.add_argument('--images', help='Folder of sample photos (default: synthetic)')
+    parser.add_argument('--image-count', type=int, default=8)
+    parser.add_argument('--size', default='1024x768', help='Synthetic image size for /analyze benchmarks')
+    parser.add_argument('--area-size', default='2048x1536', help='Synthetic image size for analyze_area')
+    parser.add_argument('--threads', type=int, help='torch.set_num_threads for repeatable numbers')
+    parser.add_argument('--out', help='Write JSON results to this file')
+    parser.add_argument('--json', action='store_true', help='Print JSON results')
+    args = parser.parse_args()
+
+    selected = args.only.split(',') if args.only else list(BENCHMARKS)
+    unknown = set(selected) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"Unknown benchmark(s): {', '.join(sorted(unknown))}")
+
+    import torch
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    torch.manual_seed(0)
+
+    images = load_images(args.images, args.image_count, parse_size(args.size))
+    results = []
+    if set(selected) & {'preprocess_image', 'extract_features', 'post_processing'}:
+        import app as plant_service
+        plant_service.model_loader.run()
+        if not plant_service.model_loader.ready:
+            raise SystemExit(f"EfficientNet failed to load: {plant_service.model_loader.error}")
+        if 'preprocess_image' in selected:
+            results += bench_preprocess(plant_service, images, args.iterations)
+        if 'extract_features' in selected:
+            batch_sizes = [int(size) for size in args.batch_sizes.split(',')]
+            results += bench_extract_features(plant_service, images, args.iterations, batch_sizes)
+        if 'post_processing' in selected:
+            results += bench_post_processing(plant_service, images, args.iterations * 50)
+    if 'analyze_area' in selected:
+        import area_analyzer as area_service
+        modes = args.area_modes.split(',')
+        if 'unet' in modes:
+            area_service.model_loader.run()
+        area_images = images if args.images else load_images(None, min(args.image_count, 4), parse_size(args.area_size))
+        results += bench_analyze_area(area_service, area_images, args.iterations, modes)
+
+    emit('micro', results, args.out, args.json)
+    if not args.json:
+        print(f"{'benchmark':<34}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for result in results:
+            extra = f"  {result['imagesPerSecond']} img/s" if 'imagesPerSecond' in result else ''
+            print(f"{result['name']:<34}{result['meanMs']:>10}{result['p50Ms']:>10}{result['p95Ms']:>10}{result['p99Ms']:>10}{extra}")
+
+
+if __name__ == '__main__':
+    main()
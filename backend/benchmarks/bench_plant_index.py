@@ -0,0 +1,104 @@
+"""Query latency of the local plant-dictionary index on a synthetic catalog
+
+    python benchmarks/bench_plant_index.py                   # 10k species
+    python benchmarks/bench_plant_index.py --species 50000 --out plant_index.json
+
+The catalog pairs made-up genus and epithet syllables into --species
+scientific names with one or two common names each, and imports it with
+plant_index.build_index into a temp file. Queries are drawn from the
+catalog and timed warm (connection open, pages cached) per kind: whole
+word, prefix, scientific name, one-letter typo and substring.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import emit, summarize_ms  # noqa: E402
+
+# 320 syllables; a handful would make every trigram occur in thousands of names, unlike real plant names
+SYLLABLES = tuple(onset + vowel + coda for onset in 'bcdfghklmnprstvz' for vowel in 'aeiou' for coda in ('', 'l', 'n', 'r'))
+NOUNS = ('Fern', 'Lily', 'Mint', 'Sage', 'Pepper', 'Rose', 'Ivy', 'Palm', 'Daisy', 'Orchid', 'Basil', 'Thyme')
+
+
+def word(rng, parts):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(parts))
+
+
+def synthetic_catalog(rng, count):
+    items = []
+    for plant_id in range(1, count + 1):
+        common = [f'{word(rng, 2).title()} {rng.choice(NOUNS)}']
+        if rng.random() < 0.5:
+            common.append(f'{word(rng, 3).title()} {rng.choice(NOUNS)}')
+        items.append({
+            'id': plant_id,
+            'common_name': common[0],
+            'scientific_name': [f'{word(rng, 3).title()} {word(rng, 3)}'],
+            'other_name': common[1:]
+        })
+    return items
+
+
+def typo(rng, text):
+    position = rng.randrange(1, len(text) - 1)
+    return text[:position] + text[position + 1:]
+
+
+def queries(rng, items, count):
+    picks = [rng.choice(items) for _ in range(count)]
+    return {
+        'word': [item['common_name'].split()[0] for item in picks],
+        'prefix': [item['common_name'][:4] for item in picks],
+        'scientific': [item['scientific_name'][0] for item in picks],
+        'typo': [typo(rng, item['common_name'].split()[0]) for item in picks],
+        'substring': [item['scientific_name'][0].split()[1][2:7] for item in picks]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--species', type=int, default=10000)
+    parser.add_argument('--queries', type=int, default=200, help='Queries per kind')
+    parser.add_argument('--limit', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='Write JSON results to this file')
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    from plant_index import PlantIndex, build_index
+    rng = random.Random(args.seed)
+    items = synthetic_catalog(rng, args.species)
+    handle, path = tempfile.mkstemp(prefix='groweasy-plants-', suffix='.sqlite')
+    os.close(handle)
+    results = []
+    try:
+        started = time.perf_counter()
+        build_index(items, {}, path)
+        import_seconds = round(time.perf_counter() - started, 2)
+        index = PlantIndex(path)
+        for kind, texts in queries(rng, items, args.queries).items():
+            index.search(texts[0], args.limit)
+            timings = []
+            found = 0
+            for text in texts:
+                started = time.perf_counter()
+                found += bool(index.search(text, args.limit))
+                timings.append((time.perf_counter() - started) * 1000)
+            results.append(dict(name=f'plant_index[{kind}]', species=args.species, importSeconds=import_seconds,
+                                answered=round(found / len(texts), 3), **summarize_ms(timings)))
+    finally:
+        os.remove(path)
+
+    emit('plant_index', results, args.out, args.json)
+    if not args.json:
+        print(f"{'benchmark':<30}{'answered':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for result in results:
+            print(f"{result['name']:<30}{result['answered']:>10}{result['p50Ms']:>10}{result['p95Ms']:>10}{result['p99Ms']:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""Shared helpers for the benchmark scripts: test images, latency summaries and JSON results"""
+import glob
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+def synthetic_plant_jpeg(width=1024, height=768, seed=0, quality=90):
+    """Deterministic JPEG of green foliage-like blobs on soil, distinct per seed"""
+    import numpy as np
+    from PIL import Image, ImageDraw
+    rng = np.random.default_rng(seed)
+    pixels = rng.integers(0, 30, size=(height, width, 3), dtype=np.uint8)
+    pixels[..., 0] += 90
+    pixels[..., 1] += 60
+    pixels[..., 2] += 30
+    image = Image.fromarray(pixels)
+    draw = ImageDraw.Draw(image)
+    for _ in range(40):
+        x, y = rng.integers(0, width), rng.integers(0, height)
+        radius = int(rng.integers(min(width, height) // 40, min(width, height) // 8))
+        green = tuple(int(c) for c in (rng.integers(20, 80), rng.integers(110, 200), rng.integers(20, 80)))
+        draw.ellipse((x - radius, y - radius, x + radius, y + radius), fill=green)
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def load_images(image_dir=None, count=8, size=(1024, 768)):
+    """Up to count image files from image_dir, else count synthetic JPEGs of the given size"""
+    if image_dir:
+        paths = sorted(path for path in glob.glob(os.path.join(image_dir, '*')) if os.path.isfile(path))[:count]
+        if not paths:
+            raise SystemExit(f"No images found in {image_dir}")
+        images = []
+        for path in paths:
+            with open(path, 'rb') as f:
+                images.append(f.read())
+        return images
+    return [synthetic_plant_jpeg(size[0], size[1], seed=seed) for seed in range(count)]
+
+
+def parse_size(text):
+    width, height = text.lower().split('x')
+    return int(width), int(height)
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def summarize_ms(timings_ms):
+    """Latency summary of a list of millisecond timings"""
+    ordered = sorted(timings_ms)
+    if not ordered:
+        return {'count': 0}
+    return {
+        'count': len(ordered),
+        'meanMs': round(sum(ordered) / len(ordered), 3),
+        'minMs': round(ordered[0], 3),
+        'p50Ms': round(percentile(ordered, 0.50), 3),
+        'p95Ms': round(percentile(ordered, 0.95), 3),
+        'p99Ms': round(percentile(ordered, 0.99), 3),
+        'maxMs': round(ordered[-1], 3)
+    }
+
+
+def time_calls(fn, iterations, warmup=1):
+    """Run fn warmup + iterations times, returning the timed iterations in ms"""
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def peak_rss_mb(pid='self'):
+    """Peak resident set size (VmHWM) of a process in MB, or None without /proc"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def worker_pids(master_pid):
+    """Child processes (gunicorn workers) of master_pid, or [] without /proc"""
+    try:
+        with open(f'/proc/{master_pid}/task/{master_pid}/children') as f:
+            return [int(pid) for pid in f.read().split()]
+    except OSError:
+        return []
+
+
+def environment():
+    """What the numbers depend on: commit, interpreter, library versions, CPU and tuning env vars"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                                capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    info = {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpuCount': os.cpu_count(),
+        'env': {key: value for key, value in os.environ.items()
+                if key.startswith(('INFERENCE_', 'BATCH_', 'TORCH_', 'OMP_', 'GUNICORN_', 'UNET_', 'AREA_', 'TUNING_', 'IMAGE_', 'INPUT_POOL_'))}
+    }
+    for module in ('torch', 'numpy', 'cv2', 'PIL'):
+        try:
+            info[f'{module}Version'] = __import__(module).__version__
+        except (ImportError, AttributeError):
+            pass
+    return info
+
+
+def emit(benchmark, results, out=None, as_json=False):
+    """Write {benchmark, environment, results} to out (a path) and/or stdout when as_json is set"""
+    document = {'benchmark': benchmark, 'environment': environment(), 'results': results}
+    if out:
+        with open(out, 'w') as f:
+            json.dump(document, f, indent=2)
+        print(f"Wrote {out}")
+    if as_json:
+        print(json.dumps(document, indent=2))
+    return document
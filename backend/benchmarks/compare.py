@@ -0,0 +1,68 @@
+"""Compare two benchmark JSON files (from bench_micro.py or load_test.py --out)
+
+    python benchmarks/compare.py baseline.json candidate.json
+    python benchmarks/compare.py baseline.json candidate.json --threshold 10 --fail-on-regression
+
+Results are matched by name. Latency and peak-RSS metrics regress when they
+go up, throughput metrics when they go down; changes beyond --threshold percent
+are flagged.
+"""
+import argparse
+import json
+import sys
+
+LOWER_IS_BETTER = ('meanMs', 'p50Ms', 'p95Ms', 'p99Ms', 'workerPeakRssMb')
+HIGHER_IS_BETTER = ('requestsPerSecond', 'imagesPerSecond', 'recall')
+
+
+def load(path):
+    with open(path) as f:
+        document = json.load(f)
+    return document, {result['name']: result for result in document['results']}
+
+
+def compare(baseline, candidate, threshold):
+    """Rows of (name, metric, old, new, change %, regressed)"""
+    rows = []
+    for name, new in candidate.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        for metric in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+            if metric not in old or metric not in new or not old[metric]:
+                continue
+            change = (new[metric] - old[metric]) / old[metric] * 100
+            worse = change > threshold if metric in LOWER_IS_BETTER else change < -threshold
+            rows.append((name, metric, old[metric], new[metric], change, worse))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=10.0, help='Percent change treated as a regression')
+    parser.add_argument('--fail-on-regression', action='store_true', help='Exit 1 if anything regressed')
+    args = parser.parse_args()
+
+    baseline_doc, baseline = load(args.baseline)
+    candidate_doc, candidate = load(args.candidate)
+    print(f"baseline  {baseline_doc['environment'].get('commit')}  {baseline_doc['environment'].get('timestamp')}")
+    print(f"candidate {candidate_doc['environment'].get('commit')}  {candidate_doc['environment'].get('timestamp')}")
+    if baseline_doc['environment'].get('cpuCount') != candidate_doc['environment'].get('cpuCount'):
+        print("warning: runs come from machines with different CPU counts")
+
+    rows = compare(baseline, candidate, args.threshold)
+    print(f"{'benchmark':<34}{'metric':<20}{'baseline':>12}{'candidate':>12}{'change':>10}")
+    for name, metric, old, new, change, worse in rows:
+        print(f"{name:<34}{metric:<20}{old:>12}{new:>12}{change:>+9.1f}%{'  REGRESSION' if worse else ''}")
+    missing = sorted(set(baseline) - set(candidate))
+    if missing:
+        print(f"missing from candidate: {', '.join(missing)}")
+
+    if args.fail_on_regression and any(row[5] for row in rows):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
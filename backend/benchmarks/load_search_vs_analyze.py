@@ -0,0 +1,194 @@
+"""Load test: /analyze latency while /plant-search is saturated against a slow Perenual stub
+
+Starts perenual_stub.py with an artificial delay, then for each server mode
+measures /analyze latency on its own and again while many concurrent
+/plant-search requests wait on the stub. Perenual caching is disabled
+(TTL 0) so every search goes upstream.
+
+    MODEL_WEIGHTS_DIR=/srv/groweasy/weights python benchmarks/load_search_vs_analyze.py
+    python benchmarks/load_search_vs_analyze.py --servers asgi --searches 1000 --stub-delay-ms 5000
+
+Server modes: 'gunicorn' (wsgi.py, 1 gthread worker, the default 8 threads) and
+'asgi' (asgi.py under uvicorn). Needs httpx, uvicorn and gunicorn.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def make_images(count, size=320):
+    """Distinct small JPEGs so the feature cache never short-circuits /analyze"""
+    import numpy as np
+    from PIL import Image
+    rng = np.random.default_rng(0)
+    images = []
+    for _ in range(count):
+        buffer = io.BytesIO()
+        Image.fromarray(rng.integers(0, 255, size=(size, size, 3), dtype=np.uint8)).save(buffer, format='JPEG')
+        images.append(buffer.getvalue())
+    return images
+
+
+def start_server(mode, port, env):
+    if mode == 'asgi':
+        command = [sys.executable, '-m', 'uvicorn', 'asgi:app', '--port', str(port), '--log-level', 'warning']
+    else:
+        env = dict(env, GUNICORN_WORKERS='1', GUNICORN_BIND=f'127.0.0.1:{port}')
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:create_app()']
+    return subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+async def wait_ready(client, base_url, timeout=300):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get(f'{base_url}/ready')).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.5)
+    raise RuntimeError('server did not become ready')
+
+
+async def timed_analyze(client, base_url, images, concurrency):
+    """POST every image to /analyze with the given concurrency; returns (latencies in ms, errors)
+
+    Failed or timed-out requests count as errors and their time until failure still counts as latency.
+    """
+    latencies = []
+    errors = []
+    queue = list(images)
+
+    async def worker():
+        while queue:
+            image = queue.pop()
+            started = time.perf_counter()
+            try:
+                response = await client.post(
+                    f'{base_url}/analyze', params={'plantType': 'Tomato', 'plantedDate': '2024-03-15'},
+                    content=image, headers={'Content-Type': 'image/jpeg'}
+                )
+                response.raise_for_status()
+            except Exception as e:
+                errors.append(type(e).__name__)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors
+
+
+async def search_loop(client, base_url, stop, counters):
+    while not stop.is_set():
+        try:
+            response = await client.get(f'{base_url}/plant-search', params={'q': 'tomato'})
+            key = 'ok' if response.status_code == 200 else f'HTTP {response.status_code}'
+        except Exception as e:
+            key = type(e).__name__
+        counters[key] = counters.get(key, 0) + 1
+
+
+def summarize(measurement):
+    latencies, errors = measurement
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'p50Ms': round(percentile(latencies, 0.5), 1),
+        'p95Ms': round(percentile(latencies, 0.95), 1),
+        'meanMs': round(statistics.mean(latencies), 1)
+    }
+
+
+async def run_mode(mode, args, env):
+    import httpx
+    port = args.port
+    base_url = f'http://127.0.0.1:{port}'
+    server = start_server(mode, port, env)
+    limits = httpx.Limits(max_connections=args.searches + 64, max_keepalive_connections=args.searches + 64)
+    try:
+        async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+            await wait_ready(client, base_url)
+            images = make_images(args.requests * 2 + 8)
+            await timed_analyze(client, base_url, images[:8], 1)  # warm connections and the model
+            baseline = await timed_analyze(client, base_url, images[8:8 + args.requests], args.concurrency)
+
+            stop = asyncio.Event()
+            counters = {}
+            searches = [asyncio.ensure_future(search_loop(client, base_url, stop, counters)) for _ in range(args.searches)]
+            started = time.monotonic()
+            await asyncio.sleep(1.0)  # let the searches pile up on the slow stub
+            loaded = await timed_analyze(client, base_url, images[8 + args.requests:], args.concurrency)
+            # Keep the searches running long enough for some to complete (list + details round trips)
+            await asyncio.sleep(max(0.0, started + args.stub_delay_ms * 4 / 1000 - time.monotonic()))
+            stop.set()
+            for task in searches:
+                task.cancel()
+            await asyncio.gather(*searches, return_exceptions=True)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=60)
+    return {
+        'server': mode,
+        'idle': summarize(baseline),
+        'searchSaturated': summarize(loaded),
+        'searchesCompleted': counters.pop('ok', 0),
+        'searchErrors': counters
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--servers', default='gunicorn,asgi')
+    parser.add_argument('--searches', type=int, default=200, help='Concurrent /plant-search clients')
+    parser.add_argument('--requests', type=int, default=40, help='/analyze requests per phase')
+    parser.add_argument('--concurrency', type=int, default=2, help='Concurrent /analyze clients')
+    parser.add_argument('--stub-delay-ms', type=float, default=3000)
+    parser.add_argument('--stub-port', type=int, default=5098)
+    parser.add_argument('--port', type=int, default=5097)
+    parser.add_argument('--timeout', type=float, default=60, help='Client timeout per request in seconds')
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    stub = subprocess.Popen(
+        [sys.executable, 'perenual_stub.py', '--port', str(args.stub_port), '--delay-ms', str(args.stub_delay_ms)],
+        cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    env = dict(
+        os.environ, PERENUAL_BASE_URL=f'http://127.0.0.1:{args.stub_port}/api', PERENUAL_LIST_TTL='0',
+        PERENUAL_API_KEY=os.environ.get('PERENUAL_API_KEY') or 'stub',
+        PERENUAL_DETAIL_TTL='0', PERENUAL_STALE_TTL='0', PERENUAL_NEGATIVE_TTL='0',
+        PERENUAL_ASYNC_MAX_CONNECTIONS=str(args.searches * 5)
+    )
+    try:
+        results = [asyncio.run(run_mode(mode, args, env)) for mode in args.servers.split(',')]
+    finally:
+        stub.terminate()
+        stub.wait()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{args.searches} concurrent searches, stub delay {args.stub_delay_ms:.0f} ms, "
+          f"{args.requests} /analyze requests at concurrency {args.concurrency}")
+    for result in results:
+        idle, loaded = result['idle'], result['searchSaturated']
+        print(f"{result['server']:<9} /analyze p50 {idle['p50Ms']} -> {loaded['p50Ms']} ms, "
+              f"p95 {idle['p95Ms']} -> {loaded['p95Ms']} ms, errors {idle['errors']} -> {loaded['errors']}; "
+              f"searches completed {result['searchesCompleted']}, failed {result['searchErrors'] or 0}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+"""HTTP load generator for /analyze, /analyze-area and /plant-search
+
+    MODEL_WEIGHTS_DIR=/srv/groweasy/weights python benchmarks/load_test.py          # spawns everything locally
+    python benchmarks/load_test.py --endpoints analyze --concurrency 8 --duration 30 --out load.json
+    python benchmarks/load_test.py --plant-url http://10.0.0.5:5000 --area-url http://10.0.0.5:5001
+
+Each endpoint is driven separately by --concurrency closed-loop clients for
+--duration seconds; the report has p50/p95/p99 latency, req/s and error
+counts. Without --plant-url / --area-url the services are started under
+gunicorn (wsgi.py) against the bundled perenual_stub.py, so the run is fully
+offline. Spawned services run cold by default: the feature cache and the
+Perenual caches are disabled so every request does the full work
+(--warm-caches keeps them). For spawned services the report also has the
+workers' peak RSS (VmHWM) and how much it grew during the measurement,
+which is what concurrent requests cost in memory at this concurrency.
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import BACKEND_DIR, emit, load_images, parse_size, peak_rss_mb, summarize_ms, worker_pids  # noqa: E402
+
+ENDPOINTS = ('analyze', 'analyze-area', 'plant-search')
+SEARCH_QUERIES = ('tomato', 'basil', 'lettuce', 'pepper', 'rosemary', 'strawberry', 'lavender', 'mint')
+
+
+def spawn_service(service, port, env):
+    env = dict(env, GROWEASY_SERVICE=service, GUNICORN_BIND=f'127.0.0.1:{port}')
+    return subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:create_app()'],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+def wait_ready(base_url, process=None, timeout=300):
+    import requests
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise SystemExit(f"Service for {base_url} exited with code {process.returncode}")
+        try:
+            if requests.get(f'{base_url}/ready', timeout=5).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    raise SystemExit(f"{base_url} did not become ready within {timeout}s")
+
+
+def make_request_factory(endpoint, args, images):
+    """Function (session, i) -> response for one request to the endpoint"""
+    if endpoint == 'analyze':
+        def send(session, i):
+            return session.post(
+                f'{args.plant_url}/analyze', params={'plantType': 'Tomato', 'plantedDate': '2024-03-15'},
+                data=images[i % len(images)], headers={'Content-Type': 'image/jpeg'}, timeout=args.timeout
+            )
+    elif endpoint == 'analyze-area':
+        def send(session, i):
+            return session.post(
+                f'{args.area_url}/analyze-area', params={'mode': args.area_mode},
+                data=images[i % len(images)], headers={'Content-Type': 'image/jpeg'}, timeout=args.timeout
+            )
+    else:
+        def send(session, i):
+            return session.get(f'{args.plant_url}/plant-search', params={'q': SEARCH_QUERIES[i % len(SEARCH_QUERIES)]},
+                               timeout=args.timeout)
+    return send
+
+
+def workers_peak_rss(process):
+    """Largest VmHWM among a spawned service's workers in MB, or None"""
+    if process is None:
+        return None
+    peaks = [peak for peak in (peak_rss_mb(pid) for pid in worker_pids(process.pid)) if peak is not None]
+    return max(peaks) if peaks else None
+
+
+def drive(send, concurrency, duration, warmup):
+    """Closed-loop load: concurrency clients send back-to-back requests for duration seconds"""
+    import requests
+    counter = iter(range(10 ** 12))
+    counter_lock = threading.Lock()
+    timings = []
+    errors = {}
+    record = threading.Event()
+    stop = threading.Event()
+
+    def client():
+        session = requests.Session()
+        while not stop.is_set():
+            with counter_lock:
+                i = next(counter)
+            started = time.perf_counter()
+            try:
+                response = send(session, i)
+                error = None if response.status_code == 200 else f'HTTP {response.status_code}'
+            except requests.RequestException as e:
+                error = type(e).__name__
+            elapsed = (time.perf_counter() - started) * 1000
+            if record.is_set() and not stop.is_set():
+                with counter_lock:
+                    if error:
+                        errors[error] = errors.get(error, 0) + 1
+                    else:
+                        timings.append(elapsed)
+
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    time.sleep(warmup)
+    record.set()
+    started = time.monotonic()
+    time.sleep(duration)
+    stop.set()
+    elapsed = time.monotonic() - started
+    for thread in threads:
+        thread.join()
+    return timings, errors, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS))
+    parser.add_argument('-c', '--concurrency', type=int, default=4)
+    parser.add_argument('-d', '--duration', type=float, default=20, help='Measured seconds per endpoint')
+    parser.add_argument('--warmup', type=float, default=3, help='Unmeasured seconds before each measurement')
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--plant-url', help='Use a running plant service instead of spawning one')
+    parser.add_argument('--area-url', help='Use a running area service instead of spawning one')
+    parser.add_argument('--area-mode', default='hsv', choices=['hsv', 'tiled', 'unet'])
+    parser.add_argument('--images', help='Folder of sample photos (default: synthetic)')
+    parser.add_argument('--image-count', type=int, default=32)
+    parser.add_argument('--size', default='1024x768')
+    parser.add_argument('--stub-delay-ms', type=float, default=50, help='Latency of the spawned Perenual stub')
+    parser.add_argument('--warm-caches', action='store_true', help='Keep feature and Perenual caches enabled')
+    parser.add_argument('--workers', type=int, default=1, help='gunicorn workers per spawned service')
+    parser.add_argument('--port-base', type=int, default=5090)
+    parser.add_argument('--out', help='Write JSON results to this file')
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    endpoints = args.endpoints.split(',')
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"Unknown endpoint(s): {', '.join(sorted(unknown))}")
+
+    processes = []
+    services = {}
+    env = dict(os.environ, GUNICORN_WORKERS=str(args.workers))
+    if not args.warm_caches:
+        env.update(FEATURE_CACHE_MAX_MB='0', FEATURE_CACHE_DIR='', PERENUAL_LIST_TTL='0', PERENUAL_DETAIL_TTL='0',
+                   PERENUAL_STALE_TTL='0', PERENUAL_NEGATIVE_TTL='0')
+    try:
+        if not args.plant_url and set(endpoints) & {'analyze', 'plant-search'}:
+            stub_port = args.port_base + 2
+            processes.append(subprocess.Popen(
+                [sys.executable, 'perenual_stub.py', '--port', str(stub_port), '--delay-ms', str(args.stub_delay_ms)],
+                cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            ))
+            env['PERENUAL_BASE_URL'] = f'http://127.0.0.1:{stub_port}/api'
+            env['PERENUAL_API_KEY'] = env.get('PERENUAL_API_KEY') or 'stub'
+            args.plant_url = f'http://127.0.0.1:{args.port_base}'
+            processes.append(spawn_service('plant', args.port_base, env))
+            services['analyze'] = services['plant-search'] = processes[-1]
+            wait_ready(args.plant_url, processes[-1])
+        if not args.area_url and 'analyze-area' in endpoints:
+            args.area_url = f'http://127.0.0.1:{args.port_base + 1}'
+            processes.append(spawn_service('area', args.port_base + 1, env))
+            services['analyze-area'] = processes[-1]
+            wait_ready(args.area_url, processes[-1])
+
+        images = load_images(args.images, args.image_count, parse_size(args.size))
+        results = []
+        for endpoint in endpoints:
+            send = make_request_factory(endpoint, args, images)
+            rss_before = workers_peak_rss(services.get(endpoint))
+            timings, errors, elapsed = drive(send, args.concurrency, args.duration, args.warmup)
+            rss_after = workers_peak_rss(services.get(endpoint))
+            summary = summarize_ms(timings)
+            name = f'{endpoint}[{args.area_mode}]' if endpoint == 'analyze-area' else endpoint
+            result = dict(
+                name=name, concurrency=args.concurrency, durationSeconds=round(elapsed, 2),
+                requestsPerSecond=round(len(timings) / elapsed, 2), errors=errors, **summary
+            )
+            if rss_after is not None:
+                result['workerPeakRssMb'] = rss_after
+                result['workerPeakRssGrowthMb'] = round(rss_after - (rss_before or rss_after), 1)
+            results.append(result)
+    finally:
+        for process in processes:
+            process.send_signal(signal.SIGTERM)
+        for process in processes:
+            try:
+                process.wait(timeout=60)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    emit('load', results, args.out, args.json)
+    if not args.json:
+        print(f"{'endpoint':<20}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}{'peak RSS MB':>13}")
+        for result in results:
+            print(f"{result['name']:<20}{result['requestsPerSecond']:>9}{result.get('p50Ms', '-'):>10}"
+                  f"{result.get('p95Ms', '-'):>10}{result.get('p99Ms', '-'):>10}{sum(result['errors'].values()):>8}"
+                  f"{result.get('workerPeakRssMb', '-'):>13}")
+
+
+if __name__ == '__main__':
+    main()
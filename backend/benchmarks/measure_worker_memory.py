@@ -0,0 +1,112 @@
+"""Measure per-worker memory of the gunicorn deployment with and without preloading
+
+Starts gunicorn twice (GUNICORN_PRELOAD=1 and 0), waits for every worker to
+warm up, sends a few /analyze requests, then reads /proc/<pid>/smaps_rollup
+for each worker. RSS counts shared pages in full for every worker; PSS splits
+them between the processes sharing them, so the PSS sum is the real total.
+
+    MODEL_WEIGHTS_DIR=/srv/groweasy/weights python benchmarks/measure_worker_memory.py --workers 4
+"""
+import argparse
+import io
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def smaps_rollup(pid):
+    """Rss / Pss / shared / private memory of a process in MB"""
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(':') and parts[1].isdigit():
+                values[parts[0][:-1]] = int(parts[1]) / 1024
+    return {
+        'rssMb': round(values.get('Rss', 0), 1),
+        'pssMb': round(values.get('Pss', 0), 1),
+        'sharedMb': round(values.get('Shared_Clean', 0) + values.get('Shared_Dirty', 0), 1),
+        'privateMb': round(values.get('Private_Clean', 0) + values.get('Private_Dirty', 0), 1)
+    }
+
+
+def child_pids(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        return [int(p) for p in f.read().split()]
+
+
+def sample_jpeg():
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new('RGB', (1024, 768), (60, 140, 60)).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+def measure(preload, workers, port, requests_per_worker):
+    env = dict(os.environ, GUNICORN_PRELOAD='1' if preload else '0', GUNICORN_WORKERS=str(workers),
+               GUNICORN_BIND=f'127.0.0.1:{port}')
+    master = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:create_app()'],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        base_url = f'http://127.0.0.1:{port}'
+        deadline = time.monotonic() + 300
+        ready_hits = 0
+        while ready_hits < workers * 4:
+            if time.monotonic() > deadline or master.poll() is not None:
+                raise RuntimeError('gunicorn did not become ready')
+            try:
+                urllib.request.urlopen(f'{base_url}/ready', timeout=5)
+                ready_hits += 1
+            except Exception:
+                time.sleep(0.5)
+
+        image = sample_jpeg()
+        for _ in range(workers * requests_per_worker):
+            request = urllib.request.Request(
+                f'{base_url}/analyze?plantType=Tomato&plantedDate=2024-03-15',
+                data=image, headers={'Content-Type': 'image/jpeg'}
+            )
+            urllib.request.urlopen(request, timeout=60).read()
+
+        worker_stats = [smaps_rollup(pid) for pid in child_pids(master.pid)]
+        return {
+            'preload': preload,
+            'master': smaps_rollup(master.pid),
+            'workers': worker_stats,
+            'totalPssMb': round(sum(w['pssMb'] for w in worker_stats) + smaps_rollup(master.pid)['pssMb'], 1)
+        }
+    finally:
+        master.send_signal(signal.SIGTERM)
+        master.wait(timeout=60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--requests-per-worker', type=int, default=5)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    results = [measure(preload, args.workers, args.port, args.requests_per_worker) for preload in (False, True)]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for result in results:
+        label = 'preloaded (shared weights)' if result['preload'] else 'per-worker load'
+        print(f"{label}: total PSS {result['totalPssMb']} MB")
+        for i, worker in enumerate(result['workers']):
+            print(f"  worker {i}: RSS {worker['rssMb']} MB  PSS {worker['pssMb']} MB  "
+                  f"shared {worker['sharedMb']} MB  private {worker['privateMb']} MB")
+
+
+if __name__ == '__main__':
+    main()
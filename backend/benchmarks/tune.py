@@ -0,0 +1,208 @@
+"""Sweep torch threads, worker processes and batch sizes, then write tuning.json for both services
+
+    MODEL_WEIGHTS_DIR=/srv/groweasy/weights python benchmarks/tune.py          # writes backend/tuning.json
+    python benchmarks/tune.py --services plant --batch-sizes 4,8,16 --seconds 5 --results tune-results.json
+    python benchmarks/tune.py --dry-run                                        # measure and print only
+
+Each service gets its own slice of the machine's cores (--area-cores for
+the area service, the rest for the plant service; on a single core they
+share it). For every (workers, threads) setting that fits its slice, the
+parent loads the model once and forks that many workers, as gunicorn
+preload does. Each worker is pinned to its own cores with that many torch
+threads and runs the forward pass at each batch size at the same time as
+the others for --seconds: extract_features_batch for the plant service,
+the U-Net tile batch behind analyze_area for the area service. Torch's
+default of one thread per core in every worker is measured alongside to
+show what oversubscription costs.
+
+Throughput is images (or tiles) per second summed over workers; latency
+is per forward pass. The recommendation is the highest-throughput setting
+whose p95 stays within --max-p95-ms. It is written as the service's
+section of tuning.json, which app.py, area_analyzer.py, asgi.py and
+gunicorn.conf.py read at startup (see tuning.py).
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import BACKEND_DIR, emit, environment, summarize_ms, synthetic_plant_jpeg  # noqa: E402
+
+SERVICES = ('plant', 'area')
+
+
+def powers_of_two_up_to(limit):
+    values = []
+    value = 1
+    while value <= limit:
+        values.append(value)
+        value *= 2
+    if limit not in values:
+        values.append(limit)
+    return values
+
+
+def split_cores(cpus, area_cores):
+    """{service: cpu list}; disjoint slices when there are at least two cores"""
+    if len(cpus) < 2:
+        return {'plant': cpus, 'area': cpus}
+    area_cores = min(max(1, area_cores), len(cpus) - 1)
+    return {'plant': cpus[:-area_cores], 'area': cpus[-area_cores:]}
+
+
+def candidates(cpus, max_workers):
+    """(workers, threads, cpu sets or None) settings to measure for a service owning cpus"""
+    settings = []
+    for workers in powers_of_two_up_to(min(max_workers, len(cpus))):
+        for threads in powers_of_two_up_to(len(cpus) // workers):
+            affinity = [cpus[i * threads:(i + 1) * threads] for i in range(workers)]
+            settings.append((workers, threads, affinity))
+        # What an untuned deployment does: every worker spawns one torch thread per core of the machine
+        if os.cpu_count() and (workers, os.cpu_count()) not in [(w, t) for w, t, _ in settings]:
+            settings.append((workers, os.cpu_count(), None))
+    return settings
+
+
+def load_service(service):
+    """Load the service's model in this (parent) process without running a forward pass"""
+    if service == 'plant':
+        import app as module
+    else:
+        import area_analyzer as module
+    module.model_loader.run(warm_up=False)
+    if module.model_loader.state != 'loaded':
+        raise SystemExit(f"{service}: model failed to load: {module.model_loader.error}")
+    return module
+
+
+def forward_pass(service, module, batch_size):
+    """A callable running one forward pass of batch_size items, built in the worker process"""
+    if service == 'plant':
+        tensor = module.preprocess_image(synthetic_plant_jpeg(1024, 768))
+        batch = [tensor] * batch_size
+        return lambda: module.extract_features_batch(batch)
+    import torch
+    tile = torch.rand(3, module.UNET_TILE_SIZE, module.UNET_TILE_SIZE)
+    batch = [tile] * batch_size
+    return lambda: module.run_unet_batch(batch)
+
+
+def run_worker(service, module, batch_size, threads, cpus, seconds, barrier, results):
+    """Forked worker: pin, set threads, warm up, then run forward passes until the time is up"""
+    import tuning
+    tuning.apply_threads(threads, cpus)
+    run = forward_pass(service, module, batch_size)
+    run()
+    run()
+    barrier.wait()
+    timings = []
+    finish = time.perf_counter() + seconds
+    while time.perf_counter() < finish:
+        started = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - started) * 1000)
+    results.put(timings)
+
+
+def measure(service, module, workers, threads, affinity, batch_size, seconds):
+    context = multiprocessing.get_context('fork')
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [
+        context.Process(target=run_worker, args=(service, module, batch_size, threads,
+                                                 affinity[i] if affinity else None, seconds, barrier, results))
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    timings = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    passes = sum(len(worker_timings) for worker_timings in timings)
+    summary = summarize_ms([value for worker_timings in timings for value in worker_timings])
+    return dict(
+        name=f'{service}[workers={workers},threads={threads},batch={batch_size}]',
+        service=service, workers=workers, threads=threads, batchSize=batch_size,
+        pinned=affinity is not None, cpuAffinity=affinity,
+        itemsPerSecond=round(passes * batch_size / seconds, 1), **summary
+    )
+
+
+def recommend(results, max_p95_ms):
+    """Highest-throughput pinned setting within the latency budget (else the lowest-latency one)"""
+    pinned = [result for result in results if result['pinned']]
+    within = [result for result in pinned if not max_p95_ms or result['p95Ms'] <= max_p95_ms]
+    if within:
+        return max(within, key=lambda result: result['itemsPerSecond'])
+    return min(pinned, key=lambda result: result['p95Ms'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--services', default='plant,area', help='Comma-separated subset of plant,area')
+    parser.add_argument('--batch-sizes', default='1,4,8,16')
+    parser.add_argument('--seconds', type=float, default=3.0, help='Measured time per setting')
+    parser.add_argument('--max-workers', type=int, default=8)
+    parser.add_argument('--area-cores', type=int, help='Cores set aside for the area service (default: a quarter)')
+    parser.add_argument('--max-p95-ms', type=float, default=500, help='Latency budget per forward pass; 0 for none')
+    parser.add_argument('--config', default=os.path.join(BACKEND_DIR, 'tuning.json'), help='tuning.json to write')
+    parser.add_argument('--dry-run', action='store_true', help='Do not write --config')
+    parser.add_argument('--results', help='Write every measurement as JSON to this file')
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    services = args.services.split(',')
+    unknown = set(services) - set(SERVICES)
+    if unknown:
+        parser.error(f"Unknown service(s): {', '.join(sorted(unknown))}")
+    batch_sizes = [int(size) for size in args.batch_sizes.split(',')]
+    cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count() or 1))
+    slices = split_cores(cpus, args.area_cores or len(cpus) // 4)
+
+    results = []
+    config = {}
+    for service in services:
+        module = load_service(service)
+        service_results = []
+        for workers, threads, affinity in candidates(slices[service], args.max_workers):
+            for batch_size in batch_sizes:
+                result = measure(service, module, workers, threads, affinity, batch_size, args.seconds)
+                service_results.append(result)
+                if not args.json:
+                    print(f"{result['name']:<48}{'pinned' if result['pinned'] else 'default':>9}"
+                          f"{result['itemsPerSecond']:>10}/s  p50 {result['p50Ms']:>9} ms  p95 {result['p95Ms']:>9} ms")
+        best = recommend(service_results, args.max_p95_ms)
+        config[service] = {
+            'workers': best['workers'],
+            'torchThreads': best['threads'],
+            'batchMaxSize': best['batchSize'],
+            'cpuAffinity': best['cpuAffinity'],
+            'itemsPerSecond': best['itemsPerSecond'],
+            'p95Ms': best['p95Ms']
+        }
+        results += service_results
+
+    if not args.dry_run:
+        existing = {}
+        if os.path.exists(args.config):
+            with open(args.config) as f:
+                existing = json.load(f)
+        # A partial sweep (--services plant) keeps the other service's section
+        existing.update(config)
+        existing['environment'] = environment()
+        with open(args.config, 'w') as f:
+            json.dump(existing, f, indent=2)
+        print(f"Wrote {args.config}")
+    emit('tune', results, args.results, args.json)
+    if not args.json:
+        for service, settings in config.items():
+            print(f"{service}: {settings['workers']} worker(s) x {settings['torchThreads']} thread(s), "
+                  f"batch {settings['batchMaxSize']}, cpus {settings['cpuAffinity']} "
+                  f"-> {settings['itemsPerSecond']}/s, p95 {settings['p95Ms']} ms")
+
+
+if __name__ == '__main__':
+    main()
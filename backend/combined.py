@@ -0,0 +1,101 @@
+"""Serve the plant service (app.py) and the area service (area_analyzer.py) from one process
+
+    python combined.py                                  # /analyze, /analyze-batch, /plant-search and /analyze-area on port 5000
+    MODEL_MEMORY_BUDGET_MB=200 MODEL_IDLE_SECONDS=600 python combined.py
+
+Both services share one copy of torch, cv2 and Flask. Their models sit in a
+ModelRegistry: each is loaded the first time a request needs it, pinned while
+requests use it, and unloaded when idle or when another model needs the room
+under the memory budget. app.py and area_analyzer.py still run standalone.
+"""
+import os
+from flask import Flask, request, jsonify, g
+from flask_cors import CORS
+from model_registry import ModelRegistry
+import metrics
+import perenual
+import tuning
+import app as plant_service
+import area_analyzer as area_service
+
+# 0 disables the budget / idle eviction
+MODEL_MEMORY_BUDGET_MB = float(os.environ.get('MODEL_MEMORY_BUDGET_MB', 0))
+MODEL_IDLE_SECONDS = float(os.environ.get('MODEL_IDLE_SECONDS', 0))
+COMBINED_PORT = int(os.environ.get('COMBINED_PORT', 5000))
+
+registry = ModelRegistry(int(MODEL_MEMORY_BUDGET_MB * 1024 * 1024), MODEL_IDLE_SECONDS)
+registry.register('efficientnet', plant_service.model_loader, plant_service.unload_model, plant_service.model_footprint)
+registry.register('unet', area_service.model_loader, area_service.unload_model, area_service.model_footprint)
+
+app = Flask(__name__)
+CORS(app)
+# Registered first so requests rejected by load_required_model are still counted
+metrics.instrument_flask(app, 'combined')
+
+# Each service keeps its own /health, /ready and /metrics; the combined ones cover both
+for service_app in (plant_service.app, area_service.app):
+    for rule in service_app.url_map.iter_rules():
+        if rule.endpoint in ('static', 'health_check', 'readiness_check', 'metrics'):
+            continue
+        app.add_url_rule(rule.rule, rule.endpoint, service_app.view_functions[rule.endpoint], methods=rule.methods)
+
+
+def requested_area_mode():
+    """The /analyze-area mode from the query string, form fields or JSON body"""
+    mode = request.args.get('mode') or request.form.get('mode')
+    if not mode and request.is_json:
+        mode = (request.get_json(silent=True) or {}).get('mode')
+    return mode or 'hsv'
+
+
+def required_model():
+    """Registry model the current request needs, if any"""
+    if request.endpoint in ('analyze_plant', 'analyze_batch', 'analyze_video', 'similar_cases'):
+        return 'efficientnet'
+    if request.endpoint == 'analyze_planting_area' and requested_area_mode() == 'unet':
+        return 'unet'
+    return None
+
+
+@app.before_request
+def load_required_model():
+    registry.start_reaper()
+    name = required_model()
+    if name is None:
+        return None
+    if not registry.acquire(name):
+        return jsonify({'error': f'Model {name} failed to load'}), 503
+    g.registry_model = name
+    return None
+
+
+@app.teardown_request
+def release_model(exc):
+    # Runs after streamed responses (/analyze-batch) finish, so the model stays pinned until then
+    name = g.pop('registry_model', None)
+    if name is not None:
+        registry.release(name)
+
+
+@app.route('/health', methods=['GET'])
+def health_check():
+    return jsonify({
+        'status': 'healthy',
+        'models': registry.stats(),
+        'feature_cache': plant_service.feature_cache.stats(),
+        'perenual_cache': perenual.cache_stats()
+    })
+
+
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """Ready as soon as the process is up: models load on first use, so only a failed load is unready"""
+    failed = [name for name, entry in registry.models.items() if entry.loader.state == 'failed']
+    return jsonify({'ready': not failed, 'failed': failed, 'models': registry.stats()['models']}), 503 if failed else 200
+
+
+if __name__ == '__main__':
+    # Both models share this process, so it takes the plant service's tuned threads
+    tuning.apply('plant')
+    print(f"Starting combined server (models load on first use, budget {MODEL_MEMORY_BUDGET_MB or 'unlimited'} MB)...")
+    app.run(debug=True, host='0.0.0.0', port=COMBINED_PORT, use_reloader=False)
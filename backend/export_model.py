@@ -0,0 +1,89 @@
+"""Export the EfficientNet-B0 feature extractor for the TorchScript and ONNX backends
+
+    python export_model.py                      # writes models/ and checks equivalence
+    python export_model.py --format onnx --out /srv/groweasy/models
+    python export_model.py --format weights --out /srv/groweasy/weights   # local weight store
+    INFERENCE_BACKEND=onnx python app.py        # serve the exported graph
+
+The equivalence check runs a batch through every backend and compares the
+pooled 1280-d features against eager PyTorch.
+"""
+import argparse
+import glob
+import os
+import sys
+import torch
+from inference_backends import (
+    EagerBackend, create_backend, export_torchscript, export_onnx, compare_features,
+    load_efficientnet, save_efficientnet_weights
+)
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_WEIGHTS_DIR = os.environ.get('MODEL_WEIGHTS_DIR') or None
+
+
+def load_sample_batch(image_dir, batch_size):
+    """Preprocessed images from image_dir, or random inputs when no directory is given"""
+    if not image_dir:
+        torch.manual_seed(0)
+        return torch.randn(batch_size, 3, 224, 224)
+    from torchvision import transforms
+    from image_io import open_image
+    transform = transforms.Compose([
+        transforms.Resize((224, 224)),
+        transforms.ToTensor(),
+        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
+    ])
+    paths = sorted(glob.glob(os.path.join(image_dir, '*')))[:batch_size]
+    tensors = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            tensors.append(transform(open_image(f.read(), target_size=(224, 224))))
+    return torch.stack(tensors)
+
+
+def verify(export_dir, formats, batch, atol):
+    """Compare each exported backend against eager PyTorch; returns True when all pass"""
+    device = torch.device('cpu')
+    reference = EagerBackend(load_efficientnet(MODEL_WEIGHTS_DIR).eval(), device)(batch)
+    ok = True
+    for name in formats:
+        features = create_backend(name, device, export_dir)(batch)
+        stats = compare_features(reference, features)
+        passed = stats['maxAbsDiff'] <= atol
+        ok = ok and passed
+        print(f"{name:<12} max |diff| {stats['maxAbsDiff']:.2e}  min cosine {stats['minCosine']:.6f}  {'OK' if passed else 'MISMATCH'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--format', choices=['torchscript', 'onnx', 'all', 'weights'], default='all')
+    parser.add_argument('--out', default=os.environ.get('MODEL_EXPORT_DIR', os.path.join(BACKEND_DIR, 'models')))
+    parser.add_argument('--no-verify', action='store_true', help='Skip the numerical equivalence check')
+    parser.add_argument('--images', help='Folder of sample photos for the equivalence check (default: random inputs)')
+    parser.add_argument('--batch-size', type=int, default=4)
+    parser.add_argument('--atol', type=float, default=1e-3, help='Maximum allowed absolute feature difference')
+    args = parser.parse_args()
+
+    if args.format == 'weights':
+        # Populate MODEL_WEIGHTS_DIR so servers start without network access
+        print(f"Saved weights: {save_efficientnet_weights(load_efficientnet(), args.out)}")
+        return
+
+    formats = ['torchscript', 'onnx'] if args.format == 'all' else [args.format]
+    for name in formats:
+        # Export from a fresh model each time; export switches it to the traceable Swish
+        model = load_efficientnet(MODEL_WEIGHTS_DIR).eval()
+        exporter = export_torchscript if name == 'torchscript' else export_onnx
+        print(f"Exported {name}: {exporter(model, args.out)}")
+
+    if args.no_verify:
+        return
+    batch = load_sample_batch(args.images, args.batch_size)
+    if not verify(args.out, formats, batch, args.atol):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
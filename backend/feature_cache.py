@@ -0,0 +1,107 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+class FeatureCache:
+    """Content-addressed cache of pooled feature vectors with an LRU memory tier and optional disk tier"""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, disk_dir=None):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(image_bytes, model_id):
+        """Digest of the uploaded image bytes plus the model that produced the features"""
+        digest = hashlib.sha256(model_id.encode('utf-8'))
+        digest.update(image_bytes)
+        return digest.hexdigest()
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], f"{key}.npy")
+
+    def get(self, key):
+        """Return the cached feature vector for key, or None"""
+        with self._lock:
+            features = self._entries.get(key)
+            if features is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return features
+
+        features = self._load_from_disk(key)
+        with self._lock:
+            if features is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._store(key, features)
+        return features
+
+    def put(self, key, features):
+        """Cache a feature vector in memory and, if configured, on disk"""
+        features = np.asarray(features, dtype=np.float32)
+        with self._lock:
+            self._store(key, features)
+        if self.disk_dir:
+            self._save_to_disk(key, features)
+
+    def _store(self, key, features):
+        if features.nbytes > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= previous.nbytes
+        self._entries[key] = features
+        self._bytes += features.nbytes
+        # Evict least recently used entries until we are back under budget
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.nbytes
+
+    def _load_from_disk(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            # float16 on disk, memory-mapped so only the vector itself is paged in
+            return np.load(path, mmap_mode='r').astype(np.float32)
+        except Exception as e:
+            print(f"Error reading cached features {key}: {e}")
+            return None
+
+    def _save_to_disk(self, key, features):
+        path = self._disk_path(key)
+        if os.path.exists(path):
+            return
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temp file and rename so readers never see a partial array
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                np.save(f, features.astype(np.float16))
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"Error writing cached features {key}: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'maxBytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'diskDir': self.disk_dir
+            }
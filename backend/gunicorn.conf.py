@@ -0,0 +1,25 @@
+import os
+import tuning
+import wsgi
+
+# tuning.json sections are per service; the combined service runs the plant model's settings
+TUNED_SERVICE = 'area' if os.environ.get('GROWEASY_SERVICE') == 'area' else 'plant'
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS', tuning.setting(TUNED_SERVICE, 'workers', 2)))
+# Threads let concurrent requests meet in the micro-batchers inside each worker
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+
+# Load the app (and model weights) once in the master; workers share them copy-on-write
+preload_app = wsgi.PRELOAD
+
+
+def post_fork(server, worker):
+    # Split the cores between workers instead of every worker spawning one thread per core
+    default_threads = max(1, (os.cpu_count() or 1) // server.cfg.workers)
+    # worker.age counts spawns from 1, so replacement workers cycle through the tuned affinity sets
+    torch_threads, cpus = tuning.worker_settings(TUNED_SERVICE, worker.age - 1, default_threads)
+    wsgi.init_worker(torch_threads, cpus)
+    server.log.info(f"Worker {worker.pid}: torch threads={torch_threads}, cpus={cpus or 'all'}")
@@ -0,0 +1,350 @@
+import json
+import math
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines: in-process locking only
+    fcntl = None
+
+# One fixed-width row per analysis; features live in a parallel float16 file
+RECORD_DTYPE = np.dtype([
+    ('timestamp', '<f8'),
+    ('days', '<i4'),
+    ('confidence', '<f4'),
+    ('stage_index', '<i2'),
+    ('total_stages', '<i2'),
+    ('overall_health', 'u1'),
+    ('anomalies', 'u1')
+])
+OVERALL_HEALTH = ('poor', 'fair', 'good', 'excellent')
+# Plant ids are issued by create() (uuid4 hex), so one cannot be guessed from another or collide
+PLANT_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+STATS_VERSION = 1
+
+
+def _welford(summary, value):
+    """Fold value into a {n, mean, m2} running mean/variance"""
+    summary['n'] += 1
+    delta = value - summary['mean']
+    summary['mean'] += delta / summary['n']
+    summary['m2'] += delta * (value - summary['mean'])
+
+
+def _std(summary):
+    return math.sqrt(summary['m2'] / summary['n']) if summary['n'] > 1 else 0.0
+
+
+def _cosine_distance(a, b):
+    norm = float(np.linalg.norm(a) * np.linalg.norm(b))
+    return 1.0 - float(np.dot(a, b)) / norm if norm else 0.0
+
+
+class UnknownPlant(KeyError):
+    """The plant id was never issued by create(), or its history has been deleted"""
+
+
+class HistoryStore:
+    """Append-only per-plant analysis history: columnar memory-mapped files plus running trend statistics"""
+
+    def __init__(self, root_dir, feature_dim=1280, ema_alpha=0.3):
+        self.root_dir = root_dir
+        self.feature_dim = feature_dim
+        self.ema_alpha = ema_alpha
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        os.makedirs(root_dir, exist_ok=True)
+
+    @staticmethod
+    def valid_plant_id(plant_id):
+        return isinstance(plant_id, str) and PLANT_ID_PATTERN.match(plant_id) is not None
+
+    def create(self):
+        """Issue a new, unguessable plant id with an empty history"""
+        plant_id = uuid.uuid4().hex
+        os.makedirs(self._paths(plant_id)['dir'])
+        return plant_id
+
+    def exists(self, plant_id):
+        """True for ids issued by create() whose history has not been deleted"""
+        return os.path.isdir(self._paths(plant_id)['dir'])
+
+    def _paths(self, plant_id):
+        plant_dir = os.path.join(self.root_dir, plant_id)
+        return {
+            'dir': plant_dir,
+            'records': os.path.join(plant_dir, 'records.bin'),
+            'features': os.path.join(plant_dir, 'features.f16'),
+            'stats': os.path.join(plant_dir, 'stats.json'),
+            'lock': os.path.join(plant_dir, 'lock')
+        }
+
+    def _thread_lock(self, plant_id):
+        with self._locks_lock:
+            return self._locks.setdefault(plant_id, threading.Lock())
+
+    def _empty_stats(self):
+        return {
+            'version': STATS_VERSION,
+            'count': 0,
+            'featureDim': self.feature_dim,
+            'plantType': None,
+            'firstTimestamp': None,
+            'lastTimestamp': None,
+            'confidence': {'n': 0, 'mean': 0.0, 'm2': 0.0, 'min': None, 'max': None, 'ema': None},
+            # Least-squares sums of confidence against days since the first photo
+            'regression': {'n': 0, 'sx': 0.0, 'sy': 0.0, 'sxx': 0.0, 'sxy': 0.0},
+            'stage': {'index': None, 'first': None, 'total': None, 'max': None, 'changes': 0, 'lastChangeTimestamp': None},
+            'overallHealth': {label: 0 for label in OVERALL_HEALTH},
+            'anomalies': {'total': 0, 'photosWithAnomalies': 0},
+            # Cosine distance between consecutive feature vectors
+            'featureDrift': {'n': 0, 'mean': 0.0, 'm2': 0.0, 'last': None}
+        }
+
+    def _read_stats(self, paths):
+        try:
+            with open(paths['stats']) as f:
+                stats = json.load(f)
+            return stats if stats.get('version') == STATS_VERSION else None
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Error reading history stats {paths['stats']}: {e}")
+            return None
+
+    def _write_stats(self, paths, stats):
+        # Write to a temp file and rename so readers never see partial stats
+        tmp_path = f"{paths['stats']}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(stats, f)
+        os.replace(tmp_path, paths['stats'])
+
+    def _file_size(self, path):
+        try:
+            return os.path.getsize(path)
+        except FileNotFoundError:
+            return 0
+
+    def _row_count(self, path, row_bytes):
+        return self._file_size(path) // row_bytes
+
+    def _fold(self, stats, record, features, previous_features, plant_type):
+        """Update running statistics with one appended row"""
+        timestamp = float(record['timestamp'])
+        confidence = float(record['confidence'])
+        stage_index = int(record['stage_index'])
+
+        if stats['firstTimestamp'] is None:
+            stats['firstTimestamp'] = timestamp
+        stats['lastTimestamp'] = timestamp
+        stats['count'] += 1
+        if plant_type:
+            stats['plantType'] = plant_type
+
+        summary = stats['confidence']
+        _welford(summary, confidence)
+        summary['min'] = confidence if summary['min'] is None else min(summary['min'], confidence)
+        summary['max'] = confidence if summary['max'] is None else max(summary['max'], confidence)
+        summary['ema'] = confidence if summary['ema'] is None else (
+            self.ema_alpha * confidence + (1 - self.ema_alpha) * summary['ema'])
+
+        x = (timestamp - stats['firstTimestamp']) / 86400
+        regression = stats['regression']
+        regression['n'] += 1
+        regression['sx'] += x
+        regression['sy'] += confidence
+        regression['sxx'] += x * x
+        regression['sxy'] += x * confidence
+
+        stage = stats['stage']
+        if stage['index'] is not None and stage_index != stage['index']:
+            stage['changes'] += 1
+            stage['lastChangeTimestamp'] = timestamp
+        if stage['first'] is None:
+            stage['first'] = stage_index
+        stage['index'] = stage_index
+        stage['total'] = int(record['total_stages'])
+        stage['max'] = stage_index if stage['max'] is None else max(stage['max'], stage_index)
+
+        stats['overallHealth'][OVERALL_HEALTH[int(record['overall_health'])]] += 1
+        stats['anomalies']['total'] += int(record['anomalies'])
+        stats['anomalies']['photosWithAnomalies'] += 1 if record['anomalies'] else 0
+
+        if previous_features is not None:
+            drift = _cosine_distance(features.astype(np.float32), previous_features.astype(np.float32))
+            _welford(stats['featureDrift'], drift)
+            stats['featureDrift']['last'] = drift
+
+    def _rebuild_stats(self, paths, count):
+        """Replay the first count rows into fresh statistics (recovery after a torn append)"""
+        stats = self._empty_stats()
+        if count == 0:
+            return stats
+        records = np.memmap(paths['records'], dtype=RECORD_DTYPE, mode='r', shape=(count,))
+        features = np.memmap(paths['features'], dtype=np.float16, mode='r', shape=(count, self.feature_dim))
+        previous = None
+        for i in range(count):
+            self._fold(stats, records[i], features[i], previous, None)
+            previous = features[i]
+        return stats
+
+    def _recover(self, paths, stats):
+        """Make the columns and stats agree; stats.json is written last, so it is the commit point"""
+        record_rows = self._row_count(paths['records'], RECORD_DTYPE.itemsize)
+        feature_rows = self._row_count(paths['features'], self.feature_dim * 2)
+        if stats is None or record_rows < stats['count'] or feature_rows < stats['count']:
+            # No usable stats, or columns lost rows the stats counted - rebuild from what is on disk
+            stats = self._rebuild_stats(paths, min(record_rows, feature_rows))
+        count = stats['count']
+        sizes = ((paths['records'], RECORD_DTYPE.itemsize), (paths['features'], self.feature_dim * 2))
+        if all(self._file_size(path) == count * row_bytes for path, row_bytes in sizes):
+            return stats
+        # Drop rows (or partial rows) from an append that never reached stats.json
+        print(f"Repairing history in {paths['dir']}: keeping {count} rows")
+        for path, row_bytes in sizes:
+            if os.path.exists(path):
+                os.truncate(path, count * row_bytes)
+        self._write_stats(paths, stats)
+        return stats
+
+    @contextmanager
+    def _locked(self, paths):
+        """Exclusive lock across threads (threading.Lock) and worker processes (flock)"""
+        with self._thread_lock(os.path.basename(paths['dir'])):
+            if fcntl is None:
+                yield
+                return
+            try:
+                lock_file = open(paths['lock'], 'a')
+            except FileNotFoundError:
+                raise UnknownPlant(os.path.basename(paths['dir']))
+            with lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                yield
+
+    def append(self, plant_id, features, result, plant_type=None, days_since_planting=0, timestamp=None):
+        """Append one /analyze result (and its feature vector) to the plant's history; returns the new count
+
+        Raises UnknownPlant when the plant has no history directory (never
+        created, or deleted meanwhile).
+        """
+        features = np.asarray(features, dtype=np.float16).reshape(-1)
+        if features.shape[0] != self.feature_dim:
+            raise ValueError(f"Expected {self.feature_dim} features, got {features.shape[0]}")
+        growth = result['growthAssessment']
+        record = np.zeros(1, dtype=RECORD_DTYPE)[0]
+        record['timestamp'] = time.time() if timestamp is None else timestamp
+        record['days'] = days_since_planting
+        record['confidence'] = result['confidence']
+        record['stage_index'] = growth['currentStageIndex']
+        record['total_stages'] = growth['totalStages']
+        record['overall_health'] = OVERALL_HEALTH.index(result['overallHealth'])
+        record['anomalies'] = min(255, len(result['anomalies'].get('issues', [])))
+
+        paths = self._paths(plant_id)
+        with self._locked(paths):
+            # Checked under the lock: only create() makes the directory, so a concurrent delete cannot
+            # be undone by an append recreating it
+            if not os.path.isdir(paths['dir']):
+                raise UnknownPlant(plant_id)
+            stats = self._recover(paths, self._read_stats(paths))
+            previous = None
+            if stats['count']:
+                # Only the last row is paged in, however long the history is
+                previous = np.memmap(paths['features'], dtype=np.float16, mode='r',
+                                     offset=(stats['count'] - 1) * self.feature_dim * 2, shape=(self.feature_dim,))
+                previous = np.array(previous)
+            with open(paths['features'], 'ab') as f:
+                f.write(features.tobytes())
+            with open(paths['records'], 'ab') as f:
+                f.write(record.tobytes())
+            self._fold(stats, record, features, previous, plant_type)
+            self._write_stats(paths, stats)
+            return stats['count']
+
+    def timeline(self, plant_id, limit=50, offset=0):
+        """Return (total, rows) for up to limit analyses, newest first, skipping the newest offset"""
+        paths = self._paths(plant_id)
+        stats = self._read_stats(paths)
+        total = self._row_count(paths['records'], RECORD_DTYPE.itemsize)
+        if stats is not None:
+            # Rows past the stats count belong to an append still in progress
+            total = min(total, stats['count'])
+        end = max(0, total - offset)
+        start = max(0, end - limit)
+        if end == start:
+            return total, []
+        records = np.memmap(paths['records'], dtype=RECORD_DTYPE, mode='r', offset=start * RECORD_DTYPE.itemsize,
+                            shape=(end - start,))
+        rows = []
+        for record in records[::-1]:
+            rows.append({
+                'timestamp': float(record['timestamp']),
+                'daysSincePlanting': int(record['days']),
+                'confidence': round(float(record['confidence']), 4),
+                'stageIndex': int(record['stage_index']),
+                'totalStages': int(record['total_stages']),
+                'overallHealth': OVERALL_HEALTH[int(record['overall_health'])],
+                'anomalyCount': int(record['anomalies'])
+            })
+        return total, rows
+
+    def trends(self, plant_id):
+        """Trend summary from the running statistics; cost does not depend on history length"""
+        stats = self._read_stats(self._paths(plant_id))
+        if stats is None or stats['count'] == 0:
+            return None
+        confidence = stats['confidence']
+        regression = stats['regression']
+        denominator = regression['n'] * regression['sxx'] - regression['sx'] ** 2
+        slope = (regression['n'] * regression['sxy'] - regression['sx'] * regression['sy']) / denominator \
+            if regression['n'] > 1 and denominator > 1e-12 else 0.0
+        drift = stats['featureDrift']
+        stage = stats['stage']
+        span_days = (stats['lastTimestamp'] - stats['firstTimestamp']) / 86400
+        return {
+            'count': stats['count'],
+            'plantType': stats['plantType'],
+            'firstAnalysis': stats['firstTimestamp'],
+            'lastAnalysis': stats['lastTimestamp'],
+            'spanDays': round(span_days, 2),
+            'confidence': {
+                'mean': round(confidence['mean'], 4),
+                'std': round(_std(confidence), 4),
+                'min': round(confidence['min'], 4),
+                'max': round(confidence['max'], 4),
+                'ema': round(confidence['ema'], 4),
+                'slopePerDay': round(slope, 5)
+            },
+            'stage': {
+                'currentIndex': stage['index'],
+                'maxIndex': stage['max'],
+                'totalStages': stage['total'],
+                'changes': stage['changes'],
+                'lastChange': stage['lastChangeTimestamp'],
+                'stagesPerWeek': round((stage['max'] - stage['first']) / span_days * 7, 3) if span_days > 0 else None
+            },
+            'overallHealth': stats['overallHealth'],
+            'anomalies': stats['anomalies'],
+            'featureDrift': {
+                'last': None if drift['last'] is None else round(drift['last'], 5),
+                'mean': round(drift['mean'], 5),
+                'std': round(_std(drift), 5)
+            }
+        }
+
+    def delete(self, plant_id):
+        """Remove a plant's history; returns True if there was one"""
+        paths = self._paths(plant_id)
+        if not os.path.isdir(paths['dir']):
+            return False
+        with self._locked(paths):
+            shutil.rmtree(paths['dir'], ignore_errors=True)
+        return True
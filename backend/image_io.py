@@ -0,0 +1,222 @@
+import base64
+import binascii
+import io
+import os
+import cv2
+import numpy as np
+from PIL import Image, ImageOps
+from werkzeug.exceptions import RequestEntityTooLarge
+
+# Largest request body the image endpoints read (multipart, raw or base64 JSON)
+IMAGE_MAX_UPLOAD_MB = float(os.environ.get('IMAGE_MAX_UPLOAD_MB', 20))
+IMAGE_MAX_UPLOAD_BYTES = int(IMAGE_MAX_UPLOAD_MB * 1024 * 1024)
+# Largest width x height an image header may declare; checked before any pixel is decoded
+IMAGE_MAX_PIXELS = int(os.environ.get('IMAGE_MAX_PIXELS', 100_000_000))
+# Uploads go through open_checked(), which refuses oversized images instead of PIL warning about them
+Image.MAX_IMAGE_PIXELS = None
+
+# cv2 flags that decode JPEGs at 1/2, 1/4 or 1/8 scale in the DCT domain
+CV2_REDUCED_FLAGS = [
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2)
+]
+
+
+# EXIF orientation -> the transpose that makes the image upright (as ImageOps.exif_transpose)
+EXIF_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90
+}
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class ImageTooLarge(UploadTooLarge):
+    pass
+
+
+class InvalidUpload(ValueError):
+    pass
+
+
+def upload_limit_message(max_bytes, what='Upload'):
+    return f"{what} larger than {max_bytes / (1024 * 1024):g} MB"
+
+
+def check_pixels(width, height, max_pixels=IMAGE_MAX_PIXELS):
+    """Raise ImageTooLarge when a header declares more than max_pixels (0 disables the check)"""
+    if max_pixels and width * height > max_pixels:
+        raise ImageTooLarge(f"Image of {width}x{height} pixels is over the {max_pixels} pixel limit")
+
+
+def open_checked(image_data, max_pixels=IMAGE_MAX_PIXELS):
+    """Lazily opened PIL image whose header passed check_pixels; nothing is decoded yet"""
+    image = Image.open(io.BytesIO(image_data))
+    check_pixels(*image.size, max_pixels)
+    return image
+
+
+def image_size(image_data, max_pixels=IMAGE_MAX_PIXELS):
+    """(width, height) from the image header, enforcing max_pixels
+
+    Images whose header PIL cannot read are refused too, so OpenCV is never
+    handed dimensions that were not checked.
+    """
+    try:
+        return open_checked(image_data, max_pixels).size
+    except ImageTooLarge:
+        raise
+    except Exception:
+        raise ValueError("Unsupported image format")
+
+
+def decode_base64_image(image_data):
+    """Decode a base64 string or data URL into raw image bytes; raises InvalidUpload for anything else"""
+    if not isinstance(image_data, str):
+        raise InvalidUpload('Image must be a base64 string')
+    # Strip the "data:image/...;base64," prefix if present
+    comma = image_data.find(',')
+    if comma != -1:
+        image_data = image_data[comma + 1:]
+    try:
+        return base64.b64decode(image_data)
+    except (binascii.Error, TypeError, ValueError):
+        raise InvalidUpload('Invalid base64 image data')
+
+
+def read_image_upload(req, field='image', max_bytes=IMAGE_MAX_UPLOAD_BYTES):
+    """Read image bytes and form fields from a multipart, raw image/* or base64 JSON request
+
+    Bodies over max_bytes raise UploadTooLarge: at once when Content-Length
+    says so, otherwise as soon as Werkzeug has read that much.
+    """
+    if max_bytes:
+        if req.content_length is not None and req.content_length > max_bytes:
+            raise UploadTooLarge(upload_limit_message(max_bytes))
+        req.max_content_length = max_bytes
+    try:
+        return _read_image_upload(req, field)
+    except RequestEntityTooLarge:
+        raise UploadTooLarge(upload_limit_message(max_bytes))
+
+
+def _read_image_upload(req, field):
+    mimetype = req.mimetype or ''
+
+    # multipart/form-data: image file part plus plain form fields
+    if mimetype == 'multipart/form-data':
+        fields = req.form.to_dict()
+        upload = req.files.get(field)
+        if upload is None:
+            return None, fields
+        return upload.read(), fields
+
+    # Raw image body: metadata travels in the query string
+    if mimetype.startswith('image/') or mimetype == 'application/octet-stream':
+        return req.get_data(cache=False), req.args.to_dict()
+
+    # Legacy JSON body with a base64 data URL
+    data = req.get_json(silent=True)
+    if not data or field not in data:
+        return None, data or {}
+    return decode_base64_image(data[field]), data
+
+
+def open_image(image_data, target_size=None):
+    """Open image bytes (or a legacy base64 string) as an upright RGB PIL image
+
+    With target_size, JPEGs are decoded in draft mode at the smallest DCT
+    scale that still covers the target, instead of at full resolution.
+    """
+    if isinstance(image_data, str):
+        image_data = decode_base64_image(image_data)
+    image = open_checked(image_data)
+    if target_size is not None:
+        # The EXIF rotation may swap width and height, so cover the larger side both ways
+        side = max(target_size)
+        image.draft('RGB', (side, side))
+    image = ImageOps.exif_transpose(image)
+    return image.convert('RGB')
+
+
+def decode_rgb_array(image_data, size):
+    """Decode to an upright RGB uint8 array of exactly size (width, height) with PIL
+
+    Same pixels as open_image(...).resize(size, BILINEAR) for upright RGB JPEGs, but
+    the image is shrunk before EXIF rotation and the full-size decode is
+    dropped as soon as the small copy exists, instead of living on through
+    a rotated and a converted full-size copy.
+    """
+    if isinstance(image_data, str):
+        image_data = decode_base64_image(image_data)
+    image = open_checked(image_data)
+    image.draft('RGB', (max(size), max(size)))
+    transpose = EXIF_TRANSPOSE.get(image.getexif().get(0x0112))
+    if transpose in (Image.Transpose.TRANSPOSE, Image.Transpose.ROTATE_270,
+                     Image.Transpose.TRANSVERSE, Image.Transpose.ROTATE_90):
+        # Shrink to the rotated size so the rotation lands on the requested one
+        size = (size[1], size[0])
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    small = image.resize(size, Image.BILINEAR)
+    image.close()  # frees the full-size pixels now, not when the request ends
+    if transpose is not None:
+        small = small.transpose(transpose)
+    return np.array(small)
+
+
+def _reduced_flag(image_data, size):
+    """Pick the largest cv2 reduced-decode flag that keeps the image at least as big as size"""
+    width, height = image_size(image_data)
+    for factor, flag in CV2_REDUCED_FLAGS:
+        if width // factor >= size[0] and height // factor >= size[1]:
+            return flag
+    return cv2.IMREAD_COLOR
+
+
+def decode_image_array(image_data, size):
+    """Decode straight to an RGB uint8 array of exactly size (width, height) using OpenCV"""
+    if isinstance(image_data, str):
+        image_data = decode_base64_image(image_data)
+    buffer = np.frombuffer(image_data, dtype=np.uint8)
+    # OpenCV applies the EXIF orientation while decoding
+    image = cv2.imdecode(buffer, _reduced_flag(image_data, size))
+    if image is None:
+        # Formats OpenCV cannot read (e.g. some WebP/GIF builds) go through PIL
+        return np.array(open_image(image_data, target_size=size).resize(size, Image.BILINEAR))
+    image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+
+def decode_image_bgr_bounded(image_data, max_pixels):
+    """Decode to a BGR uint8 array at the highest resolution that fits within max_pixels"""
+    if isinstance(image_data, str):
+        image_data = decode_base64_image(image_data)
+    width, height = image_size(image_data)
+
+    flag = cv2.IMREAD_COLOR
+    if width * height > max_pixels:
+        # Let the JPEG decoder drop resolution in the DCT domain rather than decoding full size
+        flag = CV2_REDUCED_FLAGS[0][1]
+        for factor, reduced_flag in reversed(CV2_REDUCED_FLAGS):
+            if (width // factor) * (height // factor) <= max_pixels:
+                flag = reduced_flag
+                break
+
+    image = cv2.imdecode(np.frombuffer(image_data, dtype=np.uint8), flag)
+    if image is None:
+        raise ValueError("Unsupported image format")
+    pixels = image.shape[0] * image.shape[1]
+    if pixels > max_pixels:
+        scale = (max_pixels / pixels) ** 0.5
+        size = (max(1, int(image.shape[1] * scale)), max(1, int(image.shape[0] * scale)))
+        image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+    return image
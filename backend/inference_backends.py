@@ -0,0 +1,151 @@
+import os
+import numpy as np
+import torch
+import torch.nn as nn
+
+BACKENDS = ('eager', 'torchscript', 'onnx', 'onnx-int8', 'onnx-int8-dynamic')
+WEIGHTS_FILENAME = 'efficientnet-b0.pth'
+TORCHSCRIPT_FILENAME = 'efficientnet-b0-features.pt'
+ONNX_FILENAME = 'efficientnet-b0-features.onnx'
+# INT8 graphs written by quantize_model.py
+ONNX_INT8_FILENAME = 'efficientnet-b0-features.int8.onnx'
+ONNX_INT8_DYNAMIC_FILENAME = 'efficientnet-b0-features.int8-dynamic.onnx'
+
+
+def load_efficientnet(weights_dir=None):
+    """EfficientNet-B0 with ImageNet weights, read from weights_dir when given (no network access)"""
+    from efficientnet_pytorch import EfficientNet  # only the eager backend and exports build the model
+    if weights_dir:
+        return EfficientNet.from_pretrained('efficientnet-b0', weights_path=os.path.join(weights_dir, WEIGHTS_FILENAME))
+    return EfficientNet.from_pretrained('efficientnet-b0')
+
+
+def save_efficientnet_weights(model, weights_dir):
+    """Write the model's state dict into the local weight store"""
+    os.makedirs(weights_dir, exist_ok=True)
+    path = os.path.join(weights_dir, WEIGHTS_FILENAME)
+    torch.save(model.state_dict(), path)
+    return path
+
+
+class FeatureExtractor(nn.Module):
+    """EfficientNet trunk plus global average pooling - the graph every backend runs"""
+
+    def __init__(self, model):
+        super(FeatureExtractor, self).__init__()
+        self.model = model
+
+    def forward(self, x):
+        features = self.model.extract_features(x)
+        return torch.nn.functional.adaptive_avg_pool2d(features, 1).flatten(1)
+
+
+class EagerBackend:
+    """Plain PyTorch eager execution"""
+    name = 'eager'
+
+    def __init__(self, model, device):
+        self.module = FeatureExtractor(model).eval()
+        self.device = device
+
+    def __call__(self, batch):
+        with torch.no_grad():
+            return self.module(batch.to(self.device)).cpu().numpy()
+
+
+class TorchScriptBackend:
+    """Traced and frozen TorchScript graph"""
+    name = 'torchscript'
+
+    def __init__(self, path, device):
+        self.module = torch.jit.load(path, map_location=device).eval()
+        self.module = torch.jit.optimize_for_inference(self.module)
+        self.device = device
+
+    def __call__(self, batch):
+        with torch.no_grad():
+            return self.module(batch.to(self.device)).cpu().numpy()
+
+
+class OnnxBackend:
+    """ONNX Runtime session on an exported (optionally INT8 quantized) graph"""
+
+    def __init__(self, path, device, name='onnx'):
+        self.name = name
+        import onnxruntime as ort  # optional dependency, only needed for this backend
+        providers = ['CPUExecutionProvider']
+        if device.type == 'cuda' and 'CUDAExecutionProvider' in ort.get_available_providers():
+            providers.insert(0, 'CUDAExecutionProvider')
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, options, providers=providers)
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, batch):
+        inputs = batch.detach().cpu().numpy().astype(np.float32, copy=False)
+        return self.session.run(None, {self.input_name: inputs})[0]
+
+
+def export_module(model):
+    """Wrap an EfficientNet for export, switching to the traceable Swish implementation"""
+    # MemoryEfficientSwish is a custom autograd function that neither tracing nor ONNX can follow
+    model.set_swish(memory_efficient=False)
+    return FeatureExtractor(model).eval().cpu()
+
+
+def export_torchscript(model, export_dir, input_size=(224, 224)):
+    """Trace, freeze and save the feature extractor as TorchScript"""
+    os.makedirs(export_dir, exist_ok=True)
+    path = os.path.join(export_dir, TORCHSCRIPT_FILENAME)
+    example = torch.randn(1, 3, *input_size)
+    with torch.no_grad():
+        traced = torch.jit.trace(export_module(model), example)
+        frozen = torch.jit.freeze(traced)
+    frozen.save(path)
+    return path
+
+
+def export_onnx(model, export_dir, input_size=(224, 224), opset=17):
+    """Export the feature extractor to ONNX with a dynamic batch dimension"""
+    os.makedirs(export_dir, exist_ok=True)
+    path = os.path.join(export_dir, ONNX_FILENAME)
+    example = torch.randn(1, 3, *input_size)
+    with torch.no_grad():
+        torch.onnx.export(
+            export_module(model), example, path,
+            input_names=['images'], output_names=['features'],
+            dynamic_axes={'images': {0: 'batch'}, 'features': {0: 'batch'}},
+            opset_version=opset
+        )
+    return path
+
+
+def create_backend(name, device, export_dir, model=None):
+    """Create the named inference backend; eager needs model, the others load from export_dir"""
+    if name == 'eager':
+        if model is None:
+            raise ValueError("The eager backend needs a loaded EfficientNet model")
+        return EagerBackend(model, device)
+    if name == 'torchscript':
+        return TorchScriptBackend(os.path.join(export_dir, TORCHSCRIPT_FILENAME), device)
+    if name == 'onnx':
+        return OnnxBackend(os.path.join(export_dir, ONNX_FILENAME), device)
+    if name == 'onnx-int8':
+        return OnnxBackend(os.path.join(export_dir, ONNX_INT8_FILENAME), device, name=name)
+    if name == 'onnx-int8-dynamic':
+        return OnnxBackend(os.path.join(export_dir, ONNX_INT8_DYNAMIC_FILENAME), device, name=name)
+    raise ValueError(f"Unknown inference backend '{name}' (expected one of {', '.join(BACKENDS)})")
+
+
+def compare_features(reference, candidate):
+    """Max absolute difference and mean/minimum per-row cosine similarity between two feature batches"""
+    reference = np.asarray(reference, dtype=np.float64)
+    candidate = np.asarray(candidate, dtype=np.float64)
+    dot = np.sum(reference * candidate, axis=1)
+    norms = np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1)
+    cosine = dot / np.maximum(norms, 1e-12)
+    return {
+        'maxAbsDiff': float(np.max(np.abs(reference - candidate))),
+        'meanCosine': float(np.mean(cosine)),
+        'minCosine': float(np.min(cosine))
+    }
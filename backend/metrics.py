@@ -0,0 +1,327 @@
+"""In-process metrics exposed in Prometheus text format on /metrics
+
+Counters, gauges and histograms are plain Python objects guarded by a lock
+per labelled series; recording a value costs a lock round trip and, for
+histograms, a bisect over the bucket bounds. Series are created on first use
+by labels(...), so label values must come from small fixed sets (endpoint
+names, stage names), never from request data.
+"""
+import bisect
+import re
+import threading
+import time
+
+# Histogram bounds in seconds, from sub-millisecond decode steps to slow upstream calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_metrics = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Timer:
+    """Context manager observing the elapsed seconds on a histogram series"""
+    __slots__ = ('series', 'started')
+
+    def __init__(self, series):
+        self.series = series
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.series.observe(time.perf_counter() - self.started)
+        return False
+
+
+class _CounterSeries:
+    __slots__ = ('value', 'lock')
+
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+
+class _GaugeSeries(_CounterSeries):
+    __slots__ = ()
+
+    def dec(self, amount=1):
+        with self.lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class _HistogramSeries:
+    __slots__ = ('bounds', 'counts', 'sum', 'lock')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self):
+        return _Timer(self)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def labels(self, *values):
+        """The series for these label values, created on first use"""
+        series = self._series.get(values)
+        if series is None:
+            with self._lock:
+                series = self._series.setdefault(values, self._new_series())
+        return series
+
+    def _new_series(self):
+        raise NotImplementedError
+
+    def samples(self):
+        """(suffix, label values, extra label, value) tuples for rendering"""
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for suffix, values, extra, value in self.samples():
+            lines.append(f'{self.name}{suffix}{_format_labels(self.labelnames, values, extra)} {_format_value(value)}')
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_series(self):
+        return _CounterSeries()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def samples(self):
+        return [('', values, None, series.value) for values, series in list(self._series.items())]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def _new_series(self):
+        return _GaugeSeries()
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help_text, labelnames)
+
+    def _new_series(self):
+        return _HistogramSeries(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def samples(self):
+        samples = []
+        for values, series in list(self._series.items()):
+            with series.lock:
+                counts = list(series.counts)
+                total = series.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                samples.append(('_bucket', values, f'le="{_format_value(float(bound))}"', cumulative))
+            samples.append(('_sum', values, None, total))
+            samples.append(('_count', values, None, cumulative))
+        return samples
+
+
+class CallbackMetric(_Metric):
+    """Counter or gauge whose values are read from fn() at scrape time: {label values tuple: value}"""
+
+    def __init__(self, name, help_text, labelnames, fn, kind='gauge'):
+        self.kind = kind
+        self.fn = fn
+        super().__init__(name, help_text, labelnames)
+
+    def samples(self):
+        try:
+            return [('', tuple(values), None, value) for values, value in self.fn().items()]
+        except Exception as e:
+            print(f"Error collecting {self.name}: {e}")
+            return []
+
+
+def render():
+    """All registered metrics in Prometheus text exposition format"""
+    lines = []
+    for metric in list(_metrics):
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# Shared metrics used across the services
+STAGE_SECONDS = Histogram('groweasy_stage_seconds', 'Time spent in each processing stage', ['stage'])
+HTTP_REQUESTS = Counter('groweasy_http_requests_total', 'HTTP requests by endpoint and status', ['service', 'endpoint', 'method', 'status'])
+HTTP_ERRORS = Counter('groweasy_http_errors_total', 'HTTP requests that ended in a 5xx status', ['service', 'endpoint'])
+HTTP_SECONDS = Histogram('groweasy_http_request_seconds', 'HTTP request latency, including streamed bodies', ['service', 'endpoint'])
+HTTP_IN_FLIGHT = Gauge('groweasy_http_requests_in_flight', 'HTTP requests currently being handled', ['service', 'endpoint'])
+BATCH_SIZE = Histogram('groweasy_batch_size', 'Items per micro-batch forward pass', ['batcher'], buckets=(1, 2, 4, 8, 16, 32, 64))
+BATCH_SECONDS = Histogram('groweasy_batch_forward_seconds', 'Time spent running one micro-batch', ['batcher'])
+ADMISSION_IN_FLIGHT = Gauge('groweasy_admission_in_flight', 'Requests admitted and running, by admission gate', ['gate'])
+ADMISSION_QUEUED = Gauge('groweasy_admission_queued', 'Requests waiting for an admission slot', ['gate'])
+ADMISSION_WAIT_SECONDS = Histogram('groweasy_admission_wait_seconds', 'Time admitted requests waited for a slot', ['gate'])
+ADMISSION_REJECTED = Counter('groweasy_admission_rejected_total', 'Requests shed by admission control', ['gate', 'reason'])
+SINGLEFLIGHT_CALLS = Counter('groweasy_singleflight_calls_total', 'Coalesced calls by role: leaders ran the work, followers shared it', ['flight', 'role'])
+
+_cache_sources = {}
+
+
+def register_cache(name, stats):
+    """Export a cache whose stats() has 'hits', 'misses' and 'entries' (and optionally 'staleHits')"""
+    _cache_sources[name] = stats
+
+
+def _cache_values(read):
+    values = {}
+    for name, stats in list(_cache_sources.items()):
+        for labels, value in read(name, stats()):
+            values[labels] = value
+    return values
+
+
+def _cache_lookups(name, stats):
+    yield (name, 'hit'), stats.get('hits', 0)
+    yield (name, 'miss'), stats.get('misses', 0)
+    if 'staleHits' in stats:
+        yield (name, 'stale'), stats['staleHits']
+
+
+CallbackMetric('groweasy_cache_lookups_total', 'Cache lookups by result', ['cache', 'result'],
+               lambda: _cache_values(_cache_lookups), kind='counter')
+CallbackMetric('groweasy_cache_entries', 'Entries currently cached', ['cache'],
+               lambda: _cache_values(lambda name, stats: [((name,), stats.get('entries', 0))]))
+
+
+def stage_timer(stage):
+    """with stage_timer('decode'): ... records the block's duration under groweasy_stage_seconds"""
+    return STAGE_SECONDS.labels(stage).time()
+
+
+def instrument_flask(app, service):
+    """Count, time and track in-flight requests of a Flask app and serve /metrics from it"""
+    from flask import Response, g, request
+
+    @app.before_request
+    def _start_request_metrics():
+        g.metrics_endpoint = request.endpoint or 'unmatched'
+        g.metrics_started = time.perf_counter()
+        HTTP_IN_FLIGHT.labels(service, g.metrics_endpoint).inc()
+
+    @app.after_request
+    def _record_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _finish_request_metrics(exc):
+        # Runs after streamed responses finish, so /analyze-batch latency covers the whole stream
+        endpoint = g.pop('metrics_endpoint', None)
+        if endpoint is None:
+            return
+        status = 500 if exc is not None else g.pop('metrics_status', 500)
+        HTTP_IN_FLIGHT.labels(service, endpoint).dec()
+        HTTP_SECONDS.labels(service, endpoint).observe(time.perf_counter() - g.pop('metrics_started'))
+        HTTP_REQUESTS.labels(service, endpoint, request.method, str(status)).inc()
+        if status >= 500:
+            HTTP_ERRORS.labels(service, endpoint).inc()
+
+    def metrics_endpoint():
+        return Response(render(), content_type=CONTENT_TYPE)
+
+    app.add_url_rule('/metrics', 'metrics', metrics_endpoint, methods=['GET'])
+
+
+class ASGIMetricsMiddleware:
+    """instrument_flask for ASGI apps; paths outside known_paths are recorded as 'unmatched'"""
+
+    def __init__(self, app, service, known_paths):
+        self.app = app
+        self.service = service
+        self.known_paths = {path for path in known_paths if '{' not in path}
+        # Templated paths like /plants/{plant_id}/trends are labelled with the template, not the raw path
+        self.path_patterns = [(re.compile('^' + re.sub(r'\{[^}]+\}', '[^/]+', path) + '$'), path)
+                              for path in known_paths if '{' in path]
+
+    def _endpoint(self, path):
+        if path in self.known_paths:
+            return path
+        for pattern, template in self.path_patterns:
+            if pattern.match(path):
+                return template
+        return 'unmatched'
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        endpoint = self._endpoint(scope['path'])
+        status = 500
+        started = time.perf_counter()
+        HTTP_IN_FLIGHT.labels(self.service, endpoint).inc()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_IN_FLIGHT.labels(self.service, endpoint).dec()
+            HTTP_SECONDS.labels(self.service, endpoint).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(self.service, endpoint, scope['method'], str(status)).inc()
+            if status >= 500:
+                HTTP_ERRORS.labels(self.service, endpoint).inc()
@@ -0,0 +1,180 @@
+import ctypes
+import gc
+import os
+import threading
+import time
+
+
+def current_rss_bytes():
+    """Resident set size of this process (Linux), or None elsewhere"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def release_freed_memory():
+    """Collect garbage and hand freed heap pages back to the OS so eviction shows up in RSS"""
+    gc.collect()
+    try:
+        ctypes.CDLL('libc.so.6').malloc_trim(0)
+    except (OSError, AttributeError):
+        pass  # not glibc
+
+
+def tensor_bytes(module):
+    """Bytes held by a torch module's parameters and buffers"""
+    tensors = list(module.parameters()) + list(module.buffers())
+    return sum(tensor.numel() * tensor.element_size() for tensor in tensors)
+
+
+class RegisteredModel:
+    """A model the registry can load on demand and unload when idle"""
+
+    def __init__(self, name, loader, unload, footprint=None):
+        self.name = name
+        self.loader = loader
+        self.unload = unload
+        self.footprint = footprint
+        self.footprint_bytes = 0
+        self.rss_delta_bytes = None
+        self.in_use = 0
+        self.last_used = None
+        self.loads = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self.loader.state in ('loaded', 'warming_up', 'ready')
+
+
+class ModelRegistry:
+    """Lazily load models on first use, track their memory footprint and evict idle ones under a budget"""
+
+    def __init__(self, memory_budget_bytes=0, idle_seconds=0):
+        # 0 disables the budget / idle eviction
+        self.memory_budget_bytes = memory_budget_bytes
+        self.idle_seconds = idle_seconds
+        self.models = {}
+        self._lock = threading.Lock()
+        self._reaper = None
+        self._reaper_pid = None
+
+    def register(self, name, loader, unload, footprint=None):
+        """Add a model: loader is its ModelLoader, unload drops its globals, footprint returns its size in bytes (or None)"""
+        self.models[name] = RegisteredModel(name, loader, unload, footprint)
+
+    def acquire(self, name):
+        """Load the model if needed and pin it against eviction until release(); returns False if loading failed"""
+        entry = self.models[name]
+        with entry.lock:
+            if not entry.loaded:
+                self._load(entry)
+            if not entry.loader.ready:
+                return False
+            with self._lock:
+                entry.in_use += 1
+                entry.last_used = time.monotonic()
+        self._enforce_budget(keep=name)
+        return True
+
+    def release(self, name):
+        entry = self.models[name]
+        with self._lock:
+            entry.in_use = max(0, entry.in_use - 1)
+            entry.last_used = time.monotonic()
+
+    def _load(self, entry):
+        entry.loader.reset()
+        rss_before = current_rss_bytes()
+        entry.loader.run()
+        rss_after = current_rss_bytes()
+        if rss_before is not None and rss_after is not None:
+            entry.rss_delta_bytes = max(0, rss_after - rss_before)
+        # Exact tensor sizes when the model reports them, else the RSS growth during load
+        reported = entry.footprint() if entry.footprint is not None else None
+        entry.footprint_bytes = reported or entry.rss_delta_bytes or 0
+        entry.loads += 1
+        print(f"Model registry: loaded {entry.name} ({entry.footprint_bytes / (1024 * 1024):.1f} MB)")
+
+    def evict(self, name):
+        """Unload a model unless a request is using it; returns True if it was unloaded"""
+        entry = self.models[name]
+        with entry.lock:
+            with self._lock:
+                if entry.in_use or not entry.loaded:
+                    return False
+            entry.unload()
+            entry.loader.reset()
+            entry.footprint_bytes = 0
+            entry.evictions += 1
+        release_freed_memory()
+        print(f"Model registry: evicted {name}")
+        return True
+
+    def loaded_bytes(self):
+        return sum(entry.footprint_bytes for entry in self.models.values() if entry.loaded)
+
+    def _enforce_budget(self, keep=None):
+        """Evict least recently used idle models until the loaded footprint fits the budget"""
+        if not self.memory_budget_bytes:
+            return
+        candidates = sorted(
+            (entry for entry in self.models.values() if entry.loaded and entry.name != keep),
+            key=lambda entry: entry.last_used or 0
+        )
+        for entry in candidates:
+            if self.loaded_bytes() <= self.memory_budget_bytes:
+                return
+            self.evict(entry.name)
+        if self.loaded_bytes() > self.memory_budget_bytes:
+            print(f"Model registry: {self.loaded_bytes() / (1024 * 1024):.1f} MB loaded exceeds the budget; no idle model is left to evict")
+
+    def evict_idle(self):
+        """Unload models nobody has used for idle_seconds"""
+        if not self.idle_seconds:
+            return
+        now = time.monotonic()
+        for entry in list(self.models.values()):
+            if entry.loaded and entry.last_used is not None and now - entry.last_used >= self.idle_seconds:
+                self.evict(entry.name)
+
+    def start_reaper(self):
+        """Check for idle models periodically on a background thread (restarted in forked workers)"""
+        if not self.idle_seconds or self._reaper_pid == os.getpid():
+            return
+        interval = max(1.0, min(self.idle_seconds / 2, 30.0))
+
+        def reap():
+            while True:
+                time.sleep(interval)
+                self.evict_idle()
+
+        with self._lock:
+            if self._reaper_pid == os.getpid():
+                return
+            self._reaper_pid = os.getpid()
+            self._reaper = threading.Thread(target=reap, name='model-reaper', daemon=True)
+            self._reaper.start()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'memoryBudgetMb': round(self.memory_budget_bytes / (1024 * 1024), 1),
+                'loadedMb': round(self.loaded_bytes() / (1024 * 1024), 1),
+                'idleSeconds': self.idle_seconds,
+                'models': {
+                    entry.name: {
+                        'state': entry.loader.state,
+                        'footprintMb': round(entry.footprint_bytes / (1024 * 1024), 1),
+                        'rssDeltaMb': round(entry.rss_delta_bytes / (1024 * 1024), 1) if entry.rss_delta_bytes is not None else None,
+                        'inUse': entry.in_use,
+                        'idleSeconds': round(time.monotonic() - entry.last_used, 1) if entry.last_used is not None else None,
+                        'loads': entry.loads,
+                        'evictions': entry.evictions
+                    }
+                    for entry in self.models.values()
+                }
+            }
@@ -0,0 +1,303 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+import requests
+from requests.adapters import HTTPAdapter
+from ttl_cache import TTLCache
+import metrics
+from metrics import stage_timer
+
+# Perenual API endpoint
+# You'll need to get a free API key from https://perenual.com/docs/api
+# Point PERENUAL_BASE_URL at perenual_stub.py to run without network access
+PERENUAL_BASE_URL = os.environ.get('PERENUAL_BASE_URL', 'https://perenual.com/api').rstrip('/')
+# Without a key no Perenual calls are made: searches then only use the local plant index
+PERENUAL_API_KEY = os.environ.get('PERENUAL_API_KEY', '')
+if not PERENUAL_API_KEY:
+    print("PERENUAL_API_KEY is not set - Perenual lookups are skipped")
+
+# Per-request timeout, and overall budget for one search (species list plus details)
+PERENUAL_TIMEOUT = float(os.environ.get('PERENUAL_TIMEOUT', 10))
+PERENUAL_SEARCH_DEADLINE = float(os.environ.get('PERENUAL_SEARCH_DEADLINE', 12))
+PERENUAL_POOL_SIZE = int(os.environ.get('PERENUAL_POOL_SIZE', 10))
+# Connection cap of the async client used by asgi.py; waiting requests cost no threads
+PERENUAL_ASYNC_MAX_CONNECTIONS = int(os.environ.get('PERENUAL_ASYNC_MAX_CONNECTIONS', 100))
+
+# Shared keep-alive session so detail lookups reuse TLS connections
+session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=1, pool_maxsize=PERENUAL_POOL_SIZE)
+session.mount('https://', _adapter)
+session.mount('http://', _adapter)
+detail_executor = ThreadPoolExecutor(max_workers=PERENUAL_POOL_SIZE, thread_name_prefix='perenual-details')
+
+species_list_cache = TTLCache(
+    ttl=float(os.environ.get('PERENUAL_LIST_TTL', 3600)),
+    stale_ttl=float(os.environ.get('PERENUAL_STALE_TTL', 86400)),
+    negative_ttl=float(os.environ.get('PERENUAL_NEGATIVE_TTL', 300)),
+    max_entries=int(os.environ.get('PERENUAL_LIST_CACHE_SIZE', 1024)),
+    name='species-list'
+)
+species_detail_cache = TTLCache(
+    ttl=float(os.environ.get('PERENUAL_DETAIL_TTL', 86400)),
+    stale_ttl=float(os.environ.get('PERENUAL_STALE_TTL', 86400)),
+    max_entries=int(os.environ.get('PERENUAL_DETAIL_CACHE_SIZE', 4096)),
+    name='species-details'
+)
+metrics.register_cache('species_list', species_list_cache.stats)
+metrics.register_cache('species_details', species_detail_cache.stats)
+
+# Upstream calls that raised (timeouts, connection errors, non-2xx statuses)
+UPSTREAM_ERRORS = metrics.Counter('groweasy_perenual_errors_total', 'Failed Perenual API calls', ['call'])
+
+def search_deadline(seconds=None):
+    """Monotonic time by which a search started now must answer (PERENUAL_SEARCH_DEADLINE by default)"""
+    return time.monotonic() + (PERENUAL_SEARCH_DEADLINE if seconds is None else seconds)
+
+def call_timeout(deadline_at):
+    """Timeout for one upstream call: PERENUAL_TIMEOUT, cut to what is left before deadline_at"""
+    if deadline_at is None:
+        return PERENUAL_TIMEOUT
+    remaining = deadline_at - time.monotonic()
+    if remaining <= 0:
+        raise requests.Timeout('Perenual search deadline passed')
+    return min(PERENUAL_TIMEOUT, remaining)
+
+def normalize_query(query):
+    """Normalize a search query so equivalent searches share a cache entry"""
+    return ' '.join(query.lower().split())
+
+def _load_species_list(query, timeout=PERENUAL_TIMEOUT):
+    url = f"{PERENUAL_BASE_URL}/species-list"
+    try:
+        with stage_timer('perenual_list'):
+            response = session.get(url, params={'key': PERENUAL_API_KEY, 'q': query}, timeout=timeout)
+            print("Perenual response:", response.status_code)
+            response.raise_for_status()
+            return response.json()
+    except Exception:
+        UPSTREAM_ERRORS.labels('list').inc()
+        raise
+
+def _load_species_details(plant_id):
+    url = f"{PERENUAL_BASE_URL}/species/details/{plant_id}"
+    try:
+        with stage_timer('perenual_details'):
+            response = session.get(url, params={'key': PERENUAL_API_KEY}, timeout=PERENUAL_TIMEOUT)
+            response.raise_for_status()
+            return response.json()
+    except Exception:
+        UPSTREAM_ERRORS.labels('details').inc()
+        raise
+
+def fetch_species_list(query, deadline_at=None):
+    """Search species by name, served from cache when possible; an upstream call ends by deadline_at"""
+    if not PERENUAL_API_KEY:
+        return {'data': []}
+    query = normalize_query(query)
+    timeout = call_timeout(deadline_at)
+    return species_list_cache.get_or_load(
+        query,
+        lambda: _load_species_list(query, timeout),
+        is_empty=lambda data: not data.get('data')
+    )
+
+def fetch_species_details(plant_id):
+    """Fetch the detail document for one species, served from cache when possible"""
+    if not PERENUAL_API_KEY:
+        return {}
+    data = species_detail_cache.get_or_load(plant_id, lambda: _load_species_details(plant_id))
+    return data.get('result', {})
+
+def fetch_species_details_many(plant_ids, deadline_at=None):
+    """Fetch detail documents concurrently, returning whatever finished by deadline_at
+
+    deadline_at is a time.monotonic() value, normally the search_deadline()
+    taken before the species-list call. Returns a dict of plant id -> detail;
+    ids that failed or timed out map to {}.
+    """
+    deadline_at = search_deadline() if deadline_at is None else deadline_at
+    started = time.monotonic()
+    futures = {plant_id: detail_executor.submit(fetch_species_details, plant_id) for plant_id in plant_ids}
+    wait(futures.values(), timeout=max(0, deadline_at - time.monotonic()))
+
+    details = {}
+    for plant_id, future in futures.items():
+        if not future.done():
+            # Lookups still queued are dropped so they cannot pile up behind later searches; running
+            # ones (at most PERENUAL_POOL_SIZE) finish so their result still lands in the cache
+            state = 'dropped' if future.cancel() else 'left running'
+            print(f"Perenual details for {plant_id} missed the search deadline ({state})")
+            details[plant_id] = {}
+            continue
+        try:
+            details[plant_id] = future.result()
+        except Exception as e:
+            print(f"Perenual details error for {plant_id}: {e}")
+            details[plant_id] = {}
+    print(f"Fetched {len(plant_ids)} Perenual details in {time.monotonic() - started:.2f}s")
+    return details
+
+# Async client for asgi.py (httpx is optional, imported on first use)
+async_client = None
+# Detail lookups that missed a search deadline; referenced so they finish and fill the cache
+late_detail_tasks = set()
+
+def get_async_client():
+    """Shared httpx.AsyncClient; call from the serving event loop"""
+    global async_client
+    if async_client is None:
+        import httpx
+        async_client = httpx.AsyncClient(
+            timeout=PERENUAL_TIMEOUT,
+            limits=httpx.Limits(max_connections=PERENUAL_ASYNC_MAX_CONNECTIONS,
+                                max_keepalive_connections=PERENUAL_ASYNC_MAX_CONNECTIONS)
+        )
+    return async_client
+
+async def close_async_client():
+    global async_client
+    if async_client is not None:
+        await async_client.aclose()
+        async_client = None
+
+def _forget_late_task(task):
+    late_detail_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Late Perenual details lookup failed: {task.exception()}")
+
+async def _aload_species_list(query, timeout=PERENUAL_TIMEOUT):
+    url = f"{PERENUAL_BASE_URL}/species-list"
+    try:
+        with stage_timer('perenual_list'):
+            response = await get_async_client().get(url, params={'key': PERENUAL_API_KEY, 'q': query}, timeout=timeout)
+            response.raise_for_status()
+            return response.json()
+    except Exception:
+        UPSTREAM_ERRORS.labels('list').inc()
+        raise
+
+async def _aload_species_details(plant_id):
+    url = f"{PERENUAL_BASE_URL}/species/details/{plant_id}"
+    try:
+        with stage_timer('perenual_details'):
+            response = await get_async_client().get(url, params={'key': PERENUAL_API_KEY})
+            response.raise_for_status()
+            return response.json()
+    except Exception:
+        UPSTREAM_ERRORS.labels('details').inc()
+        raise
+
+async def afetch_species_list(query, deadline_at=None):
+    """Async fetch_species_list sharing the same cache"""
+    if not PERENUAL_API_KEY:
+        return {'data': []}
+    query = normalize_query(query)
+    timeout = call_timeout(deadline_at)
+    return await species_list_cache.aget_or_load(
+        query,
+        lambda: _aload_species_list(query, timeout),
+        is_empty=lambda data: not data.get('data')
+    )
+
+async def afetch_species_details(plant_id):
+    if not PERENUAL_API_KEY:
+        return {}
+    data = await species_detail_cache.aget_or_load(plant_id, lambda: _aload_species_details(plant_id))
+    return data.get('result', {})
+
+async def afetch_species_details_many(plant_ids, deadline_at=None):
+    """Async fetch_species_details_many: same deadline and {} fallback, no threads held while waiting"""
+    deadline_at = search_deadline() if deadline_at is None else deadline_at
+    tasks = {plant_id: asyncio.ensure_future(afetch_species_details(plant_id)) for plant_id in plant_ids}
+    if tasks:
+        # Late tasks keep running so their results still land in the cache; they hold no thread and
+        # each ends within PERENUAL_TIMEOUT
+        await asyncio.wait(tasks.values(), timeout=max(0, deadline_at - time.monotonic()))
+
+    details = {}
+    for plant_id, task in tasks.items():
+        if not task.done():
+            print(f"Perenual details for {plant_id} missed the search deadline")
+            late_detail_tasks.add(task)
+            task.add_done_callback(_forget_late_task)
+            details[plant_id] = {}
+        elif task.exception() is not None:
+            print(f"Perenual details error for {plant_id}: {task.exception()}")
+            details[plant_id] = {}
+        else:
+            details[plant_id] = task.result()
+    return details
+
+def cache_stats():
+    return {
+        'speciesList': species_list_cache.stats(),
+        'speciesDetails': species_detail_cache.stats()
+    }
+
+def build_plant_info(plant, plant_detail):
+    """Build the PlantInfo response entry from a species-list item and its detail document"""
+    # Extract care information
+    care_info = plant_detail.get('care', {})
+    watering = care_info.get('watering', 'medium')
+    sunlight = care_info.get('sunlight', ['full'])
+    if isinstance(sunlight, list) and sunlight:
+        sunlight = sunlight[0]
+    elif not sunlight:
+        sunlight = 'full'
+    
+    # Extract growth information
+    growth_info = plant_detail.get('growth', {})
+    growth_rate = growth_info.get('growth_rate', 'medium')
+    maintenance = growth_info.get('maintenance', 'medium')
+    
+    # Extract description
+    description = plant_detail.get('description', '')
+    if not description:
+        description = f"A {plant.get('family', 'plant')} species in the {plant.get('genus', 'genus')} genus."
+    
+    # Generate care tips based on available data
+    care_tips = []
+    if watering == 'frequent':
+        care_tips.append('Water frequently to keep soil moist')
+    elif watering == 'average':
+        care_tips.append('Water when top inch of soil is dry')
+    elif watering == 'minimum':
+        care_tips.append('Water sparingly, allow soil to dry between watering')
+    
+    if 'full' in str(sunlight).lower():
+        care_tips.append('Provide full sunlight (6+ hours per day)')
+    elif 'partial' in str(sunlight).lower():
+        care_tips.append('Provide partial sunlight (3-6 hours per day)')
+    elif 'shade' in str(sunlight).lower():
+        care_tips.append('Provide shade or indirect light')
+    
+    if maintenance == 'low':
+        care_tips.append('Low maintenance plant, suitable for beginners')
+    elif maintenance == 'high':
+        care_tips.append('High maintenance plant, requires regular attention')
+    
+    care_tips.extend([
+        'Monitor for pests and diseases',
+        'Use well-draining soil',
+        'Fertilize during growing season'
+    ])
+    
+    return {
+        'id': plant.get('id'),
+        'common_name': plant.get('common_name', 'Unknown'),
+        'scientific_name': plant.get('scientific_name', ['Unknown'])[0] if isinstance(plant.get('scientific_name'), list) else plant.get('scientific_name', 'Unknown'),
+        'family': plant.get('family', 'Unknown'),
+        'genus': plant.get('genus', 'Unknown'),
+        'year': plant.get('year'),
+        'image_url': plant.get('default_image', {}).get('original_url') if plant.get('default_image') else None,
+        'description': description,
+        'care_tips': care_tips[:5],  # Limit to 5 tips
+        'sunlight': sunlight,
+        'water_needs': watering,
+        'difficulty': maintenance,
+        'growth_rate': growth_rate,
+        'growing_season': growth_info.get('season', 'Varies by climate'),
+        'max_height': growth_info.get('max_height', {}).get('cm', 'Unknown'),
+        'min_temp': growth_info.get('minimum_temperature', {}).get('celsius', 'Unknown')
+    }
@@ -0,0 +1,128 @@
+"""Local stand-in for the Perenual API used for offline testing and benchmarks
+
+Run it and point the backend at it:
+
+    python perenual_stub.py --port 5050 --delay-ms 200
+    PERENUAL_BASE_URL=http://localhost:5050/api PERENUAL_API_KEY=stub python app.py
+
+GET /stats returns the number of upstream calls served, so cache hits and
+misses can be checked from the outside.
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+SPECIES = [
+    {'id': 1, 'common_name': 'Tomato', 'scientific_name': ['Solanum lycopersicum'], 'family': 'Solanaceae', 'genus': 'Solanum', 'sunlight': ['full sun'], 'watering': 'frequent', 'maintenance': 'medium', 'growth_rate': 'high'},
+    {'id': 2, 'common_name': 'Cherry Tomato', 'scientific_name': ['Solanum lycopersicum var. cerasiforme'], 'family': 'Solanaceae', 'genus': 'Solanum', 'sunlight': ['full sun'], 'watering': 'frequent', 'maintenance': 'medium', 'growth_rate': 'high'},
+    {'id': 3, 'common_name': 'Sweet Basil', 'scientific_name': ['Ocimum basilicum'], 'family': 'Lamiaceae', 'genus': 'Ocimum', 'sunlight': ['full sun', 'part shade'], 'watering': 'average', 'maintenance': 'low', 'growth_rate': 'high'},
+    {'id': 4, 'common_name': 'Thai Basil', 'scientific_name': ['Ocimum basilicum var. thyrsiflora'], 'family': 'Lamiaceae', 'genus': 'Ocimum', 'sunlight': ['full sun'], 'watering': 'average', 'maintenance': 'low', 'growth_rate': 'high'},
+    {'id': 5, 'common_name': 'Lettuce', 'scientific_name': ['Lactuca sativa'], 'family': 'Asteraceae', 'genus': 'Lactuca', 'sunlight': ['part shade'], 'watering': 'frequent', 'maintenance': 'low', 'growth_rate': 'high'},
+    {'id': 6, 'common_name': 'Peppermint', 'scientific_name': ['Mentha x piperita'], 'family': 'Lamiaceae', 'genus': 'Mentha', 'sunlight': ['part shade'], 'watering': 'frequent', 'maintenance': 'low', 'growth_rate': 'high'},
+    {'id': 7, 'common_name': 'Rosemary', 'scientific_name': ['Salvia rosmarinus'], 'family': 'Lamiaceae', 'genus': 'Salvia', 'sunlight': ['full sun'], 'watering': 'minimum', 'maintenance': 'low', 'growth_rate': 'moderate'},
+    {'id': 8, 'common_name': 'Bell Pepper', 'scientific_name': ['Capsicum annuum'], 'family': 'Solanaceae', 'genus': 'Capsicum', 'sunlight': ['full sun'], 'watering': 'average', 'maintenance': 'medium', 'growth_rate': 'moderate'},
+    {'id': 9, 'common_name': 'Strawberry', 'scientific_name': ['Fragaria x ananassa'], 'family': 'Rosaceae', 'genus': 'Fragaria', 'sunlight': ['full sun'], 'watering': 'frequent', 'maintenance': 'medium', 'growth_rate': 'moderate'},
+    {'id': 10, 'common_name': 'English Lavender', 'scientific_name': ['Lavandula angustifolia'], 'family': 'Lamiaceae', 'genus': 'Lavandula', 'sunlight': ['full sun'], 'watering': 'minimum', 'maintenance': 'low', 'growth_rate': 'moderate'},
+]
+
+stats = {'species-list': 0, 'species-details': 0}
+stats_lock = threading.Lock()
+
+
+def list_item(species):
+    return {key: species[key] for key in ('id', 'common_name', 'scientific_name', 'family', 'genus')}
+
+
+def detail_document(species):
+    return {
+        'result': {
+            'description': f"{species['common_name']} is a member of the {species['family']} family.",
+            'care': {'watering': species['watering'], 'sunlight': species['sunlight']},
+            'growth': {
+                'growth_rate': species['growth_rate'],
+                'maintenance': species['maintenance'],
+                'season': 'Spring to Fall',
+                'max_height': {'cm': 100},
+                'minimum_temperature': {'celsius': 5}
+            }
+        }
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    delay = 0.0
+    detail_delay = None
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        params = parse_qs(parsed.query)
+        path = parsed.path.rstrip('/')
+
+        if path == '/stats':
+            with stats_lock:
+                return self._send_json(dict(stats))
+
+        if path == '/api/species-list':
+            with stats_lock:
+                stats['species-list'] += 1
+            time.sleep(self.delay)
+            query = params.get('q', [''])[0].lower()
+            matches = [list_item(s) for s in SPECIES
+                       if query in s['common_name'].lower() or query in s['scientific_name'][0].lower()]
+            return self._send_json({'data': matches, 'total': len(matches)})
+
+        if path.startswith('/api/species/details/'):
+            with stats_lock:
+                stats['species-details'] += 1
+            time.sleep(self.delay if self.detail_delay is None else self.detail_delay)
+            plant_id = path.rsplit('/', 1)[-1]
+            for species in SPECIES:
+                if str(species['id']) == plant_id:
+                    return self._send_json(detail_document(species))
+            return self._send_json({'error': 'Not found'}, status=404)
+
+        self._send_json({'error': 'Not found'}, status=404)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    # Load tests open hundreds of connections at once; the default backlog of 5 drops them
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+def serve(port=5050, delay_ms=0, detail_delay_ms=None):
+    """Start the stub server in a background thread and return it"""
+    StubHandler.delay = delay_ms / 1000.0
+    StubHandler.detail_delay = None if detail_delay_ms is None else detail_delay_ms / 1000.0
+    server = StubServer(('127.0.0.1', port), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local Perenual API stub')
+    parser.add_argument('--port', type=int, default=5050)
+    parser.add_argument('--delay-ms', type=float, default=0, help='Artificial latency for every response')
+    parser.add_argument('--detail-delay-ms', type=float, default=None, help='Override latency for species/details')
+    args = parser.parse_args()
+
+    server = serve(args.port, args.delay_ms, args.detail_delay_ms)
+    print(f"Perenual stub listening on http://127.0.0.1:{args.port}/api")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
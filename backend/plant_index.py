@@ -0,0 +1,319 @@
+"""Local plant dictionary for /plant-search: SQLite FTS5 prefix and trigram index
+
+    python plant_index.py import export/*.json        # Perenual exports (see below)
+    python plant_index.py import --from-api --pages 30 --details
+    python plant_index.py import --stub               # the perenual_stub.py catalog, for offline testing
+    python plant_index.py search "tomatoe"
+    python plant_index.py stats
+
+Import accepts JSON or JSONL files holding species-list pages ({"data": [...]}),
+lists of species-list items, or single items. An item may carry its
+species-details document under "details"; detail documents can also be given
+as separate files ({"id": ..., "result": {...}} or a bare detail with "id").
+Each plant's PlantInfo (the /plant-search entry) is built once at import.
+
+The index is rebuilt into a temporary file and swapped in with a rename, so a
+running server keeps answering while an import runs and picks up the new
+file on its next query.
+
+Search: word and prefix matches on common, scientific and other names first
+(FTS5 unicode61 with prefix indexes). If that finds nothing, substring
+matches from an FTS5 trigram table, and failing those typo-tolerant matches:
+trigram candidates ranked by trigram similarity to the whole name or to any
+single word of it.
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+PLANT_INDEX_PATH = os.environ.get('PLANT_INDEX_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'plant_index.sqlite'))
+# Typo-tolerant matches need at least this trigram similarity (0-1)
+FUZZY_MIN_SIMILARITY = float(os.environ.get('PLANT_INDEX_FUZZY_MIN_SIMILARITY', 0.3))
+FUZZY_CANDIDATES = 200
+
+SCHEMA = """
+CREATE TABLE plants (
+    id INTEGER PRIMARY KEY,
+    common_name TEXT NOT NULL,
+    names TEXT NOT NULL,
+    info TEXT NOT NULL
+);
+CREATE VIRTUAL TABLE plant_names USING fts5(
+    common_name, scientific_name, other_names,
+    tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3 4'
+);
+CREATE VIRTUAL TABLE plant_trigrams USING fts5(names, tokenize = 'trigram');
+"""
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+
+def normalize(text):
+    return ' '.join(_WORD.findall(str(text).lower()))
+
+
+def trigrams(text):
+    """pg_trgm-style trigrams: each word padded with two leading spaces and one trailing"""
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def _as_list(value):
+    if not value:
+        return []
+    return [str(item) for item in value] if isinstance(value, list) else [str(value)]
+
+
+def read_export_files(paths):
+    """Yield (species-list items, detail documents keyed by id) from Perenual export files"""
+    items = {}
+    details = {}
+
+    def take(record):
+        if not isinstance(record, dict):
+            return
+        if isinstance(record.get('data'), list):
+            for item in record['data']:
+                take(item)
+        elif 'common_name' in record and record.get('id') is not None:
+            items[record['id']] = record
+            if isinstance(record.get('details'), dict):
+                details[record['id']] = record['details'].get('result', record['details'])
+        elif record.get('id') is not None:
+            details[record['id']] = record.get('result', record)
+
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            if path.endswith('.jsonl'):
+                records = [json.loads(line) for line in f if line.strip()]
+            else:
+                document = json.load(f)
+                records = document if isinstance(document, list) else [document]
+        for record in records:
+            take(record)
+    return list(items.values()), details
+
+
+def read_stub_catalog():
+    import perenual_stub
+    items = [perenual_stub.list_item(species) for species in perenual_stub.SPECIES]
+    details = {species['id']: perenual_stub.detail_document(species)['result'] for species in perenual_stub.SPECIES}
+    return items, details
+
+
+def read_from_api(pages, with_details):
+    """Crawl species-list pages (and optionally every species' details) from PERENUAL_BASE_URL"""
+    import perenual
+    if not perenual.PERENUAL_API_KEY:
+        raise SystemExit('PERENUAL_API_KEY is not set')
+    items = []
+    details = {}
+    for page in range(1, pages + 1):
+        response = perenual.session.get(f"{perenual.PERENUAL_BASE_URL}/species-list",
+                                        params={'key': perenual.PERENUAL_API_KEY, 'page': page},
+                                        timeout=perenual.PERENUAL_TIMEOUT)
+        response.raise_for_status()
+        document = response.json()
+        items.extend(document.get('data', []))
+        print(f"Page {page}: {len(document.get('data', []))} species")
+        if page >= document.get('last_page', pages):
+            break
+    if with_details:
+        details = perenual.fetch_species_details_many([item['id'] for item in items if item.get('id')], perenual.search_deadline(3600))
+    return items, details
+
+
+def build_index(items, details, path=PLANT_INDEX_PATH):
+    """Write a fresh index for items to path (atomically); returns the number of plants"""
+    from perenual import build_plant_info
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    connection = sqlite3.connect(tmp_path)
+    try:
+        connection.executescript(SCHEMA)
+        indexed = set()
+        for item in items:
+            plant_id = item.get('id')
+            if plant_id is None or not item.get('common_name') or plant_id in indexed:
+                continue
+            indexed.add(plant_id)
+            info = build_plant_info(item, details.get(plant_id) or {})
+            scientific = _as_list(item.get('scientific_name'))
+            other = _as_list(item.get('other_name'))
+            names = ' | '.join(normalize(name) for name in [item['common_name']] + scientific + other if normalize(name))
+            connection.execute('INSERT INTO plants (id, common_name, names, info) VALUES (?, ?, ?, ?)',
+                               (plant_id, item['common_name'], names, json.dumps(info)))
+            connection.execute('INSERT INTO plant_names (rowid, common_name, scientific_name, other_names) VALUES (?, ?, ?, ?)',
+                               (plant_id, item['common_name'], ' '.join(scientific), ' '.join(other)))
+            connection.execute('INSERT INTO plant_trigrams (rowid, names) VALUES (?, ?)', (plant_id, names))
+        connection.execute("INSERT INTO plant_names (plant_names) VALUES ('optimize')")
+        connection.execute("INSERT INTO plant_trigrams (plant_trigrams) VALUES ('optimize')")
+        connection.commit()
+    finally:
+        connection.close()
+    os.replace(tmp_path, path)
+    return len(indexed)
+
+
+class PlantIndex:
+    """Read side of the local plant index; one read-only SQLite connection per thread"""
+
+    def __init__(self, path=PLANT_INDEX_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def available(self):
+        return os.path.exists(self.path)
+
+    def _connection(self):
+        """Thread's connection, reopened after a fork or when an import swapped the file"""
+        local = self._local
+        identity = (os.getpid(), os.stat(self.path).st_ino)
+        if getattr(local, 'identity', None) != identity:
+            if getattr(local, 'connection', None) is not None and local.identity[0] == os.getpid():
+                local.connection.close()
+            local.connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            local.identity = identity
+        return local.connection
+
+    def search(self, query, limit=5):
+        """PlantInfo dicts for query, best first; [] when nothing matches"""
+        text = normalize(query)
+        if not text or not self.available:
+            return []
+        connection = self._connection()
+        ids = self._search_words(connection, text, limit)
+        if not ids and len(text) >= 3:
+            ids = self._search_substring(connection, text, limit)
+        if not ids and len(text.replace(' ', '')) >= 3:
+            ids = self._search_fuzzy(connection, text, limit)
+        with self._lock:
+            if ids:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if not ids:
+            return []
+        rows = dict(connection.execute(
+            f"SELECT id, info FROM plants WHERE id IN ({','.join('?' * len(ids))})", ids).fetchall())
+        return [json.loads(rows[plant_id]) for plant_id in ids if plant_id in rows]
+
+    def _search_words(self, connection, text, limit):
+        # Whole words rank first; then the last word as a prefix, since the user may still be typing
+        words = text.split()
+        whole = ' '.join(f'"{word}"' for word in words)
+        ids = self._match_names(connection, whole, text, limit)
+        if len(ids) < limit:
+            ids += [plant_id for plant_id in self._match_names(connection, whole + '*', text, limit) if plant_id not in ids]
+        return ids[:limit]
+
+    def _match_names(self, connection, match, text, limit):
+        rows = connection.execute(
+            "SELECT plant_names.rowid FROM plant_names JOIN plants ON plants.id = plant_names.rowid "
+            "WHERE plant_names MATCH ? "
+            "ORDER BY lower(plants.common_name) = ? DESC, bm25(plant_names, 10.0, 5.0, 2.0), length(plants.common_name) "
+            "LIMIT ?",
+            (match, text, limit)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def _search_substring(self, connection, text, limit):
+        # Inside words too ("mint" -> "Peppermint"); the trigram table answers substring phrases directly
+        rows = connection.execute(
+            "SELECT plants.id FROM plant_trigrams JOIN plants ON plants.id = plant_trigrams.rowid "
+            "WHERE plant_trigrams MATCH ? ORDER BY length(plants.common_name) LIMIT ?",
+            (f'"{text}"', limit)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def _search_fuzzy(self, connection, text, limit):
+        grams = sorted({text[i:i + 3] for i in range(len(text) - 2) if ' ' not in text[i:i + 3]})
+        if not grams:
+            return []
+        match = ' OR '.join(f'"{gram}"' for gram in grams)
+        candidates = connection.execute(
+            "SELECT plants.id, plants.names FROM plant_trigrams JOIN plants ON plants.id = plant_trigrams.rowid "
+            "WHERE plant_trigrams MATCH ? ORDER BY rank LIMIT ?",
+            (match, FUZZY_CANDIDATES)
+        ).fetchall()
+        query_grams = trigrams(text)
+        scored = []
+        for plant_id, names in candidates:
+            # Best of the whole name or any single word, so "basl" still finds "sweet basil"
+            score = 0.0
+            for name in names.split(' | '):
+                word_grams = [trigrams(word) for word in name.split()]
+                for grams in word_grams + [set().union(*word_grams)]:
+                    union = len(query_grams | grams)
+                    if union:
+                        score = max(score, len(query_grams & grams) / union)
+            if score >= FUZZY_MIN_SIMILARITY:
+                scored.append((score, plant_id))
+        scored.sort(key=lambda entry: -entry[0])
+        return [plant_id for _, plant_id in scored[:limit]]
+
+    def stats(self):
+        if not self.available:
+            return {'available': False, 'path': self.path}
+        return {
+            'available': True,
+            'path': self.path,
+            'entries': self._connection().execute('SELECT COUNT(*) FROM plants').fetchone()[0],
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['import', 'search', 'stats'])
+    parser.add_argument('args', nargs='*', help='Export files (import) or the query (search)')
+    parser.add_argument('--path', default=PLANT_INDEX_PATH)
+    parser.add_argument('--stub', action='store_true', help='Import the perenual_stub.py catalog')
+    parser.add_argument('--from-api', action='store_true', help='Crawl species-list pages from PERENUAL_BASE_URL')
+    parser.add_argument('--pages', type=int, default=1)
+    parser.add_argument('--details', action='store_true', help='With --from-api, also fetch every species details document')
+    parser.add_argument('--limit', type=int, default=5)
+    # Intermixed, so options may come before or after the files or query words
+    args = parser.parse_intermixed_args()
+
+    if args.command == 'import':
+        if args.stub:
+            items, details = read_stub_catalog()
+        elif args.from_api:
+            items, details = read_from_api(args.pages, args.details)
+        else:
+            paths = [path for pattern in args.args for path in sorted(glob.glob(pattern))]
+            if not paths:
+                parser.error('Give export files, --stub or --from-api')
+            items, details = read_export_files(paths)
+        started = time.perf_counter()
+        count = build_index(items, details, args.path)
+        print(f"Indexed {count} plants ({len(details)} with details) into {args.path} in {time.perf_counter() - started:.2f}s")
+    elif args.command == 'search':
+        index = PlantIndex(args.path)
+        started = time.perf_counter()
+        results = index.search(' '.join(args.args), args.limit)
+        elapsed = (time.perf_counter() - started) * 1000
+        for plant in results:
+            print(f"{plant['id']:>8}  {plant['common_name']}  ({plant['scientific_name']})")
+        print(f"{len(results)} result(s) in {elapsed:.3f} ms")
+    else:
+        print(json.dumps(PlantIndex(args.path).stats(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""INT8 quantization of the exported EfficientNet-B0 feature extractor
+
+    python export_model.py --format onnx                   # fp32 graph first
+    python quantize_model.py quantize --images samples/    # static (calibrated) + dynamic INT8
+    python quantize_model.py report --images samples/      # latency / memory / fidelity report
+    INFERENCE_BACKEND=onnx-int8 python app.py
+
+Static quantization calibrates activation ranges on a folder of sample
+plant photos; dynamic quantization needs no calibration data. The report
+compares every available graph against the fp32 ONNX features on the same
+photos.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+import torch
+from export_model import load_sample_batch
+from inference_backends import (
+    ONNX_FILENAME, ONNX_INT8_FILENAME, ONNX_INT8_DYNAMIC_FILENAME, create_backend, compare_features
+)
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+REPORT_BACKENDS = [
+    ('onnx', ONNX_FILENAME),
+    ('onnx-int8', ONNX_INT8_FILENAME),
+    ('onnx-int8-dynamic', ONNX_INT8_DYNAMIC_FILENAME)
+]
+
+
+class CalibrationReader:
+    """Feeds preprocessed calibration photos to ONNX Runtime one at a time"""
+
+    def __init__(self, batch):
+        self._items = iter([{'images': image.unsqueeze(0).numpy()} for image in batch])
+
+    def get_next(self):
+        return next(self._items, None)
+
+
+def quantize(export_dir, image_dir, limit, modes):
+    from onnxruntime.quantization import (
+        quantize_static, quantize_dynamic, QuantFormat, QuantType, CalibrationMethod
+    )
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    fp32_path = os.path.join(export_dir, ONNX_FILENAME)
+    if not os.path.exists(fp32_path):
+        sys.exit(f"{fp32_path} not found - run `python export_model.py --format onnx` first")
+
+    # Shape inference and graph cleanup make the quantizer cover more nodes
+    prepared_path = os.path.join(export_dir, 'efficientnet-b0-features.prep.onnx')
+    quant_pre_process(fp32_path, prepared_path)
+
+    if 'static' in modes:
+        if not image_dir:
+            sys.exit("Static quantization needs --images with sample plant photos for calibration")
+        batch = load_sample_batch(image_dir, limit)
+        print(f"Calibrating on {len(batch)} photos from {image_dir}")
+        path = os.path.join(export_dir, ONNX_INT8_FILENAME)
+        quantize_static(
+            prepared_path, path, CalibrationReader(batch),
+            quant_format=QuantFormat.QDQ,
+            per_channel=True,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            calibrate_method=CalibrationMethod.MinMax
+        )
+        print(f"Wrote {path}")
+
+    if 'dynamic' in modes:
+        path = os.path.join(export_dir, ONNX_INT8_DYNAMIC_FILENAME)
+        quantize_dynamic(prepared_path, path, weight_type=QuantType.QUInt8)
+        print(f"Wrote {path}")
+
+    os.remove(prepared_path)
+
+
+def current_rss_mb():
+    """Resident set size of this process in MB (Linux)"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return float('nan')
+
+
+def time_batches(backend, batch, batch_size, repeats):
+    """Run batch in chunks of batch_size and return per-call latencies in ms"""
+    latencies = []
+    for _ in range(repeats):
+        for start in range(0, len(batch), batch_size):
+            chunk = batch[start:start + batch_size]
+            started = time.perf_counter()
+            backend(chunk)
+            latencies.append((time.perf_counter() - started) * 1000)
+    return sorted(latencies)
+
+
+def model_file_mb(path):
+    """Size of an ONNX graph including any external weight file"""
+    size = os.path.getsize(path)
+    if os.path.exists(f"{path}.data"):
+        size += os.path.getsize(f"{path}.data")
+    return round(size / 1024 / 1024, 1)
+
+
+def report(export_dir, image_dir, limit, batch_size, repeats):
+    import onnxruntime  # noqa: F401 - load the runtime before measuring per-session memory
+    batch = load_sample_batch(image_dir, limit)
+    device = torch.device('cpu')
+    reference = None
+    rows = []
+    for name, filename in REPORT_BACKENDS:
+        path = os.path.join(export_dir, filename)
+        if not os.path.exists(path):
+            print(f"Skipping {name}: {path} not found")
+            continue
+        rss_before = current_rss_mb()
+        backend = create_backend(name, device, export_dir)
+        backend(batch[:1])  # warm-up
+        session_mb = current_rss_mb() - rss_before
+
+        features = np.concatenate([backend(batch[i:i + batch_size]) for i in range(0, len(batch), batch_size)])
+        if reference is None:
+            reference = features
+        fidelity = compare_features(reference, features)
+
+        single = time_batches(backend, batch, 1, repeats)
+        batched = time_batches(backend, batch, batch_size, repeats)
+        rows.append({
+            'backend': name,
+            'fileMb': model_file_mb(path),
+            'sessionRssMb': round(session_mb, 1),
+            'p50LatencyMs': round(single[len(single) // 2], 2),
+            'p95LatencyMs': round(single[min(len(single) - 1, int(len(single) * 0.95))], 2),
+            'imagesPerSec': round(len(batch) * repeats / (sum(batched) / 1000), 1),
+            'meanCosine': round(fidelity['meanCosine'], 5),
+            'minCosine': round(fidelity['minCosine'], 5)
+        })
+        del backend
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['quantize', 'report'])
+    parser.add_argument('--images', help='Folder of sample plant photos (calibration set)')
+    parser.add_argument('--dir', default=os.environ.get('MODEL_EXPORT_DIR', os.path.join(BACKEND_DIR, 'models')))
+    parser.add_argument('--mode', choices=['static', 'dynamic', 'all'], default='all')
+    parser.add_argument('--limit', type=int, default=100, help='Maximum photos used from --images')
+    parser.add_argument('--batch-size', type=int, default=8, help='Batch size for the throughput measurement')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args()
+
+    if args.command == 'quantize':
+        modes = ['static', 'dynamic'] if args.mode == 'all' else [args.mode]
+        return quantize(args.dir, args.images, args.limit, modes)
+
+    rows = report(args.dir, args.images, args.limit, args.batch_size, args.repeats)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    print(f"{'backend':<20}{'file MB':>9}{'RSS MB':>9}{'p50 ms':>9}{'p95 ms':>9}{'img/s':>9}{'mean cos':>10}{'min cos':>10}")
+    for r in rows:
+        print(f"{r['backend']:<20}{r['fileMb']:>9}{r['sessionRssMb']:>9}{r['p50LatencyMs']:>9}{r['p95LatencyMs']:>9}"
+              f"{r['imagesPerSec']:>9}{r['meanCosine']:>10}{r['minCosine']:>10}")
+
+
+if __name__ == '__main__':
+    main()
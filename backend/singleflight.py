@@ -0,0 +1,119 @@
+"""Request coalescing: identical calls in flight at the same time share one result
+
+The first caller for a key (the leader) runs the work; callers arriving
+while it runs (followers) wait for its result instead of repeating it, and
+get the same value or the same exception. Once the work finishes the key is
+forgotten, so this never serves old results - caching is left to the caches.
+
+Some errors belong to the leader's request rather than to the work, such as
+its own deadline passing. Those are listed in private_errors: followers
+then run the call again themselves (one of them becomes the new leader).
+"""
+import asyncio
+import functools
+import threading
+from concurrent.futures import Future
+from metrics import SINGLEFLIGHT_CALLS
+
+
+class SingleFlight:
+    """Coalesce identical blocking calls made from different threads"""
+
+    def __init__(self, name, private_errors=()):
+        self.name = name
+        self.private_errors = tuple(private_errors)
+        self._calls = {}  # key -> Future of the leader's call
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+
+    def do(self, key, fn, timeout=None):
+        """fn() once per key at a time; followers wait up to timeout seconds (concurrent.futures.TimeoutError)"""
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = Future()
+                    # Running futures cannot be cancelled by a follower giving up
+                    call.set_running_or_notify_cancel()
+                    self.leaders += 1
+                else:
+                    self.followers += 1
+            SINGLEFLIGHT_CALLS.labels(self.name, 'leader' if leader else 'follower').inc()
+
+            if leader:
+                try:
+                    value = fn()
+                except BaseException as e:
+                    self._forget(key, call)
+                    call.set_exception(e)
+                    raise
+                self._forget(key, call)
+                call.set_result(value)
+                return value
+
+            try:
+                return call.result(timeout)
+            except self.private_errors:
+                continue
+
+    def _forget(self, key, call):
+        # Before the result is published, so later callers start a fresh call
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+
+    def stats(self):
+        with self._lock:
+            return {'inFlight': len(self._calls), 'leaders': self.leaders, 'followers': self.followers}
+
+
+class AsyncSingleFlight:
+    """Coalesce identical awaitables on one event loop
+
+    The shared work runs as its own task, so a caller that is cancelled (its
+    client went away, its wait timed out) leaves it running for the others;
+    it is cancelled only when no caller is waiting for it any more.
+    """
+
+    def __init__(self, name, private_errors=()):
+        self.name = name
+        self.private_errors = tuple(private_errors)
+        self._calls = {}  # key -> [task, number of callers waiting]
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(self, key, start):
+        """await start() once per key at a time; start returns a coroutine or future"""
+        while True:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = [asyncio.ensure_future(start()), 0]
+                self._calls[key] = call
+                call[0].add_done_callback(functools.partial(self._forget, key, call))
+                self.leaders += 1
+            else:
+                self.followers += 1
+            SINGLEFLIGHT_CALLS.labels(self.name, 'leader' if leader else 'follower').inc()
+
+            task = call[0]
+            call[1] += 1
+            try:
+                return await asyncio.shield(task)
+            except self.private_errors:
+                if leader:
+                    raise
+            finally:
+                call[1] -= 1
+                if call[1] == 0 and not task.done():
+                    task.cancel()
+                    self._forget(key, call)
+
+    def _forget(self, key, call, task=None):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def stats(self):
+        return {'inFlight': len(self._calls), 'leaders': self.leaders, 'followers': self.followers}
@@ -0,0 +1,91 @@
+import os
+import threading
+import time
+
+
+def _process_started():
+    """Monotonic timestamp of when this process started (Linux), else of this import"""
+    try:
+        with open('/proc/self/stat') as f:
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return time.monotonic() - (uptime - start_ticks / os.sysconf('SC_CLK_TCK'))
+    except (OSError, ValueError, IndexError):
+        return time.monotonic()
+
+
+# Includes interpreter start-up and heavy imports (torch, cv2) in time-to-ready
+PROCESS_STARTED = _process_started()
+
+
+class ModelLoader:
+    """Load and warm up a model in the background while tracking readiness for /ready"""
+
+    def __init__(self, name, load, warm_up=None):
+        self.name = name
+        self.load = load
+        self.warm_up = warm_up
+        self.state = 'not_loaded'
+        self.error = None
+        self.timings = {}
+        self._thread = None
+
+    @property
+    def ready(self):
+        return self.state == 'ready'
+
+    def run(self, warm_up=True):
+        """Load (and by default warm up) synchronously, recording how long each step took"""
+        try:
+            self.state = 'loading'
+            started = time.monotonic()
+            self.load()
+            self.timings['loadSeconds'] = round(time.monotonic() - started, 3)
+            self.state = 'loaded'
+        except Exception as e:
+            self.state = 'failed'
+            self.error = str(e)
+            print(f"Error loading {self.name}: {e}")
+            return
+        if warm_up:
+            self.warm()
+
+    def warm(self):
+        """Run the warm-up passes and mark the model ready"""
+        try:
+            self.state = 'warming_up'
+            started = time.monotonic()
+            if self.warm_up is not None:
+                self.warm_up()
+            finished = time.monotonic()
+            self.timings['warmUpSeconds'] = round(finished - started, 3)
+            self.timings['timeToReadySeconds'] = round(finished - PROCESS_STARTED, 3)
+            self.state = 'ready'
+            print(f"{self.name} ready {self.timings['timeToReadySeconds']}s after start "
+                  f"(load {self.timings.get('loadSeconds')}s, warm-up {self.timings['warmUpSeconds']}s)")
+        except Exception as e:
+            self.state = 'failed'
+            self.error = str(e)
+            print(f"Error warming up {self.name}: {e}")
+
+    def start(self):
+        """Run the loader on a background thread so the server can accept /health meanwhile"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name=f"{self.name}-loader", daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def reset(self):
+        """Forget an unloaded model so the next run() loads it again"""
+        self.state = 'not_loaded'
+        self.error = None
+        self.timings = {}
+
+    def status(self):
+        return {
+            'ready': self.ready,
+            'state': self.state,
+            'error': self.error,
+            'timings': self.timings
+        }
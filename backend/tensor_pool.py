@@ -0,0 +1,56 @@
+import threading
+import torch
+
+
+class TensorPool:
+    """Free list of preallocated tensors of one shape, reused across requests instead of allocated per request
+
+    acquire() never waits: when every tensor is out it allocates a new one,
+    and release() keeps at most size of them, so a burst larger than the
+    pool costs allocations rather than blocking a request.
+    """
+
+    def __init__(self, shape, size, dtype=torch.float32):
+        self.shape = torch.Size(shape)
+        self.size = max(0, int(size))
+        self.dtype = dtype
+        self.device = torch.device('cpu')
+        self._free = []
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def fill(self, device):
+        """Preallocate size tensors on device, dropping any held for another device"""
+        with self._lock:
+            self.device = torch.device(device)
+            self._free = [self._new() for _ in range(self.size)]
+
+    def clear(self):
+        with self._lock:
+            self._free = []
+
+    def _new(self):
+        return torch.empty(self.shape, dtype=self.dtype, device=self.device)
+
+    def acquire(self):
+        """A tensor of the pool's shape with undefined contents"""
+        with self._lock:
+            if self._free:
+                self.hits += 1
+                return self._free.pop()
+            self.misses += 1
+            device = self.device
+        return torch.empty(self.shape, dtype=self.dtype, device=device)
+
+    def release(self, tensor):
+        """Give back a tensor from acquire(); nothing may read or write it afterwards"""
+        if tensor is None or tensor.shape != self.shape:
+            return
+        with self._lock:
+            if len(self._free) < self.size and tensor.device == self.device:
+                self._free.append(tensor)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._free), 'size': self.size, 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,139 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from singleflight import SingleFlight, AsyncSingleFlight
+
+
+class TTLCache:
+    """Size-bounded TTL cache with stale-while-revalidate refresh, negative caching and coalesced misses"""
+
+    def __init__(self, ttl, stale_ttl=0, negative_ttl=None, max_entries=1024, name='cache'):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self.max_entries = max_entries
+        self.name = name
+        self._entries = OrderedDict()  # key -> (value, stored_at, negative)
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix=f"{name}-refresh")
+        self._tasks = set()  # background refreshes of the async path, kept alive until done
+        # Concurrent misses for one key wait for a single load instead of each calling the loader
+        self._flight = SingleFlight(name)
+        self._aflight = AsyncSingleFlight(name)
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def lookup(self, key):
+        """Return (value, status) where status is 'fresh', 'stale' or None on a miss"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, stored_at, negative = entry
+                age = now - stored_at
+                ttl = self.negative_ttl if negative else self.ttl
+                if age < ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value, 'fresh'
+                if age < ttl + self.stale_ttl:
+                    self._entries.move_to_end(key)
+                    self.stale_hits += 1
+                    return value, 'stale'
+            self.misses += 1
+            return None, None
+
+    def _claim_refresh(self, key):
+        """True if the caller should refresh key (no other refresh is running for it)"""
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def get_or_load(self, key, loader, is_empty=None):
+        """Return the cached value for key, calling loader() on a miss
+
+        Fresh entries are returned as-is. Entries past their TTL but within
+        stale_ttl are returned immediately while a background refresh runs.
+        Values for which is_empty(value) is true are kept for negative_ttl.
+        Concurrent misses for the same key share one loader() call and its
+        result or exception.
+        """
+        value, status = self.lookup(key)
+        if status == 'fresh':
+            return value
+        if status == 'stale':
+            if self._claim_refresh(key):
+                self._executor.submit(self._refresh, key, loader, is_empty)
+            return value
+
+        def load():
+            value = loader()
+            self.set(key, value, is_empty)
+            return value
+        return self._flight.do(key, load)
+
+    async def aget_or_load(self, key, loader, is_empty=None):
+        """get_or_load for a coroutine function loader; stale entries refresh in a background task"""
+        value, status = self.lookup(key)
+        if status == 'fresh':
+            return value
+        if status == 'stale':
+            if self._claim_refresh(key):
+                task = asyncio.ensure_future(self._arefresh(key, loader, is_empty))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            return value
+
+        async def load():
+            value = await loader()
+            self.set(key, value, is_empty)
+            return value
+        return await self._aflight.do(key, load)
+
+    def set(self, key, value, is_empty=None):
+        negative = bool(is_empty(value)) if is_empty else False
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, time.monotonic(), negative)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _refresh(self, key, loader, is_empty):
+        try:
+            self.set(key, loader(), is_empty)
+        except Exception as e:
+            # Keep serving the stale value; the next stale hit retries
+            print(f"Error refreshing {self.name} entry {key}: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    async def _arefresh(self, key, loader, is_empty):
+        try:
+            self.set(key, await loader(), is_empty)
+        except Exception as e:
+            print(f"Error refreshing {self.name} entry {key}: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'maxEntries': self.max_entries,
+                'hits': self.hits,
+                'staleHits': self.stale_hits,
+                'misses': self.misses,
+                'coalesced': self._flight.followers + self._aflight.followers
+            }
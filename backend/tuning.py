@@ -0,0 +1,74 @@
+"""Deployment settings measured by benchmarks/tune.py, read by both services at startup
+
+tune.py writes TUNING_CONFIG (default backend/tuning.json) with one section
+per service:
+
+    {"plant": {"workers": 2, "torchThreads": 2, "batchMaxSize": 8, "cpuAffinity": [[0, 1], [2, 3]]},
+     "area": {"workers": 1, "torchThreads": 2, "batchMaxSize": 16, "cpuAffinity": [[4, 5]]}, ...}
+
+Environment variables still win (GUNICORN_WORKERS, TORCH_THREADS_PER_WORKER,
+BATCH_MAX_SIZE, UNET_BATCH_MAX_SIZE); the tuned values replace the built-in
+defaults. Without the file nothing changes. Set TUNING_CONFIG to an empty
+string to ignore it.
+"""
+import json
+import os
+
+TUNING_CONFIG = os.environ.get('TUNING_CONFIG', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tuning.json'))
+
+_config = None
+
+
+def load(path=TUNING_CONFIG):
+    """The tuning document, or {} when there is none (read once per process)"""
+    global _config
+    if _config is None:
+        _config = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    _config = json.load(f)
+                print(f"Using tuned settings from {path}")
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable tuning config {path}: {e}")
+    return _config
+
+
+def setting(service, key, default=None):
+    """A tuned value for service ('plant' or 'area'), or default"""
+    value = load().get(service, {}).get(key)
+    return default if value is None else value
+
+
+def worker_settings(service, worker_index=0, default_threads=None):
+    """(torch_threads, cpus) for one worker: TORCH_THREADS_PER_WORKER, else the tuned value, else default_threads"""
+    if os.environ.get('TORCH_THREADS_PER_WORKER'):
+        torch_threads = int(os.environ['TORCH_THREADS_PER_WORKER'])
+    else:
+        torch_threads = setting(service, 'torchThreads', default_threads)
+    affinity = setting(service, 'cpuAffinity') or []
+    cpus = affinity[worker_index % len(affinity)] if affinity else None
+    return torch_threads, cpus
+
+
+def apply_threads(torch_threads=None, cpus=None):
+    """Cap torch intra-op threads (inter-op at 1) and pin the process to cpus; None leaves a setting alone"""
+    if cpus and hasattr(os, 'sched_setaffinity'):
+        # Only CPUs this process may use; a config from a bigger node must not fail here
+        usable = set(cpus) & os.sched_getaffinity(0)
+        if usable:
+            os.sched_setaffinity(0, usable)
+    if torch_threads:
+        import torch
+        torch.set_num_threads(int(torch_threads))
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass  # inter-op pool already started in this process
+
+
+def apply(service, worker_index=0, default_threads=None):
+    """worker_settings() applied to the current process; returns (torch_threads, cpus)"""
+    torch_threads, cpus = worker_settings(service, worker_index, default_threads)
+    apply_threads(torch_threads, cpus)
+    return torch_threads, cpus
@@ -0,0 +1,432 @@
+"""Nearest-neighbour index over EfficientNet feature vectors ("similar cases")
+
+    python vector_index.py stats                     # what is in VECTOR_INDEX_DIR
+    python vector_index.py train                     # build the IVF-PQ structures from stored vectors
+    python vector_index.py train --nlist 1024 --subvectors 32
+
+Vectors are L2-normalised and stored as float16 rows in an append-only,
+memory-mapped file; scores are cosine similarities. Two search modes:
+
+- flat: exact brute force. Small sets are kept as a float32 matrix in memory
+  (one BLAS matrix-vector product per query); larger sets are scanned from
+  the memory map in chunks.
+- ivfpq: k-means coarse lists plus product-quantised residuals (IVF-ADC).
+  A query scans only the nprobe closest lists with a per-query lookup table,
+  then re-ranks the best candidates exactly against the stored vectors.
+
+Training is explicit (this script); vectors added afterwards are encoded on
+insert. Retrain once the collection has grown a lot.
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import threading
+from contextlib import contextmanager
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines: in-process locking only
+    fcntl = None
+
+META_VERSION = 1
+FLAT_CHUNK_ROWS = 32768
+ENCODE_CHUNK_ROWS = 16384
+PQ_CENTROIDS = 256
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def nearest_centroids(data, centroids):
+    """Index of the closest (L2) centroid for each row, in chunks to bound memory"""
+    half_norms = 0.5 * np.einsum('ij,ij->i', centroids, centroids)
+    labels = np.empty(len(data), dtype=np.int32)
+    for start in range(0, len(data), ENCODE_CHUNK_ROWS):
+        chunk = data[start:start + ENCODE_CHUNK_ROWS]
+        labels[start:start + len(chunk)] = np.argmax(chunk @ centroids.T - half_norms, axis=1)
+    return labels
+
+
+def kmeans(data, k, iterations=10, seed=0):
+    """Lloyd's k-means; empty clusters are re-seeded from random rows"""
+    rng = np.random.default_rng(seed)
+    k = min(k, len(data))
+    centroids = data[rng.choice(len(data), k, replace=False)].copy()
+    for _ in range(iterations):
+        labels = nearest_centroids(data, centroids)
+        counts = np.bincount(labels, minlength=k)
+        order = np.argsort(labels, kind='stable')
+        filled = counts > 0
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[filled]
+        centroids[filled] = np.add.reduceat(data[order], starts, axis=0) / counts[filled, None]
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = data[rng.choice(len(data), len(empty), replace=False)]
+    return centroids
+
+
+class VectorIndex:
+    """Append-only store of labelled feature vectors with exact (flat) and IVF-PQ top-k search"""
+
+    def __init__(self, directory, dim=1280, nprobe=16, rerank=200, ivf_min_vectors=20000,
+                 flat_cache_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.dim = dim
+        self.nprobe = nprobe
+        self.rerank = rerank
+        self.ivf_min_vectors = ivf_min_vectors
+        self.flat_cache_bytes = flat_cache_bytes
+        self._lock = threading.RLock()
+        self._count = 0
+        self._label_offsets = np.zeros(1, dtype=np.int64)
+        self._keys = np.zeros(0, dtype=np.uint64)
+        self._flat = None
+        self._ivf = None
+        os.makedirs(directory, exist_ok=True)
+        self._sync()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _read_meta(self):
+        try:
+            with open(self._path('meta.json')) as f:
+                meta = json.load(f)
+            if meta.get('version') == META_VERSION and meta.get('dim') == self.dim:
+                return meta
+            print(f"Ignoring vector index in {self.directory}: built for another version or dimension")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Error reading vector index metadata: {e}")
+        return {'version': META_VERSION, 'dim': self.dim, 'count': 0, 'labelsBytes': 0, 'ivf': None}
+
+    def _write_meta(self, meta):
+        # Write to a temp file and rename; meta.json is the commit point for appends
+        tmp_path = f"{self._path('meta.json')}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._path('meta.json'))
+
+    @contextmanager
+    def _write_lock(self):
+        """Exclusive lock across threads and worker processes (flock)"""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self._path('lock'), 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                yield
+
+    def _vectors(self, count):
+        return np.memmap(self._path('vectors.f16'), dtype=np.float16, mode='r', shape=(count, self.dim))
+
+    def _sync(self):
+        """Pick up rows appended by this or another process (and a retrained IVF) since the last call"""
+        with self._lock:
+            meta = self._read_meta()
+            count = meta['count']
+            ivf_meta = meta.get('ivf')
+            if self._ivf is not None and self._ivf['meta'] != ivf_meta:
+                self._ivf = None
+            if count == self._count and (self._ivf is not None or not ivf_meta):
+                return meta
+            if count < self._count:
+                # The index was rebuilt underneath us; start over
+                self._count = 0
+                self._label_offsets = np.zeros(1, dtype=np.int64)
+                self._keys = np.zeros(0, dtype=np.uint64)
+                self._flat = None
+                self._ivf = None
+            start = self._count
+            if count > start:
+                self._load_labels(start, meta['labelsBytes'])
+                self._keys = np.concatenate([self._keys, np.fromfile(
+                    self._path('keys.u64'), dtype=np.uint64, count=count - start, offset=start * 8)])
+                if count * self.dim * 4 <= self.flat_cache_bytes:
+                    rows = np.asarray(self._vectors(count)[start if self._flat is not None else 0:], dtype=np.float32)
+                    self._flat = rows if self._flat is None else np.concatenate([self._flat, rows])
+                else:
+                    self._flat = None
+            if ivf_meta:
+                self._load_ivf(ivf_meta, start if self._ivf is not None else 0, count)
+            self._count = count
+            return meta
+
+    def _load_labels(self, start, labels_bytes):
+        with open(self._path('labels.jsonl'), 'rb') as f:
+            f.seek(int(self._label_offsets[start]))
+            tail = f.read(labels_bytes - int(self._label_offsets[start]))
+        ends = np.flatnonzero(np.frombuffer(tail, dtype=np.uint8) == ord('\n')) + 1 + self._label_offsets[start]
+        self._label_offsets = np.concatenate([self._label_offsets[:start + 1], ends.astype(np.int64)])
+
+    def _load_ivf(self, ivf_meta, start, count):
+        """Load centroids, codebooks and codes; inverted lists are rebuilt when many rows arrived since"""
+        if self._ivf is None:
+            ivf = {
+                'meta': ivf_meta,
+                'centroids': np.load(self._path('ivf_centroids.npy')),
+                'codebooks': np.load(self._path('pq_codebooks.npy')),
+                'assign': np.zeros(0, dtype=np.int32),
+                'codes': np.zeros((0, ivf_meta['subvectors']), dtype=np.uint8),
+                'listed': 0
+            }
+        else:
+            ivf = dict(self._ivf)
+        subvectors = ivf_meta['subvectors']
+        ivf['assign'] = np.concatenate([ivf['assign'], np.fromfile(
+            self._path('ivf_assign.i32'), dtype=np.int32, count=count - start, offset=start * 4)])
+        ivf['codes'] = np.concatenate([ivf['codes'], np.fromfile(
+            self._path('pq_codes.u8'), dtype=np.uint8, count=(count - start) * subvectors,
+            offset=start * subvectors).reshape(-1, subvectors)])
+        if 'order' not in ivf or count - ivf['listed'] > max(1000, ivf['listed'] // 20):
+            order = np.argsort(ivf['assign'], kind='stable').astype(np.int64)
+            ivf['order'] = order
+            ivf['offsets'] = np.searchsorted(ivf['assign'][order], np.arange(len(ivf['centroids']) + 1))
+            ivf['listed'] = count
+        # Searches hold on to the previous dict, so swap in a complete one
+        self._ivf = ivf
+
+    def _encode(self, vectors, centroids, codebooks):
+        """(coarse list, PQ codes of the residual) for normalised float32 rows"""
+        assign = nearest_centroids(vectors, centroids)
+        residuals = vectors - centroids[assign]
+        subvectors, _, sub_dim = codebooks.shape
+        codes = np.empty((len(vectors), subvectors), dtype=np.uint8)
+        for j in range(subvectors):
+            codes[:, j] = nearest_centroids(np.ascontiguousarray(residuals[:, j * sub_dim:(j + 1) * sub_dim]), codebooks[j])
+        return assign, codes
+
+    @staticmethod
+    def vector_key(vector):
+        """Non-zero uint64 dedupe key from a vector's bytes, so re-submitted photos are stored once"""
+        digest = hashlib.sha256(np.asarray(vector, dtype=np.float32).tobytes()).digest()
+        return np.uint64(int.from_bytes(digest[:8], 'little') | 1)
+
+    def contains(self, key):
+        self._sync()
+        return bool((self._keys == key).any())
+
+    def add(self, vectors, labels, keys=None):
+        """Append vectors with their label dicts; rows whose key is already stored are skipped. Returns the ids."""
+        vectors = normalize(vectors)
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected {self.dim}-d vectors, got {vectors.shape[1]}")
+        if len(labels) != len(vectors):
+            raise ValueError('One label per vector is required')
+        keys = np.zeros(len(vectors), dtype=np.uint64) if keys is None else np.asarray(keys, dtype=np.uint64)
+        with self._write_lock():
+            meta = self._sync()
+            keep = [i for i, key in enumerate(keys) if key == 0 or not (self._keys == key).any()]
+            if not keep:
+                return []
+            vectors, keys = vectors[keep], keys[keep]
+            count = meta['count']
+            # Truncate whatever a crashed append left past the committed count
+            self._truncate(meta)
+            encoded = None
+            if meta.get('ivf'):
+                encoded = self._encode(vectors, self._ivf['centroids'], self._ivf['codebooks'])
+            with open(self._path('vectors.f16'), 'ab') as f:
+                f.write(vectors.astype(np.float16).tobytes())
+            with open(self._path('keys.u64'), 'ab') as f:
+                f.write(keys.tobytes())
+            if encoded is not None:
+                with open(self._path('ivf_assign.i32'), 'ab') as f:
+                    f.write(encoded[0].tobytes())
+                with open(self._path('pq_codes.u8'), 'ab') as f:
+                    f.write(encoded[1].tobytes())
+            lines = b''.join(json.dumps(labels[i], separators=(',', ':')).encode('utf-8') + b'\n' for i in keep)
+            with open(self._path('labels.jsonl'), 'ab') as f:
+                f.write(lines)
+            meta['count'] = count + len(keep)
+            meta['labelsBytes'] += len(lines)
+            self._write_meta(meta)
+            self._sync()
+            return list(range(count, count + len(keep)))
+
+    def _truncate(self, meta):
+        count = meta['count']
+        files = [('vectors.f16', self.dim * 2), ('keys.u64', 8)]
+        if meta.get('ivf'):
+            files += [('ivf_assign.i32', 4), ('pq_codes.u8', meta['ivf']['subvectors'])]
+        sizes = [(self._path(name), count * row_bytes) for name, row_bytes in files]
+        sizes.append((self._path('labels.jsonl'), meta['labelsBytes']))
+        for path, size in sizes:
+            if os.path.exists(path) and os.path.getsize(path) != size:
+                print(f"Repairing {path}: truncating to {size} bytes")
+                os.truncate(path, size)
+
+    def train(self, nlist=None, subvectors=32, sample_size=None, iterations=10, seed=0):
+        """Build the coarse centroids and PQ codebooks from stored vectors, then encode every row"""
+        if self.dim % subvectors:
+            raise ValueError(f"{subvectors} subvectors do not divide dimension {self.dim}")
+        with self._write_lock():
+            meta = self._sync()
+            count = meta['count']
+            if count < PQ_CENTROIDS:
+                raise ValueError(f"Need at least {PQ_CENTROIDS} vectors to train, have {count}")
+            nlist = nlist or int(min(4096, max(8, math.sqrt(count))))
+            sample_size = min(count, sample_size or max(30 * nlist, 20000), 100000)
+            rng = np.random.default_rng(seed)
+            sample_ids = np.sort(rng.choice(count, sample_size, replace=False))
+            sample = np.asarray(self._vectors(count)[sample_ids], dtype=np.float32)
+
+            centroids = kmeans(sample, nlist, iterations, seed)
+            residuals = sample - centroids[nearest_centroids(sample, centroids)]
+            sub_dim = self.dim // subvectors
+            codebooks = np.stack([
+                kmeans(np.ascontiguousarray(residuals[:, j * sub_dim:(j + 1) * sub_dim]), PQ_CENTROIDS, iterations, seed + j)
+                for j in range(subvectors)
+            ])
+
+            # Encode everything into fresh files, then switch meta over in one rename
+            vectors = self._vectors(count)
+            with open(self._path('ivf_assign.i32'), 'wb') as assign_file, open(self._path('pq_codes.u8'), 'wb') as codes_file:
+                for start in range(0, count, ENCODE_CHUNK_ROWS):
+                    assign, codes = self._encode(np.asarray(vectors[start:start + ENCODE_CHUNK_ROWS], dtype=np.float32),
+                                                 centroids, codebooks)
+                    assign_file.write(assign.tobytes())
+                    codes_file.write(codes.tobytes())
+            np.save(self._path('ivf_centroids.npy'), centroids.astype(np.float32))
+            np.save(self._path('pq_codebooks.npy'), codebooks.astype(np.float32))
+            meta['ivf'] = {'nlist': len(centroids), 'subvectors': subvectors, 'trainedOn': count, 'seed': seed}
+            self._write_meta(meta)
+            self._ivf = None
+            self._sync()
+            return meta['ivf']
+
+    def effective_mode(self, mode='auto'):
+        """'auto' is ivfpq once the index is trained and holds at least ivf_min_vectors, else flat"""
+        if mode != 'auto':
+            return mode
+        with self._lock:
+            return 'ivfpq' if self._ivf is not None and self._count >= self.ivf_min_vectors else 'flat'
+
+    def search(self, query, k=10, mode='auto', nprobe=None, rerank=None):
+        """Top-k (id, cosine similarity) for one query vector, best first"""
+        self._sync()
+        query = normalize(query)[0]
+        with self._lock:
+            count, flat, ivf = self._count, self._flat, self._ivf
+        if count == 0:
+            return []
+        k = min(k, count)
+        mode = self.effective_mode(mode)
+        if mode == 'ivfpq':
+            if ivf is None:
+                raise ValueError('The index has not been trained for ivfpq search')
+            return self._search_ivfpq(query, k, count, ivf, nprobe or self.nprobe, rerank)
+        return self._search_flat(query, k, count, flat)
+
+    def _search_flat(self, query, k, count, flat):
+        if flat is not None:
+            return self._top_k(np.arange(count), flat[:count] @ query, k)
+        best_ids = np.zeros(0, dtype=np.int64)
+        best_scores = np.zeros(0, dtype=np.float32)
+        vectors = self._vectors(count)
+        for start in range(0, count, FLAT_CHUNK_ROWS):
+            scores = np.asarray(vectors[start:start + FLAT_CHUNK_ROWS], dtype=np.float32) @ query
+            ids = np.arange(start, start + len(scores))
+            if len(scores) > k:
+                keep = np.argpartition(-scores, k)[:k]
+                ids, scores = ids[keep], scores[keep]
+            best_ids = np.concatenate([best_ids, ids])
+            best_scores = np.concatenate([best_scores, scores])
+        return self._top_k(best_ids, best_scores, k)
+
+    def _search_ivfpq(self, query, k, count, ivf, nprobe, rerank):
+        centroids, codebooks = ivf['centroids'], ivf['codebooks']
+        half_norms = 0.5 * np.einsum('ij,ij->i', centroids, centroids)
+        coarse = centroids @ query
+        probes = np.argpartition(-(coarse - half_norms), min(nprobe, len(centroids)) - 1)[:nprobe]
+
+        # Rows listed at the last rebuild, plus a linear pass over rows appended since
+        candidates = [ivf['order'][ivf['offsets'][probe]:ivf['offsets'][probe + 1]] for probe in probes]
+        if ivf['listed'] < count:
+            recent = np.arange(ivf['listed'], count)
+            candidates.append(recent[np.isin(ivf['assign'][ivf['listed']:count], probes)])
+        ids = np.concatenate(candidates)
+        if len(ids) == 0:
+            return []
+
+        # Asymmetric distance: query . centroid + sum over subspaces of query_j . codeword_j
+        subvectors, _, sub_dim = codebooks.shape
+        table = np.einsum('jkd,jd->jk', codebooks, query.reshape(subvectors, sub_dim))
+        scores = coarse[ivf['assign'][ids]] + table[np.arange(subvectors), ivf['codes'][ids]].sum(axis=1)
+
+        # Exact re-rank of the best approximate candidates against the stored vectors
+        rerank = max(k, rerank if rerank is not None else self.rerank)
+        if len(ids) > rerank:
+            keep = np.argpartition(-scores, rerank)[:rerank]
+            ids = ids[keep]
+        ids = np.sort(ids)
+        exact = np.asarray(self._vectors(count)[ids], dtype=np.float32) @ query
+        return self._top_k(ids, exact, k)
+
+    @staticmethod
+    def _top_k(ids, scores, k):
+        if len(scores) > k:
+            keep = np.argpartition(-scores, k)[:k]
+            ids, scores = ids[keep], scores[keep]
+        order = np.argsort(-scores)
+        return [(int(ids[i]), float(scores[i])) for i in order]
+
+    def labels(self, ids):
+        """Label dicts for ids, read from the labels file by offset"""
+        with self._lock:
+            offsets = self._label_offsets
+        labels = []
+        with open(self._path('labels.jsonl'), 'rb') as f:
+            for i in ids:
+                f.seek(int(offsets[i]))
+                labels.append(json.loads(f.read(int(offsets[i + 1] - offsets[i]))))
+        return labels
+
+    def stats(self):
+        meta = self._sync()
+        with self._lock:
+            return {
+                'count': self._count,
+                'dim': self.dim,
+                'flatInMemory': self._flat is not None,
+                'ivf': meta.get('ivf'),
+                'nprobe': self.nprobe,
+                'rerank': self.rerank,
+                'ivfMinVectors': self.ivf_min_vectors,
+                'diskBytes': sum(os.path.getsize(os.path.join(self.directory, name)) for name in os.listdir(self.directory))
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['train', 'stats'])
+    parser.add_argument('--dir', default=os.environ.get('VECTOR_INDEX_DIR') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'vector_index'))
+    parser.add_argument('--nlist', type=int, help='Coarse lists (default: sqrt of the vector count)')
+    parser.add_argument('--subvectors', type=int, default=32, help='PQ subspaces; must divide 1280')
+    parser.add_argument('--sample-size', type=int, help='Vectors used to train (default: max(30 * nlist, 20000))')
+    parser.add_argument('--iterations', type=int, default=10)
+    args = parser.parse_args()
+
+    index = VectorIndex(args.dir)
+    if args.command == 'train':
+        import time
+        started = time.perf_counter()
+        ivf = index.train(args.nlist, args.subvectors, args.sample_size, args.iterations)
+        print(f"Trained {ivf['nlist']} lists x {ivf['subvectors']} subvectors on {ivf['trainedOn']} vectors "
+              f"in {time.perf_counter() - started:.1f}s")
+    print(json.dumps(index.stats(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+import os
+import tempfile
+import cv2
+import numpy as np
+from image_io import UploadTooLarge, upload_limit_message
+
+# Chunk size when spooling an upload to disk for cv2.VideoCapture
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+
+def save_video_upload(req, field='video', max_bytes=None, directory=None):
+    """Spool a multipart video part or a raw video/* body to a temp file; returns (path, form fields) or (None, fields)"""
+    if req.mimetype == 'multipart/form-data':
+        fields = req.form.to_dict()
+        upload = req.files.get(field)
+        if upload is None:
+            return None, fields
+        source = upload.stream
+    elif (req.mimetype or '').startswith('video/') or req.mimetype == 'application/octet-stream':
+        fields = req.args.to_dict()
+        source = req.stream
+    else:
+        return None, req.args.to_dict()
+
+    handle, path = tempfile.mkstemp(prefix='groweasy-video-', dir=directory)
+    written = 0
+    try:
+        with os.fdopen(handle, 'wb') as f:
+            while True:
+                chunk = source.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if max_bytes and written > max_bytes:
+                    raise UploadTooLarge(upload_limit_message(max_bytes, 'Video'))
+                f.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    if written == 0:
+        os.remove(path)
+        return None, fields
+    return path, fields
+
+
+def sample_frames(capture, interval_seconds, max_frames, size, stats):
+    """Yield (frame index, timestamp seconds, RGB uint8 array of size) every interval_seconds of video
+
+    Frames between samples are only grabbed, never converted, and each sampled
+    frame is shrunk to size straight away so a 4K clip holds one full frame at
+    a time. stats gets 'fps', 'framesRead' and 'framesSampled'.
+    """
+    fps = capture.get(cv2.CAP_PROP_FPS)
+    if not fps or fps != fps or fps > 1000:
+        fps = 30.0  # containers without a usable frame rate
+    step = max(1, int(round(fps * interval_seconds)))
+    stats['fps'] = round(fps, 3)
+    index = 0
+    sampled = 0
+    while sampled < max_frames:
+        if not capture.grab():
+            break
+        if index % step == 0:
+            ok, frame = capture.retrieve()
+            if ok:
+                small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+                del frame
+                sampled += 1
+                stats['framesSampled'] = sampled
+                yield index, index / fps, cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+        index += 1
+        stats['framesRead'] = index
+
+
+def dhash(rgb):
+    """64-bit difference hash: sign of horizontal gradients on a 9x8 grayscale thumbnail"""
+    gray = cv2.resize(cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY), (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (gray[:, 1:] > gray[:, :-1]).flatten()
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+def color_histogram(rgb):
+    """Normalised 8x8 hue/saturation histogram"""
+    hsv = cv2.cvtColor(rgb, cv2.COLOR_RGB2HSV)
+    histogram = cv2.calcHist([hsv], [0, 1], None, [8, 8], [0, 180, 0, 256])
+    return cv2.normalize(histogram, histogram).flatten()
+
+
+class DuplicateFilter:
+    """Skip frames that match the last kept frame in both structure (dHash) and colour (histogram)
+
+    Both must match: a fixed camera's frames keep the same structure for
+    days while leaves yellow or brown, and that colour change is exactly what
+    the health analysis needs to see.
+    """
+
+    def __init__(self, hash_distance=6, histogram_distance=0.1):
+        self.hash_distance = hash_distance
+        self.histogram_distance = histogram_distance
+        self._last = None
+
+    def is_duplicate(self, rgb):
+        frame_hash, histogram = dhash(rgb), color_histogram(rgb)
+        if self._last is not None:
+            last_hash, last_histogram = self._last
+            if (bin(frame_hash ^ last_hash).count('1') <= self.hash_distance
+                    and cv2.compareHist(histogram, last_histogram, cv2.HISTCMP_BHATTACHARYYA) <= self.histogram_distance):
+                return True
+        self._last = (frame_hash, histogram)
+        return False
+
+
+def open_video(path):
+    """cv2.VideoCapture for path, or None when OpenCV cannot decode it"""
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        capture.release()
+        return None
+    return capture
+
+
+def remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
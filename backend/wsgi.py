@@ -0,0 +1,66 @@
+"""Production entry point for gunicorn
+
+    gunicorn -c gunicorn.conf.py "wsgi:create_app()"                                    # plant service
+    GROWEASY_SERVICE=area GUNICORN_BIND=0.0.0.0:5001 gunicorn -c gunicorn.conf.py "wsgi:create_app()"
+    GROWEASY_SERVICE=combined gunicorn -c gunicorn.conf.py "wsgi:create_app()"         # both, see combined.py
+
+With preload_app (see gunicorn.conf.py) create_app runs once in the master:
+model weights are loaded there and inherited copy-on-write by every forked
+worker. Warm-up passes, torch thread settings and CPU affinity (from
+tuning.json when benchmarks/tune.py has run) are applied per worker in
+init_worker, called from the post_fork hook.
+"""
+import gc
+import os
+import tuning
+
+# Set GUNICORN_PRELOAD=0 to load a separate model copy in every worker (for comparison)
+PRELOAD = os.environ.get('GUNICORN_PRELOAD', '1') != '0'
+
+service_module = None
+
+
+def create_app(service=None):
+    """Import the requested service, load its model weights and return the Flask app"""
+    global service_module
+    service = service or os.environ.get('GROWEASY_SERVICE', 'plant')
+    if service == 'area':
+        import area_analyzer as module
+    elif service == 'plant':
+        import app as module
+    elif service == 'combined':
+        # Models load lazily per worker through the registry; nothing to preload
+        import combined
+        return combined.app
+    else:
+        raise ValueError(f"Unknown service '{service}' (expected 'plant', 'area' or 'combined')")
+    service_module = module
+
+    if not PRELOAD:
+        module.model_loader.run()
+    elif preload_in_master(module):
+        # Keep the collector from touching the weights' pages before they are frozen
+        gc.disable()
+        module.model_loader.run(warm_up=False)
+        # Move everything allocated so far out of the collector's reach so workers never dirty it
+        gc.freeze()
+        gc.enable()
+    return module.app
+
+
+def preload_in_master(module):
+    """ONNX Runtime sessions own thread pools that do not survive fork, so those load per worker"""
+    return not getattr(module, 'INFERENCE_BACKEND', 'eager').startswith('onnx')
+
+
+def init_worker(torch_threads, cpus=None):
+    """Per-worker setup after fork: cap torch threads and pin CPUs, then load (if needed) and warm up"""
+    tuning.apply_threads(torch_threads, cpus)
+
+    if service_module is None:
+        return
+    loader = service_module.model_loader
+    if loader.state == 'loaded':
+        loader.warm()
+    elif loader.state == 'not_loaded':
+        loader.run()
@@ -14,6 +14,7 @@ interface Plant {
   lastWatered: string;
   health: 'excellent' | 'good' | 'fair' | 'poor';
   image?: string;
+  historyId?: string;
 }
 
 interface PlantDetailViewProps {
@@ -35,6 +36,7 @@ const PlantDetailView: React.FC<PlantDetailViewProps> = ({ plant, onClose, onUpd
   const [uploadingPhoto, setUploadingPhoto] = useState(false);
   const [aiAnalysis, setAiAnalysis] = useState<AIAnalysisResult | null>(null);
   const [analysisDate, setAnalysisDate] = useState<string | null>(null);
+  const [historyId, setHistoryId] = useState<string | undefined>(plant.historyId);
   const [backendStatus, setBackendStatus] = useState<'checking' | 'available' | 'unavailable'>('checking');
 
   // Generate progress stages based on plant type and AI analysis
@@ -102,13 +104,20 @@ const PlantDetailView: React.FC<PlantDetailViewProps> = ({ plant, onClose, onUpd
     setAiAnalysis(null);
     
     try {
+      // The backend issues history ids; ask for one the first time this plant is analysed
+      let plantHistoryId = historyId;
+      if (!plantHistoryId) {
+        plantHistoryId = await aiService.createPlantHistory().catch(() => undefined);
+        setHistoryId(plantHistoryId);
+      }
+
       // Use real AI service
-      const result = await aiService.analyzePlantFromFile(file, plant.type, plant.plantedDate);
+      const result = await aiService.analyzePlantFromFile(file, plant.type, plant.plantedDate, plantHistoryId);
       setAiAnalysis(result);
       setAnalysisDate(new Date().toLocaleString());
       
-      // Update plant health based on AI analysis
-      onUpdatePlant(plant.id, { health: result.overallHealth });
+      // Update plant health based on AI analysis, and keep the history id with the plant
+      onUpdatePlant(plant.id, { health: result.overallHealth, historyId: plantHistoryId });
       
     } catch (error) {
       console.error('AI analysis failed:', error);
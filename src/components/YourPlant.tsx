@@ -12,6 +12,7 @@ interface Plant {
   lastWatered: string;
   health: 'excellent' | 'good' | 'fair' | 'poor';
   plantingArea?: string;
+  historyId?: string;
 }
 
 interface Zone {
@@ -29,12 +29,46 @@ export interface AIAnalysisResult {
   analysisDate: string;
   modelUsed: string;
   confidence: number;
+  historyCount?: number;
+}
+
+export interface PlantHistoryEntry {
+  timestamp: number;
+  daysSincePlanting: number;
+  confidence: number;
+  stageIndex: number;
+  totalStages: number;
+  overallHealth: 'excellent' | 'good' | 'fair' | 'poor';
+  anomalyCount: number;
+}
+
+export interface PlantTrends {
+  plantId: string;
+  count: number;
+  plantType: string | null;
+  firstAnalysis: number;
+  lastAnalysis: number;
+  spanDays: number;
+  confidence: { mean: number; std: number; min: number; max: number; ema: number; slopePerDay: number };
+  stage: {
+    current?: string;
+    currentIndex: number;
+    maxIndex: number;
+    totalStages: number;
+    changes: number;
+    lastChange: number | null;
+    stagesPerWeek: number | null;
+  };
+  overallHealth: Record<'excellent' | 'good' | 'fair' | 'poor', number>;
+  anomalies: { total: number; photosWithAnomalies: number };
+  featureDrift: { last: number | null; mean: number; std: number };
 }
 
 export interface AnalysisRequest {
   image: string; // base64 encoded image
   plantType: string;
   plantedDate: string;
+  plantId?: string;
 }
 
 class AIService {
@@ -109,23 +143,79 @@ class AIService {
   async analyzePlantFromFile(
     file: File, 
     plantType: string, 
-    plantedDate: string
+    plantedDate: string,
+    plantId?: string
   ): Promise<AIAnalysisResult> {
     try {
-      // Convert file to base64
-      const base64Image = await this.fileToBase64(file);
-      
-      // Send to AI backend
-      return await this.analyzePlant({
-        image: base64Image,
-        plantType,
-        plantedDate,
+      // Send the file as multipart form data - avoids base64 inflating the upload
+      const formData = new FormData();
+      formData.append('image', file);
+      formData.append('plantType', plantType);
+      formData.append('plantedDate', plantedDate);
+      if (plantId) {
+        // Lets the backend keep this analysis in the plant's history
+        formData.append('plantId', plantId);
+      }
+
+      const response = await fetch(`${this.baseUrl}/analyze`, {
+        method: 'POST',
+        body: formData,
       });
+
+      if (!response.ok) {
+        const errorData = await response.json().catch(() => ({}));
+        throw new Error(errorData.error || `Analysis failed: ${response.status}`);
+      }
+
+      return await response.json();
     } catch (error) {
       console.error('Error analyzing plant from file:', error);
       throw error;
     }
   }
+
+  /**
+   * New history id for a plant; the backend only keeps history for ids it issued
+   */
+  async createPlantHistory(): Promise<string> {
+    const response = await fetch(`${this.baseUrl}/plants`, { method: 'POST' });
+    if (!response.ok) {
+      throw new Error(`Creating plant history failed: ${response.status}`);
+    }
+    const data = await response.json();
+    return data.plantId;
+  }
+
+  /**
+   * Newest-first analysis timeline kept by the backend for a plant
+   */
+  async getPlantHistory(
+    plantId: string,
+    limit: number = 50,
+    offset: number = 0
+  ): Promise<{ plantId: string; total: number; offset: number; entries: PlantHistoryEntry[] }> {
+    const response = await fetch(
+      `${this.baseUrl}/plants/${encodeURIComponent(plantId)}/history?limit=${limit}&offset=${offset}`
+    );
+    if (!response.ok) {
+      throw new Error(`History request failed: ${response.status}`);
+    }
+    return await response.json();
+  }
+
+  /**
+   * Growth and health trends over all of a plant's analyses, or null if it has none
+   */
+  async getPlantTrends(plantId: string): Promise<PlantTrends | null> {
+    const response = await fetch(`${this.baseUrl}/plants/${encodeURIComponent(plantId)}/trends`);
+    if (response.status === 404) {
+      return null;
+    }
+    if (!response.ok) {
+      throw new Error(`Trends request failed: ${response.status}`);
+    }
+    return await response.json();
+  }
 }
 
 // Export singleton instance
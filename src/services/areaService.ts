@@ -1,4 +1,5 @@
-const AREA_API_BASE_URL = 'http://localhost:5001';
+// In combined mode (backend/combined.py) set REACT_APP_AREA_API_URL=http://localhost:5000
+const AREA_API_BASE_URL = process.env.REACT_APP_AREA_API_URL || 'http://localhost:5001';
 
 export interface AreaAnalysisResult {
   totalArea: number;
@@ -45,14 +46,13 @@ class AreaService {
 
   async analyzeAreaFromFile(file: File): Promise<AreaAnalysisResult> {
     try {
-      const base64Image = await this.fileToBase64(file);
+      // Send the file as multipart form data - avoids base64 inflating the upload
+      const formData = new FormData();
+      formData.append('image', file);
       
       const response = await fetch(`${this.baseUrl}/analyze-area`, {
         method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({ image: base64Image }),
+        body: formData,
       });
 
       if (!response.ok) {
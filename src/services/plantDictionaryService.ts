@@ -20,6 +20,7 @@ export interface PlantSearchResponse {
   query: string;
   results: PlantInfo[];
   total: number;
+  source?: 'local' | 'perenual';
 }
 
 class PlantDictionaryService {